@@ -1,30 +1,269 @@
 """
 Flask API server for the visa consultant AI agent.
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
-from supabase_client import SupabaseDB
-from prompt_manager import PromptManager
-from gemini_client import GeminiClient
+from werkzeug.middleware.proxy_fix import ProxyFix
+from prompt_manager import PromptManager, prompt_version
+from gemini_client import GeminiClient, PromptTooLarge
+from scheduler import INTERACTIVE, MANUAL, BULK
 from conversation_parser import ConversationParser
-from typing import List, Dict
+from rate_limiter import RateLimitExceeded
+from circuit_breaker import GeminiUnavailable
+from idempotency import IdempotencyStore, IdempotencyConflict
+from http_compression import enable_compression
+from export import PageFetcher, ndjson_export, parse_cursor
+from similarity import SimilarityScorer
+from usage import usage_context, push_labels, pop_labels, track_call_latencies
+from components import (
+    create_prompt_manager, create_example_index, create_semantic_cache, create_shadow_evaluator,
+    create_training_pipeline, create_dedup_index, create_tenant_admission, create_db,
+    create_speculative_replies
+)
+from config import (
+    TRAINING_SHARD_CONCURRENCY, DEGRADED_CACHE_THRESHOLD, DEGRADED_FALLBACK_REPLY,
+    IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL, REQUEST_MAX_DECODED_BYTES,
+    RESPONSE_COMPRESSION_MIN_BYTES, RESPONSE_COMPRESSION_LEVEL, EXPORT_PAGE_SIZE,
+    EXPORT_PREFETCH_PAGES, EXPORT_API_KEY, TENANT_API_KEYS, TRUSTED_PROXY_COUNT
+)
+from typing import Callable, List, Dict, Optional, Tuple
+import hashlib
+import hmac
+import json
+import math
 import traceback
+import uuid
 
 app = Flask(__name__)
 CORS(app)
+if TRUSTED_PROXY_COUNT > 0:
+    # remote_addr = the address our own proxy saw, not a client-supplied X-Forwarded-For entry
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+# gzip/zstd request bodies (decoded with a size limit) and compressed large responses
+enable_compression(
+    app,
+    max_request_size=REQUEST_MAX_DECODED_BYTES,
+    min_response_size=RESPONSE_COMPRESSION_MIN_BYTES,
+    level=RESPONSE_COMPRESSION_LEVEL
+)
 
 # Initialize components
 try:
-    db = SupabaseDB()
-    prompt_manager = PromptManager(db)
+    db = create_db()
     gemini_client = GeminiClient()
+    scorer = SimilarityScorer()
+    prompt_manager = create_prompt_manager(db, gemini_client, scorer)
     parser = ConversationParser()
+    example_index = create_example_index(db)
+    semantic_cache = create_semantic_cache(gemini_client)
+    shadow_evaluator = create_shadow_evaluator(prompt_manager, gemini_client, scorer)
+    training_pipeline = create_training_pipeline(
+        db, prompt_manager, gemini_client, scorer, example_index, semantic_cache, shadow_evaluator
+    )
+    # Skips near-duplicate examples in bulk uploads, including ones trained in earlier runs
+    dedup_index = create_dedup_index()
+    # Per-tenant rate limits and fair queueing in front of the routes
+    tenant_admission = create_tenant_admission()
+    # Results by Idempotency-Key, so webhook retries don't re-run Gemini calls or DB writes
+    idempotency_store = IdempotencyStore(max_entries=IDEMPOTENCY_MAX_ENTRIES, ttl=IDEMPOTENCY_TTL)
+    # Replies generated ahead of time from /inbound-message, below interactive priority
+    speculative_replies = create_speculative_replies(
+        lambda client_sequence, chat_history, scenario: build_reply(
+            client_sequence, chat_history, scenario, priority=MANUAL
+        )
+    )
 except Exception as e:
     print(f"Error initializing components: {e}")
     print("Make sure SUPABASE_URL and SUPABASE_ANON_KEY are set as environment variables")
     raise
 
 
+def rate_limited_response(error: RateLimitExceeded):
+    """Turn a throttling error (Gemini quota or tenant limits) into a 429 with Retry-After."""
+    response = jsonify({"error": str(error)})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+
+def prompt_too_large_response(error: PromptTooLarge):
+    """Reject an over-budget prompt before it is sent to Gemini."""
+    return jsonify({"error": str(error), "tokens": error.tokens, "limit": error.limit}), 413
+
+
+# Always reachable: Render health checks and the service index
+UNMETERED_PATHS = {"/", "/health"}
+
+
+def request_tenant() -> Optional[str]:
+    """
+    Tenant of the current request, from its X-API-Key header.
+
+    With TENANT_API_KEYS configured, unknown keys have no tenant (None). Otherwise
+    every key is its own tenant, and requests without one are grouped by client address.
+    """
+    api_key = request.headers.get("X-API-Key", "").strip()
+    if TENANT_API_KEYS:
+        return TENANT_API_KEYS.get(api_key)
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+    # ProxyFix resolved remote_addr from the hop appended by the trusted proxy
+    return "ip:" + (request.remote_addr or "unknown")
+
+
+@app.before_request
+def label_usage():
+    # Gemini usage during this request is accounted to its endpoint and tenant
+    tenant = request_tenant()
+    g.usage_token = push_labels(endpoint=request.path, tenant=tenant)
+
+    if request.method == "OPTIONS" or request.path in UNMETERED_PATHS:
+        return None
+    if tenant is None:
+        return jsonify({"error": "A valid X-API-Key header is required"}), 401
+    if tenant_admission is not None:
+        try:
+            tenant_admission.acquire(tenant)
+        except RateLimitExceeded as e:
+            return rate_limited_response(e)
+        g.admitted_tenant = tenant
+    return None
+
+
+@app.teardown_request
+def unlabel_usage(error=None):
+    tenant = g.pop("admitted_tenant", None)
+    if tenant is not None:
+        tenant_admission.release(tenant)
+    token = g.pop("usage_token", None)
+    if token is not None:
+        pop_labels(token)
+
+
+def unavailable_response(error: GeminiUnavailable):
+    """Turn an open Gemini circuit into a fast 503 with Retry-After."""
+    response = jsonify({"error": str(error)})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+
+def degraded_reply(version: str, client_sequence: List[str], chat_history: List[Dict]) -> Dict:
+    """
+    Best reply available without Gemini: a looser semantic cache match, else the canned reply.
+    """
+    if semantic_cache is not None and semantic_cache.eligible(chat_history):
+        cached = semantic_cache.lookup(version, client_sequence, threshold=DEGRADED_CACHE_THRESHOLD)
+        if cached:
+            return {"aiReply": cached["reply"], "cached": True, "degradedSource": "semantic_cache"}
+    return {"aiReply": DEGRADED_FALLBACK_REPLY, "cached": False, "degradedSource": "fallback"}
+
+
+def reply_payload(client_sequence: List[str], chat_history: List[Dict],
+                  scenario_hint: Optional[str] = None) -> Dict:
+    """Produce the /generate-reply response body for a conversation."""
+    return build_reply(client_sequence, chat_history, scenario_hint, use_speculation=True)[1]
+
+
+def build_reply(client_sequence: List[str], chat_history: List[Dict],
+                scenario_hint: Optional[str] = None, priority: str = INTERACTIVE,
+                use_speculation: bool = False) -> Tuple[str, Dict]:
+    """
+    Generate a reply for a conversation.
+
+    Args:
+        client_sequence: Client messages to respond to
+        chat_history: Messages before the client sequence
+        scenario_hint: Optional scenario from the request
+        priority: Scheduling class of the Gemini call
+        use_speculation: Return a reply precomputed from /inbound-message when it still matches
+
+    Returns:
+        (prompt version used, /generate-reply response body)
+    """
+    # Get latest prompt from Supabase (base + scenario shard when sharding is on)
+    scenario = training_pipeline.route(client_sequence, chat_history, scenario_hint)
+    system_prompt = prompt_manager.get_system_prompt(scenario)
+    version = prompt_version(system_prompt)
+
+    # Generated in the background when the last client message arrived
+    if use_speculation and speculative_replies is not None:
+        precomputed = speculative_replies.lookup(client_sequence, chat_history, version)
+        if precomputed is not None:
+            return version, dict(precomputed, speculative=True)
+
+    # Short conversations may be answered from a paraphrase of an earlier question
+    use_cache = semantic_cache is not None and semantic_cache.eligible(chat_history)
+    if use_cache:
+        cached = semantic_cache.lookup(version, client_sequence)
+        if cached:
+            return version, {
+                "aiReply": cached["reply"],
+                "cached": True,
+                "degraded": False,
+                "speculative": False,
+                "scenario": scenario
+            }
+
+    # Generate reply using Gemini, with similar past consultant replies as context
+    examples = training_pipeline.similar_examples(client_sequence)
+    try:
+        with usage_context(prompt_version=version), track_call_latencies() as latencies:
+            ai_reply = gemini_client.generate_reply(
+                system_prompt=system_prompt,
+                client_sequence=client_sequence,
+                chat_history=chat_history if chat_history else None,
+                priority=priority,
+                examples=examples
+            )
+    except GeminiUnavailable as e:
+        print(f"Serving degraded reply in /generate-reply: {e}")
+        return version, dict(degraded_reply(version, client_sequence, chat_history),
+                             degraded=True, speculative=False, scenario=scenario)
+
+    if use_cache:
+        semantic_cache.store(version, client_sequence, ai_reply, scope=scenario)
+
+    # Mirror a sample to the candidate prompt in the background (base prompt only)
+    if shadow_evaluator is not None and scenario is None and latencies:
+        shadow_evaluator.submit(version, client_sequence, chat_history, examples,
+                                ai_reply, min(latencies))
+
+    return version, {
+        "aiReply": ai_reply,
+        "cached": False,
+        "degraded": False,
+        "speculative": False,
+        "scenario": scenario
+    }
+
+
+def run_idempotent(scope: str, data: Dict, fn: Callable[[], Dict],
+                   keep: Optional[Callable[[Dict], bool]] = None) -> Tuple[Dict, bool]:
+    """
+    Run `fn` once per Idempotency-Key header value (if the request has one).
+
+    Returns:
+        (payload, replayed) where replayed is True for a retry answered from an earlier run
+    """
+    key = request.headers.get("Idempotency-Key", "").strip()
+    if not key:
+        return fn(), False
+    if len(key) > 255:
+        raise IdempotencyConflict("Idempotency-Key must be at most 255 characters")
+    fingerprint = hashlib.sha256(
+        json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return idempotency_store.run(f"{scope}:{key}", fingerprint, fn, keep)
+
+
+def idempotent_response(payload: Dict, replayed: bool):
+    response = jsonify(payload)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
 @app.route("/", methods=["GET"])
 def root():
     """Root endpoint."""
@@ -33,11 +272,16 @@ def root():
         "status": "running",
         "endpoints": {
             "health": "/health",
+            "metrics": "/metrics",
+            "usage": "/usage",
             "generate-reply": "/generate-reply",
+            "inbound-message": "/inbound-message",
             "improve-ai": "/improve-ai",
             "improve-ai-manually": "/improve-ai-manually",
             "parse-conversations": "/parse-conversations",
-            "load-training-data": "/load-training-data"
+            "load-training-data": "/load-training-data",
+            "export-prompts": "/export/prompts",
+            "export-training-examples": "/export/training-examples"
         }
     })
 
@@ -48,6 +292,29 @@ def health():
     return jsonify({"status": "healthy", "service": "visa-consultant-ai"})
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Runtime counters for the Gemini client and the training pipeline."""
+    return jsonify({
+        "gemini": gemini_client.stats(),
+        "training": training_pipeline.stats(),
+        "prompts": prompt_manager.stats(),
+        "example_index": example_index.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "shadow": shadow_evaluator.stats() if shadow_evaluator else None,
+        "dedup": dedup_index.stats() if dedup_index else None,
+        "tenants": tenant_admission.stats() if tenant_admission else None,
+        "idempotency": idempotency_store.stats(),
+        "speculation": speculative_replies.stats() if speculative_replies else None
+    })
+
+
+@app.route("/usage", methods=["GET"])
+def usage():
+    """Gemini token usage, cost and latency by model, task, endpoint, tenant, prompt version and job."""
+    return jsonify(gemini_client.usage.stats())
+
+
 @app.route("/generate-reply", methods=["POST"])
 def generate_reply():
     """
@@ -64,8 +331,19 @@ def generate_reply():
     
     Response:
     {
-        "aiReply": "<generated reply>"
+        "aiReply": "<generated reply>",
+        "cached": false,
+        "degraded": false,
+        "speculative": false
     }
+    
+    "speculative": true means the reply was generated ahead of time from
+    /inbound-message for exactly this conversation state and prompt version.
+    
+    While Gemini's circuit is open the reply comes from the semantic cache or a
+    canned fallback, with "degraded": true and "degradedSource" set.
+    
+    Retries carrying the same Idempotency-Key header get the first reply back.
     """
     try:
         data = request.get_json()
@@ -83,26 +361,86 @@ def generate_reply():
         if not client_sequence:
             return jsonify({"error": "clientSequence is required"}), 400
         
-        # Get latest prompt from Supabase
-        system_prompt = prompt_manager.get_system_prompt()
-        
-        # Generate reply using Gemini
-        ai_reply = gemini_client.generate_reply(
-            system_prompt=system_prompt,
-            client_sequence=client_sequence,
-            chat_history=chat_history if chat_history else None
+        payload, replayed = run_idempotent(
+            "generate-reply", data,
+            lambda: reply_payload(client_sequence, chat_history, data.get("scenario")),
+            # A degraded answer shouldn't be replayed once Gemini is back
+            keep=lambda result: not result["degraded"]
         )
-        
-        return jsonify({
-            "aiReply": ai_reply
-        })
+        return idempotent_response(payload, replayed)
     
+    except IdempotencyConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except RateLimitExceeded as e:
+        print(f"Rate limited in /generate-reply: {e}")
+        return rate_limited_response(e)
+    except PromptTooLarge as e:
+        print(f"Prompt too large in /generate-reply: {e}")
+        return prompt_too_large_response(e)
     except Exception as e:
         print(f"Error in /generate-reply: {e}")
         print(traceback.format_exc())
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/inbound-message", methods=["POST"])
+def inbound_message():
+    """
+    Webhook for new conversation messages; pre-generates the reply to the client.
+    
+    Request body:
+    {
+        "conversationId": "...",
+        "direction": "in",
+        "text": "message text",
+        "chatHistory": [...],  (optional: messages before the current client sequence)
+        "scenario": "dtv"  (optional)
+    }
+    
+    Response (202):
+    {
+        "conversationId": "...",
+        "clientSequence": ["message1", "message2"],
+        "speculateInSeconds": 3.0
+    }
+    
+    Consecutive client messages ("in") form the client sequence. A reply is generated
+    once no new client message has arrived for the debounce period, and served by
+    /generate-reply for that exact state. A consultant message ("out") ends the turn.
+    """
+    try:
+        if speculative_replies is None:
+            return jsonify({"error": "Speculative replies are disabled"}), 404
+        
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "Request body is required"}), 400
+        
+        conversation_id = str(data.get("conversationId") or "").strip()
+        direction = data.get("direction", "in")
+        text = data.get("text", "")
+        
+        if not conversation_id:
+            return jsonify({"error": "conversationId is required"}), 400
+        if direction not in ("in", "out"):
+            return jsonify({"error": "direction must be 'in' or 'out'"}), 400
+        if not text:
+            return jsonify({"error": "text is required"}), 400
+        
+        state = speculative_replies.message(
+            conversation_id, direction, text,
+            chat_history=data.get("chatHistory"),
+            scenario=data.get("scenario")
+        )
+        return jsonify(state), 202
+    
+    except Exception as e:
+        print(f"Error in /inbound-message: {e}")
+        print(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/improve-ai", methods=["POST"])
 def improve_ai():
     """
@@ -112,14 +450,24 @@ def improve_ai():
     {
         "clientSequence": ["message1"],
         "chatHistory": [...],
-        "consultantReply": "Human consultant's actual reply"
+        "consultantReply": "Human consultant's actual reply",
+        "scenario": "dtv"  (optional)
     }
     
     Response:
     {
         "predictedReply": "<AI's predicted reply>",
-        "updatedPrompt": "<new improved prompt>"
+        "updatedPrompt": "<new improved prompt or scenario shard>",
+        "similarity": 0.42,
+        "alreadyGood": false,
+        "scenario": "dtv"
     }
+    
+    When the predicted reply is already similar enough to the consultant's
+    (alreadyGood), the editor call and prompt write are skipped.
+    
+    Retries carrying the same Idempotency-Key header get the first result back
+    (with Idempotent-Replayed: true) instead of training again.
     """
     try:
         data = request.get_json()
@@ -140,43 +488,37 @@ def improve_ai():
         if not consultant_reply:
             return jsonify({"error": "consultantReply is required"}), 400
         
-        # Get current prompts
-        system_prompt = prompt_manager.get_system_prompt()
-        editor_prompt = prompt_manager.get_editor_prompt()
-        
-        # Generate AI reply first
-        predicted_reply = gemini_client.generate_reply(
-            system_prompt=system_prompt,
-            client_sequence=client_sequence,
-            chat_history=chat_history if chat_history else None
-        )
-        
-        # Use editor to improve the prompt
-        updated_prompt = gemini_client.improve_prompt(
-            editor_prompt=editor_prompt,
-            existing_prompt=system_prompt,
-            client_sequence=client_sequence,
-            chat_history=chat_history,
-            real_consultant_reply=consultant_reply,
-            predicted_ai_reply=predicted_reply
-        )
-        
-        # Save the updated prompt to Supabase
-        prompt_manager.update_system_prompt(updated_prompt)
-        
-        # Save training example
-        db.save_training_example(
-            client_sequence=client_sequence,
-            chat_history=chat_history,
-            consultant_reply=consultant_reply,
-            ai_reply=predicted_reply
-        )
-        
-        return jsonify({
-            "predictedReply": predicted_reply,
-            "updatedPrompt": updated_prompt
-        })
+        def train() -> Dict:
+            # Predict, compare, and improve the prompt unless the AI already matches
+            result = training_pipeline.train_example(
+                client_sequence=client_sequence,
+                chat_history=chat_history,
+                consultant_reply=consultant_reply,
+                priority=MANUAL,
+                scenario=data.get("scenario")
+            )
+            return {
+                "predictedReply": result["predicted_reply"],
+                "updatedPrompt": result["updated_prompt"],
+                "similarity": result["similarity"],
+                "alreadyGood": result["already_good"],
+                "scenario": result["scenario"]
+            }
+        
+        payload, replayed = run_idempotent("improve-ai", data, train)
+        return idempotent_response(payload, replayed)
     
+    except IdempotencyConflict as e:
+        return jsonify({"error": str(e)}), 422
+    except RateLimitExceeded as e:
+        print(f"Rate limited in /improve-ai: {e}")
+        return rate_limited_response(e)
+    except PromptTooLarge as e:
+        print(f"Prompt too large in /improve-ai: {e}")
+        return prompt_too_large_response(e)
+    except GeminiUnavailable as e:
+        print(f"Gemini unavailable in /improve-ai: {e}")
+        return unavailable_response(e)
     except Exception as e:
         print(f"Error in /improve-ai: {e}")
         print(traceback.format_exc())
@@ -209,8 +551,8 @@ def improve_ai_manually():
         if not instructions:
             return jsonify({"error": "instructions is required"}), 400
         
-        # Get current prompts
-        system_prompt = prompt_manager.get_system_prompt()
+        # Get current prompts (the shadow candidate, if one is being evaluated)
+        system_prompt = prompt_manager.get_working_prompt()
         editor_prompt = prompt_manager.get_editor_prompt()
         
         # Use Gemini to update prompt based on instructions
@@ -220,13 +562,23 @@ def improve_ai_manually():
             instructions=instructions
         )
         
-        # Save the updated prompt to Supabase
-        prompt_manager.update_system_prompt(updated_prompt)
+        # Save the updated prompt to Supabase (compacted if it grew past the budget)
+        saved = prompt_manager.update_system_prompt(updated_prompt)
+        updated_prompt = saved.get("content", updated_prompt)
         
         return jsonify({
             "updatedPrompt": updated_prompt
         })
     
+    except RateLimitExceeded as e:
+        print(f"Rate limited in /improve-ai-manually: {e}")
+        return rate_limited_response(e)
+    except PromptTooLarge as e:
+        print(f"Prompt too large in /improve-ai-manually: {e}")
+        return prompt_too_large_response(e)
+    except GeminiUnavailable as e:
+        print(f"Gemini unavailable in /improve-ai-manually: {e}")
+        return unavailable_response(e)
     except Exception as e:
         print(f"Error in /improve-ai-manually: {e}")
         print(traceback.format_exc())
@@ -306,60 +658,31 @@ def load_training_data():
         # Parse conversations
         training_examples = parser.parse_conversations_file(conversations)
         
-        results = []
-        for example in training_examples:
-            try:
-                # Simulate internal call to /improve-ai
-                client_sequence = example["client_sequence"]
-                chat_history = example["chat_history"]
-                consultant_reply = example["consultant_reply"]
-                
-                # Get current prompts
-                system_prompt = prompt_manager.get_system_prompt()
-                editor_prompt = prompt_manager.get_editor_prompt()
-                
-                # Generate AI reply
-                predicted_reply = gemini_client.generate_reply(
-                    system_prompt=system_prompt,
-                    client_sequence=client_sequence,
-                    chat_history=chat_history if chat_history else None
-                )
-                
-                # Improve prompt
-                updated_prompt = gemini_client.improve_prompt(
-                    editor_prompt=editor_prompt,
-                    existing_prompt=system_prompt,
-                    client_sequence=client_sequence,
-                    chat_history=chat_history,
-                    real_consultant_reply=consultant_reply,
-                    predicted_ai_reply=predicted_reply
-                )
-                
-                # Save updated prompt
-                prompt_manager.update_system_prompt(updated_prompt)
-                
-                # Save training example
-                db.save_training_example(
-                    client_sequence=client_sequence,
-                    chat_history=chat_history,
-                    consultant_reply=consultant_reply,
-                    ai_reply=predicted_reply
+        # Templated exchanges teach nothing new; skip them before any Gemini call
+        duplicates = 0
+        if dedup_index is not None:
+            training_examples, duplicates = dedup_index.filter(training_examples)
+        
+        # Bulk priority so live replies go first; independent prompt shards train in parallel
+        job_id = f"load-{uuid.uuid4().hex[:12]}"
+        try:
+            with usage_context(job=job_id):
+                results = training_pipeline.train_batch(
+                    training_examples,
+                    priority=BULK,
+                    max_workers=TRAINING_SHARD_CONCURRENCY
                 )
-                
-                results.append({
-                    "contact_id": example.get("contact_id"),
-                    "status": "success"
-                })
-            
-            except Exception as e:
-                results.append({
-                    "contact_id": example.get("contact_id"),
-                    "status": "error",
-                    "error": str(e)
-                })
+        except Exception:
+            if dedup_index is not None:
+                dedup_index.release(training_examples)
+            raise
+        if dedup_index is not None:
+            dedup_index.settle(training_examples, results)
         
         return jsonify({
+            "job": job_id,
             "processed": len(results),
+            "duplicates_skipped": duplicates,
             "results": results
         })
     
@@ -369,6 +692,69 @@ def load_training_data():
         return jsonify({"error": str(e)}), 500
 
 
+def export_response(fetch_page: PageFetcher):
+    """
+    Stream rows after the optional afterCreatedAt/afterId cursor as NDJSON.
+
+    Query parameters: afterCreatedAt and afterId (both or neither), limit, pageSize.
+    Requires EXPORT_API_KEY in the X-Export-Key header; without a configured key
+    exports are disabled.
+    """
+    if not EXPORT_API_KEY:
+        return jsonify({"error": "Exports are disabled; set EXPORT_API_KEY to enable them"}), 403
+    if not hmac.compare_digest(request.headers.get("X-Export-Key", "").encode("utf-8"),
+                               EXPORT_API_KEY.encode("utf-8")):
+        return jsonify({"error": "A valid X-Export-Key header is required"}), 401
+    after_created_at = request.args.get("afterCreatedAt")
+    after_id = request.args.get("afterId")
+    if bool(after_created_at) != bool(after_id):
+        return jsonify({"error": "afterCreatedAt and afterId must be given together"}), 400
+    try:
+        limit = int(request.args["limit"]) if "limit" in request.args else None
+        page_size = int(request.args.get("pageSize", EXPORT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit and pageSize must be integers"}), 400
+    if page_size < 1 or (limit is not None and limit < 0):
+        return jsonify({"error": "pageSize must be positive and limit non-negative"}), 400
+
+    try:
+        after = parse_cursor(after_created_at, after_id) if after_created_at else None
+    except ValueError:
+        return jsonify({"error": "afterCreatedAt must be an ISO 8601 timestamp and afterId a UUID"}), 400
+    response = Response(
+        ndjson_export(fetch_page, after, min(page_size, EXPORT_PAGE_SIZE), limit,
+                      EXPORT_PREFETCH_PAGES),
+        mimetype="application/x-ndjson"
+    )
+    # Rows stream out after the view returns: keep the tenant's admission slot until
+    # the stream is closed instead of releasing it at request teardown
+    tenant = g.pop("admitted_tenant", None)
+    if tenant is not None:
+        response.call_on_close(lambda: tenant_admission.release(tenant))
+    return response
+
+
+@app.route("/export/prompts", methods=["GET"])
+def export_prompts():
+    """
+    Stream all system prompt versions as NDJSON, oldest first.
+    
+    Response: one JSON object per line: {"id": ..., "content": ..., "created_at": ...}
+    """
+    return export_response(db.get_prompts_page)
+
+
+@app.route("/export/training-examples", methods=["GET"])
+def export_training_examples():
+    """
+    Stream all training examples as NDJSON, oldest first.
+    
+    Response: one JSON object per line with id, client_sequence, chat_history,
+    consultant_reply, ai_reply and created_at
+    """
+    return export_response(db.get_training_examples_page)
+
+
 if __name__ == "__main__":
     import os
     from config import FLASK_DEBUG
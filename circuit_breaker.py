@@ -0,0 +1,169 @@
+"""
+Circuit breaker for Gemini models.
+
+Each model has a breaker that watches recent call outcomes. When too many
+recent calls fail or run slower than the latency threshold, the breaker opens
+and calls to that model fail immediately instead of tying up a worker thread.
+After `open_duration` a few probe calls are let through (half-open); if they
+succeed the breaker closes again, otherwise it re-opens.
+"""
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class GeminiUnavailable(Exception):
+    """Raised when every candidate model's circuit is open."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed → open → half-open breaker over a rolling window of call outcomes."""
+
+    def __init__(self, name: str, failure_ratio: float = 0.5, window: int = 20,
+                 min_calls: int = 5, open_duration: float = 30.0, half_open_probes: int = 1):
+        """
+        Args:
+            name: Label used in errors and metrics (the model name)
+            failure_ratio: Share of failed or slow calls in the window that opens the breaker
+            window: Number of recent calls considered
+            min_calls: Calls needed in the window before the breaker can open
+            open_duration: Seconds to fail fast before probing again
+            half_open_probes: Successful probes needed to close the breaker
+        """
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.half_open_probes = max(1, half_open_probes)
+        self._outcomes: deque = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        self._counters = {"opened": 0, "rejected": 0, "failures": 0, "slow_calls": 0}
+
+    def _current_state(self) -> str:
+        """State with the open → half-open timeout applied. Caller holds the lock."""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_duration:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker will let a probe through (0 if it already would)."""
+        with self._lock:
+            if self._current_state() != OPEN:
+                return 0.0
+            return max(0.0, self.open_duration - (time.monotonic() - self._opened_at))
+
+    def acquire(self) -> bool:
+        """
+        Ask to make a call.
+
+        Returns:
+            False if the call should fail fast (open, or half-open with its probes taken)
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            self._counters["rejected"] += 1
+            return False
+
+    def release(self):
+        """Give back a permission without recording an outcome (local queue timeout, throttling)."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._counters["opened"] += 1
+        print(f"Circuit breaker for {self.name} opened for {self.open_duration:.0f}s")
+
+    def record(self, ok: bool, slow: bool = False):
+        """
+        Record the outcome of a call made after acquire().
+
+        Args:
+            ok: False for failures that point at the service (5xx, timeouts)
+            slow: The call succeeded but took longer than the latency threshold
+        """
+        bad = not ok or slow
+        with self._lock:
+            if not ok:
+                self._counters["failures"] += 1
+            elif slow:
+                self._counters["slow_calls"] += 1
+
+            state = self._current_state()
+            if state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if bad:
+                    self._open()
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    print(f"Circuit breaker for {self.name} closed")
+                return
+            if state == OPEN:
+                # A call that started before the breaker opened; nothing to decide
+                return
+
+            self._outcomes.append(bad)
+            if len(self._outcomes) >= self.min_calls \
+                    and self._outcomes.count(True) / len(self._outcomes) >= self.failure_ratio:
+                self._open()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["state"] = self._current_state()
+            stats["recent_failure_ratio"] = round(
+                self._outcomes.count(True) / len(self._outcomes), 3
+            ) if self._outcomes else 0.0
+        return stats
+
+
+class CircuitBreakerRegistry:
+    """Lazily creates one breaker per model with shared settings."""
+
+    def __init__(self, **settings):
+        self._settings = settings
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name, **self._settings)
+            return breaker
+
+    def stats(self) -> Dict:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.stats() for name, breaker in breakers.items()}
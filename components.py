@@ -0,0 +1,203 @@
+"""
+Construction of the shared service components.
+
+Used by the Flask app and by the offline training CLI so both run the same
+prompt management, retrieval and training configuration.
+"""
+from typing import Optional
+
+from config import (
+    SIMILARITY_GATE_ENABLED, SIMILARITY_SKIP_THRESHOLD, FEW_SHOT_ENABLED, FEW_SHOT_K,
+    FEW_SHOT_MIN_SIMILARITY, VECTOR_INDEX_DIR, VECTOR_INDEX_BOOTSTRAP_LIMIT,
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_MAX_HISTORY, SEMANTIC_CACHE_EMBEDDING_MODEL,
+    SEMANTIC_CACHE_FALSE_HIT_THRESHOLD, PROMPT_TOKEN_BUDGET, PROMPT_COMPACTION_TARGET_RATIO,
+    PROMPT_COMPACTION_TOLERANCE, PROMPT_COMPACTION_RETRY_GROWTH, PROMPT_REPLAY_SAMPLE_SIZE,
+    PROMPT_SHARDING_ENABLED, EXPORT_PAGE_SIZE,
+    SHADOW_EVAL_ENABLED, SHADOW_SAMPLE_RATE, SHADOW_RPM, SHADOW_MAX_IN_FLIGHT, SHADOW_MIN_SAMPLES,
+    SHADOW_MAX_SAMPLES, SHADOW_SIMILARITY_TOLERANCE, SHADOW_LATENCY_TOLERANCE,
+    SHADOW_LENGTH_TOLERANCE, DEDUP_ENABLED, DEDUP_THRESHOLD, DEDUP_NUM_PERM, DEDUP_BANDS,
+    DEDUP_SHINGLE_SIZE, DEDUP_INDEX_DIR, TENANT_LIMITS_ENABLED, TENANT_LIMITS, TENANT_DEFAULT_RPM,
+    TENANT_DEFAULT_MAX_CONCURRENCY, TENANT_CAPACITY, TENANT_QUEUE_TIMEOUT, DATABASE_URL,
+    DATABASE_POOL_SIZE, PROMPT_EDIT_CANDIDATES, SPECULATION_ENABLED,
+    SPECULATION_DEBOUNCE_SECONDS, SPECULATION_TTL, SPECULATION_MAX_CONVERSATIONS,
+    SPECULATION_MAX_IN_FLIGHT
+)
+from dedup import NearDuplicateIndex
+from export import iter_pages
+from gemini_client import GeminiClient
+from prompt_compactor import PromptCompactor
+from prompt_manager import PromptManager
+from prompt_replay import PromptReplayer
+from scenario_router import ScenarioRouter
+from semantic_cache import SemanticReplyCache
+from shadow import ShadowEvaluator
+from speculation import ReplyGenerator, SpeculativeReplies
+from similarity import SimilarityScorer
+from supabase_client import SupabaseDB
+from tenants import TenantAdmission, TenantLimits
+from training import TrainingPipeline
+from vector_index import ExampleIndex
+
+
+def create_db() -> SupabaseDB:
+    """Supabase client, with the direct Postgres path for hot queries when DATABASE_URL is set."""
+    if DATABASE_URL:
+        # Imported here so psycopg2 is only needed when the direct path is used
+        from postgres_client import PostgresDB
+        return PostgresDB(DATABASE_URL, DATABASE_POOL_SIZE)
+    return SupabaseDB()
+
+
+def create_prompt_manager(db: SupabaseDB, gemini_client: GeminiClient,
+                          scorer: SimilarityScorer) -> PromptManager:
+    """Prompt manager with replay-validated compaction, optional scenario shards and shadow mode."""
+    replayer = PromptReplayer(db, gemini_client, scorer, sample_size=PROMPT_REPLAY_SAMPLE_SIZE)
+    return PromptManager(db, compactor=PromptCompactor(
+        gemini_client=gemini_client,
+        replayer=replayer,
+        token_budget=PROMPT_TOKEN_BUDGET,
+        target_ratio=PROMPT_COMPACTION_TARGET_RATIO,
+        tolerance=PROMPT_COMPACTION_TOLERANCE,
+        retry_growth=PROMPT_COMPACTION_RETRY_GROWTH
+    ), sharding_enabled=PROMPT_SHARDING_ENABLED, shadow_enabled=SHADOW_EVAL_ENABLED)
+
+
+def create_example_index(db: SupabaseDB) -> ExampleIndex:
+    """Local few-shot index, seeded from Supabase when the disk is empty."""
+    example_index = ExampleIndex(VECTOR_INDEX_DIR)
+    # Fresh disk (e.g. new Render instance): seed the index with the newest examples. PostgREST
+    # caps a single response (1000 rows by default), so they are read in keyset pages.
+    pages = iter_pages(
+        lambda after, size: db.get_training_examples_page(after, size, newest_first=True),
+        page_size=EXPORT_PAGE_SIZE, limit=VECTOR_INDEX_BOOTSTRAP_LIMIT
+    )
+    try:
+        seeded = example_index.seed(pages)
+    except Exception as e:
+        # Retrieval just has fewer examples until training adds more
+        print(f"Error seeding the example index: {e}")
+        seeded = 0
+    if seeded:
+        print(f"✓ Indexed {seeded} training examples")
+    return example_index
+
+
+def create_dedup_index() -> Optional[NearDuplicateIndex]:
+    """Near-duplicate filter for bulk training, or None when disabled."""
+    if not DEDUP_ENABLED:
+        return None
+    return NearDuplicateIndex(
+        DEDUP_INDEX_DIR,
+        threshold=DEDUP_THRESHOLD,
+        num_perm=DEDUP_NUM_PERM,
+        bands=DEDUP_BANDS,
+        shingle_size=DEDUP_SHINGLE_SIZE
+    )
+
+
+def create_semantic_cache(gemini_client: GeminiClient) -> Optional[SemanticReplyCache]:
+    """Semantic reply cache, or None when disabled or no embedding model is configured."""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    if not SEMANTIC_CACHE_EMBEDDING_MODEL:
+        # Local n-gram similarity ranks "student visa" above a real paraphrase of "tourist visa"
+        print("Semantic cache disabled: SEMANTIC_CACHE_EMBEDDING_MODEL is not set")
+        return None
+    return SemanticReplyCache(
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl=SEMANTIC_CACHE_TTL,
+        max_history=SEMANTIC_CACHE_MAX_HISTORY,
+        false_hit_threshold=SEMANTIC_CACHE_FALSE_HIT_THRESHOLD,
+        embed=lambda texts: gemini_client.embed_texts(texts, SEMANTIC_CACHE_EMBEDDING_MODEL)
+    )
+
+
+def create_shadow_evaluator(prompt_manager: PromptManager, gemini_client: GeminiClient,
+                            scorer: SimilarityScorer) -> Optional[ShadowEvaluator]:
+    """Shadow evaluator for candidate system prompts, or None when shadow mode is off."""
+    if not SHADOW_EVAL_ENABLED:
+        return None
+    return ShadowEvaluator(
+        prompt_manager, gemini_client, scorer,
+        sample_rate=SHADOW_SAMPLE_RATE,
+        rpm=SHADOW_RPM,
+        max_in_flight=SHADOW_MAX_IN_FLIGHT,
+        min_samples=SHADOW_MIN_SAMPLES,
+        max_samples=SHADOW_MAX_SAMPLES,
+        similarity_tolerance=SHADOW_SIMILARITY_TOLERANCE,
+        latency_tolerance=SHADOW_LATENCY_TOLERANCE,
+        length_tolerance=SHADOW_LENGTH_TOLERANCE
+    )
+
+
+def create_speculative_replies(generate: ReplyGenerator) -> Optional[SpeculativeReplies]:
+    """Debounced reply pre-generation for /inbound-message, or None when disabled."""
+    if not SPECULATION_ENABLED:
+        return None
+    return SpeculativeReplies(
+        generate,
+        debounce=SPECULATION_DEBOUNCE_SECONDS,
+        ttl=SPECULATION_TTL,
+        max_conversations=SPECULATION_MAX_CONVERSATIONS,
+        max_in_flight=SPECULATION_MAX_IN_FLIGHT
+    )
+
+
+def create_tenant_admission() -> Optional[TenantAdmission]:
+    """Per-tenant rate limits and fair queueing for the API, or None when disabled."""
+    if not TENANT_LIMITS_ENABLED:
+        return None
+    default = TenantLimits(rpm=TENANT_DEFAULT_RPM, max_concurrency=TENANT_DEFAULT_MAX_CONCURRENCY)
+    return TenantAdmission(
+        capacity=TENANT_CAPACITY,
+        default_limits=default,
+        tenant_limits={
+            name: TenantLimits(
+                rpm=limits.get("rpm", default.rpm),
+                max_concurrency=limits.get("max_concurrency", default.max_concurrency),
+                weight=limits.get("weight", 1.0),
+                max_queued=limits.get("max_queued")
+            )
+            for name, limits in TENANT_LIMITS.items()
+        },
+        queue_timeout=TENANT_QUEUE_TIMEOUT
+    )
+
+
+def create_training_pipeline(db: SupabaseDB, prompt_manager: PromptManager,
+                             gemini_client: GeminiClient, scorer: SimilarityScorer,
+                             example_index: Optional[ExampleIndex],
+                             semantic_cache: Optional[SemanticReplyCache] = None,
+                             shadow_evaluator: Optional[ShadowEvaluator] = None) -> TrainingPipeline:
+    """Training pipeline with the configured similarity gate, few-shot, scenario routing and edit candidates."""
+    replayer = None
+    if PROMPT_EDIT_CANDIDATES > 1:
+        # Share the compactor's replayer (and its cached validation set) when there is one
+        compactor = prompt_manager.compactor
+        replayer = compactor.replayer if compactor is not None else PromptReplayer(
+            db, gemini_client, scorer, sample_size=PROMPT_REPLAY_SAMPLE_SIZE
+        )
+    pipeline = TrainingPipeline(
+        db=db,
+        prompt_manager=prompt_manager,
+        gemini_client=gemini_client,
+        scorer=scorer,
+        skip_threshold=SIMILARITY_SKIP_THRESHOLD,
+        gate_enabled=SIMILARITY_GATE_ENABLED,
+        example_index=example_index,
+        few_shot_k=FEW_SHOT_K if FEW_SHOT_ENABLED else 0,
+        few_shot_min_similarity=FEW_SHOT_MIN_SIMILARITY,
+        semantic_cache=semantic_cache,
+        scenario_router=ScenarioRouter(),
+        shadow_evaluator=shadow_evaluator,
+        replayer=replayer,
+        edit_candidates=PROMPT_EDIT_CANDIDATES
+    )
+    # Replays score prompts with the same few-shot context /generate-reply adds
+    compactor = prompt_manager.compactor
+    for prompt_replayer in (replayer, compactor.replayer if compactor is not None else None):
+        if prompt_replayer is not None:
+            prompt_replayer.few_shot = pipeline.similar_examples
+    return pipeline
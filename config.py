@@ -12,6 +12,7 @@ How it works:
 3. On Render: .env doesn't exist, so it uses environment variables from dashboard
 4. On local: .env exists, loads it, then os.getenv() reads the loaded values
 """
+import json
 import os
 from pathlib import Path
 
@@ -29,7 +30,9 @@ if env_file.exists():
 
 # Gemini Configuration
 # API key MUST be set as environment variable - never hardcode it
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Optional pool of keys from different projects (comma-separated), each with its own quota
+GEMINI_API_KEYS = [key.strip() for key in os.getenv("GEMINI_API_KEYS", "").split(",") if key.strip()]
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or (GEMINI_API_KEYS[0] if GEMINI_API_KEYS else None)
 if not GEMINI_API_KEY:
     raise ValueError(
         "GEMINI_API_KEY environment variable is required.\n"
@@ -37,10 +40,174 @@ if not GEMINI_API_KEY:
         "For Render: Set it in the dashboard under Environment Variables"
     )
 
-GEMINI_MODEL = "gemini-2.5-flash"
+if not GEMINI_API_KEYS:
+    GEMINI_API_KEYS = [GEMINI_API_KEY]
+# Key selection ("least_loaded" or "round_robin") and how long a throttled key is skipped
+GEMINI_KEY_STRATEGY = os.getenv("GEMINI_KEY_STRATEGY", "least_loaded")
+GEMINI_KEY_EJECT_SECONDS = float(os.getenv("GEMINI_KEY_EJECT_SECONDS", "30"))
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+
+# Per-task model routing: fast model for replies, stronger model for prompt editing,
+# with fallback when the primary breaches its latency SLO or keeps erroring
+GEMINI_REPLY_MODEL = os.getenv("GEMINI_REPLY_MODEL", GEMINI_MODEL)
+GEMINI_REPLY_FALLBACK_MODEL = os.getenv("GEMINI_REPLY_FALLBACK_MODEL", "gemini-2.5-flash-lite")
+GEMINI_EDITOR_MODEL = os.getenv("GEMINI_EDITOR_MODEL", "gemini-2.5-pro")
+GEMINI_EDITOR_FALLBACK_MODEL = os.getenv("GEMINI_EDITOR_FALLBACK_MODEL", GEMINI_MODEL)
+GEMINI_REPLY_SLO_MS = int(os.getenv("GEMINI_REPLY_SLO_MS", "8000"))
+GEMINI_EDITOR_SLO_MS = int(os.getenv("GEMINI_EDITOR_SLO_MS", "60000"))
+GEMINI_ROUTE_COOLDOWN = float(os.getenv("GEMINI_ROUTE_COOLDOWN", "60"))
+# Per-call timeouts, so a hung Gemini call doesn't hold a worker thread indefinitely
+GEMINI_REPLY_TIMEOUT = float(os.getenv("GEMINI_REPLY_TIMEOUT", "30"))
+GEMINI_EDITOR_TIMEOUT = float(os.getenv("GEMINI_EDITOR_TIMEOUT", "180"))
+
+# Per-model circuit breaker: fail fast while a model keeps erroring or breaching its SLO
+GEMINI_BREAKER_FAILURE_RATIO = float(os.getenv("GEMINI_BREAKER_FAILURE_RATIO", "0.5"))
+GEMINI_BREAKER_WINDOW = int(os.getenv("GEMINI_BREAKER_WINDOW", "20"))
+GEMINI_BREAKER_MIN_CALLS = int(os.getenv("GEMINI_BREAKER_MIN_CALLS", "5"))
+GEMINI_BREAKER_OPEN_SECONDS = float(os.getenv("GEMINI_BREAKER_OPEN_SECONDS", "30"))
+GEMINI_BREAKER_HALF_OPEN_PROBES = int(os.getenv("GEMINI_BREAKER_HALF_OPEN_PROBES", "1"))
+
+# Gemini quota (per API key) and retry settings (defaults match the paid tier-1 flash quota)
+GEMINI_RPM_LIMIT = int(os.getenv("GEMINI_RPM_LIMIT", "1000"))
+GEMINI_TPM_LIMIT = int(os.getenv("GEMINI_TPM_LIMIT", "1000000"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "30"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1.0"))
+GEMINI_RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "30"))
+
+# Priority scheduling between interactive replies, manual improvements and bulk training
+SCHEDULER_WEIGHT_INTERACTIVE = float(os.getenv("SCHEDULER_WEIGHT_INTERACTIVE", "8"))
+SCHEDULER_WEIGHT_MANUAL = float(os.getenv("SCHEDULER_WEIGHT_MANUAL", "3"))
+SCHEDULER_WEIGHT_BULK = float(os.getenv("SCHEDULER_WEIGHT_BULK", "1"))
+SCHEDULER_RESERVED_INTERACTIVE_SLOTS = int(os.getenv("SCHEDULER_RESERVED_INTERACTIVE_SLOTS", "1"))
+SCHEDULER_BULK_QUEUE_TIMEOUT = float(os.getenv("SCHEDULER_BULK_QUEUE_TIMEOUT", "600"))
+
+# Hedged requests for interactive replies (off by default: costs extra quota)
+GEMINI_HEDGE_ENABLED = os.getenv("GEMINI_HEDGE_ENABLED", "False").lower() == "true"
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+GEMINI_HEDGE_BUDGET = float(os.getenv("GEMINI_HEDGE_BUDGET", "0.05"))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+
+# Similarity gate: skip the editor call when the AI reply already matches the consultant
+SIMILARITY_GATE_ENABLED = os.getenv("SIMILARITY_GATE_ENABLED", "True").lower() == "true"
+SIMILARITY_SKIP_THRESHOLD = float(os.getenv("SIMILARITY_SKIP_THRESHOLD", "0.9"))
+
+# Few-shot retrieval of similar past consultant replies from a local vector index
+FEW_SHOT_ENABLED = os.getenv("FEW_SHOT_ENABLED", "True").lower() == "true"
+FEW_SHOT_K = int(os.getenv("FEW_SHOT_K", "3"))
+FEW_SHOT_MIN_SIMILARITY = float(os.getenv("FEW_SHOT_MIN_SIMILARITY", "0.35"))
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", str(Path(__file__).parent / "data" / "example_index"))
+VECTOR_INDEX_BOOTSTRAP_LIMIT = int(os.getenv("VECTOR_INDEX_BOOTSTRAP_LIMIT", "5000"))
+
+# Semantic reply cache for short conversations (answers paraphrased questions without an LLM call).
+# Needs SEMANTIC_CACHE_EMBEDDING_MODEL: local hashed n-grams can't tell paraphrases from other visa types
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "False").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_MAX_HISTORY = int(os.getenv("SEMANTIC_CACHE_MAX_HISTORY", "0"))
+SEMANTIC_CACHE_FALSE_HIT_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_FALSE_HIT_THRESHOLD", "0.25"))
+# Gemini embedding model, e.g. models/text-embedding-004 (the cache stays off without one)
+SEMANTIC_CACHE_EMBEDDING_MODEL = os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL", "")
+
+# System prompt compaction: rewrite the prompt when it grows past a token budget (0 disables)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+PROMPT_COMPACTION_TARGET_RATIO = float(os.getenv("PROMPT_COMPACTION_TARGET_RATIO", "0.7"))
+PROMPT_COMPACTION_TOLERANCE = float(os.getenv("PROMPT_COMPACTION_TOLERANCE", "0.02"))
+# After a rejected or failed compaction, retry only once the prompt has grown by this fraction
+PROMPT_COMPACTION_RETRY_GROWTH = float(os.getenv("PROMPT_COMPACTION_RETRY_GROWTH", "0.1"))
+PROMPT_REPLAY_SAMPLE_SIZE = int(os.getenv("PROMPT_REPLAY_SAMPLE_SIZE", "5"))
+# Editor proposals per prompt update; above 1 the best by replay is kept (1 keeps every edit)
+PROMPT_EDIT_CANDIDATES = int(os.getenv("PROMPT_EDIT_CANDIDATES", "1"))
+
+# Per-scenario prompt shards (requires the prompt_shards table from init_supabase.sql)
+PROMPT_SHARDING_ENABLED = os.getenv("PROMPT_SHARDING_ENABLED", "False").lower() == "true"
+TRAINING_SHARD_CONCURRENCY = int(os.getenv("TRAINING_SHARD_CONCURRENCY", "4"))
+
+# Degraded mode for /generate-reply while Gemini is unavailable
+DEGRADED_CACHE_THRESHOLD = float(os.getenv("DEGRADED_CACHE_THRESHOLD", "0.75"))
+DEGRADED_FALLBACK_REPLY = os.getenv(
+    "DEGRADED_FALLBACK_REPLY",
+    "Thank you for your message! A consultant will get back to you shortly."
+)
+
+# Idempotency-Key support on /generate-reply and /improve-ai (results kept in memory)
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+
+# Token/cost accounting: optional JSON price overrides, e.g. {"gemini-2.5-flash": [0.3, 2.5]}
+# (USD per 1M input/output tokens)
+GEMINI_PRICING = {
+    model: tuple(prices) for model, prices in json.loads(os.getenv("GEMINI_PRICING", "{}")).items()
+}
+# Guard on the assembled prompt size (estimated tokens, 0 disables): "truncate" drops
+# few-shot examples and the oldest history first, "reject" refuses the request
+GEMINI_PROMPT_TOKEN_LIMIT = int(os.getenv("GEMINI_PROMPT_TOKEN_LIMIT", "0"))
+GEMINI_PROMPT_OVERFLOW = os.getenv("GEMINI_PROMPT_OVERFLOW", "truncate")
+
+# Shadow evaluation: new system prompts are tried on sampled live traffic before going live
+SHADOW_EVAL_ENABLED = os.getenv("SHADOW_EVAL_ENABLED", "false").lower() == "true"
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.2"))
+SHADOW_RPM = float(os.getenv("SHADOW_RPM", "30"))  # Cap on shadow Gemini calls
+SHADOW_MAX_IN_FLIGHT = int(os.getenv("SHADOW_MAX_IN_FLIGHT", "2"))
+SHADOW_MIN_SAMPLES = int(os.getenv("SHADOW_MIN_SAMPLES", "20"))
+SHADOW_MAX_SAMPLES = int(os.getenv("SHADOW_MAX_SAMPLES", "200"))
+# How much worse the candidate may be: absolute similarity, relative latency and reply length
+SHADOW_SIMILARITY_TOLERANCE = float(os.getenv("SHADOW_SIMILARITY_TOLERANCE", "0.01"))
+SHADOW_LATENCY_TOLERANCE = float(os.getenv("SHADOW_LATENCY_TOLERANCE", "0.1"))
+SHADOW_LENGTH_TOLERANCE = float(os.getenv("SHADOW_LENGTH_TOLERANCE", "0.1"))
+
+# HTTP compression: gzip/zstd request bodies and negotiated response compression
+REQUEST_MAX_DECODED_BYTES = int(os.getenv("REQUEST_MAX_DECODED_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+RESPONSE_COMPRESSION_LEVEL = int(os.getenv("RESPONSE_COMPRESSION_LEVEL", "6"))
+
+# NDJSON exports: rows per keyset page (also the maximum pageSize) and pages fetched ahead
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "1000"))
+EXPORT_PREFETCH_PAGES = int(os.getenv("EXPORT_PREFETCH_PAGES", "2"))
+# Exports return every conversation and prompt version: they are off unless a key is set,
+# and callers must send it in the X-Export-Key header
+EXPORT_API_KEY = os.getenv("EXPORT_API_KEY", "")
+
+# Near-duplicate elimination before bulk training (MinHash LSH over client sequence + reply)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))  # Estimated Jaccard similarity
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", "5"))
+DEDUP_INDEX_DIR = os.getenv("DEDUP_INDEX_DIR", str(Path(__file__).parent / "data" / "dedup_index"))
+
+# Per-tenant admission control on the API. Tenants are identified by the X-API-Key header.
+# TENANT_API_KEYS maps keys to tenant names, e.g. {"key-abc": "crm"}; when set, other keys get 401.
+# Without it, each distinct key (or client address) is its own tenant with the default limits.
+# Off by default: existing unkeyed callers would otherwise share one address-based tenant
+TENANT_LIMITS_ENABLED = os.getenv("TENANT_LIMITS_ENABLED", "false").lower() == "true"
+# Reverse proxies in front of the app (Render: 1); the client address is the hop they appended
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "1"))
+TENANT_API_KEYS = json.loads(os.getenv("TENANT_API_KEYS", "{}"))
+# Per-tenant overrides, e.g. {"crm": {"rpm": 300, "max_concurrency": 8, "weight": 2}}
+TENANT_LIMITS = json.loads(os.getenv("TENANT_LIMITS", "{}"))
+TENANT_DEFAULT_RPM = float(os.getenv("TENANT_DEFAULT_RPM", "120"))
+TENANT_DEFAULT_MAX_CONCURRENCY = int(os.getenv("TENANT_DEFAULT_MAX_CONCURRENCY", "4"))
+TENANT_CAPACITY = int(os.getenv("TENANT_CAPACITY", "16"))  # Requests served at once, all tenants
+TENANT_QUEUE_TIMEOUT = float(os.getenv("TENANT_QUEUE_TIMEOUT", "10"))
+
+# Speculative replies from /inbound-message: generated once no client message arrived for
+# SPECULATION_DEBOUNCE_SECONDS, served by /generate-reply while the conversation is unchanged
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "True").lower() == "true"
+SPECULATION_DEBOUNCE_SECONDS = float(os.getenv("SPECULATION_DEBOUNCE_SECONDS", "3"))
+SPECULATION_TTL = float(os.getenv("SPECULATION_TTL", "900"))
+SPECULATION_MAX_CONVERSATIONS = int(os.getenv("SPECULATION_MAX_CONVERSATIONS", "10000"))
+SPECULATION_MAX_IN_FLIGHT = int(os.getenv("SPECULATION_MAX_IN_FLIGHT", "4"))
+
 # Supabase Configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY", "")
+# Optional direct Postgres connection for the hot prompt queries (needs psycopg2)
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))  # Connections kept open per worker
 
 # Flask Configuration
 FLASK_DEBUG = os.getenv("FLASK_DEBUG", "False").lower() == "true"
@@ -1,7 +1,14 @@
 """
 Parser for conversation JSON format to extract training examples.
 """
-from typing import List, Dict, Tuple
+import gzip
+import json
+import re
+from typing import List, Dict, Iterable, Iterator, Tuple
+
+# Start of the conversations array in a {"conversations": [...]} export
+_WRAPPED_ARRAY_RE = re.compile(r'^\s*\{\s*"conversations"\s*:\s*\[')
+_READ_CHUNK_SIZE = 1 << 20
 
 
 class ConversationParser:
@@ -89,13 +96,79 @@ class ConversationParser:
         Returns:
             Flattened list of all training examples from all conversations
         """
-        all_examples = []
+        return list(ConversationParser.iter_training_examples(conversations))
+    
+    @staticmethod
+    def iter_training_examples(conversations: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Lazily parse conversations into training examples.
         
+        Args:
+            conversations: Any iterable of conversation objects (e.g. a streaming file reader)
+            
+        Yields:
+            Training examples in conversation order
+        """
         for conversation_data in conversations:
-            examples = ConversationParser.parse_conversation(conversation_data)
-            all_examples.extend(examples)
+            yield from ConversationParser.parse_conversation(conversation_data)
+    
+    @staticmethod
+    def iter_conversations_file(path: str) -> Iterator[Dict]:
+        """
+        Stream conversation objects from an export on disk without loading it whole.
         
-        return all_examples
+        Accepts NDJSON (one conversation per line), a JSON array of conversations,
+        or a {"conversations": [...]} object, optionally gzip-compressed (.gz).
+        
+        Args:
+            path: Path to the export file
+            
+        Yields:
+            Conversation objects in file order
+        """
+        opener = gzip.open if path.endswith(".gz") else open
+        decoder = json.JSONDecoder()
+        
+        with opener(path, "rt", encoding="utf-8") as f:
+            buffer, eof, pos = "", False, 0
+            while len(buffer) < 64 and not eof:
+                chunk = f.read(_READ_CHUNK_SIZE)
+                eof = not chunk
+                buffer += chunk
+            
+            # Skip to the first conversation: past "[" or '{"conversations": ['
+            wrapped = _WRAPPED_ARRAY_RE.match(buffer)
+            if wrapped:
+                pos = wrapped.end()
+            elif buffer.lstrip().startswith("["):
+                pos = buffer.index("[") + 1
+            
+            while True:
+                # Skip separators between values (whitespace, commas, NDJSON newlines)
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buffer) and buffer[pos] in "]}":
+                    return
+                if pos >= len(buffer):
+                    if eof:
+                        return
+                    buffer, pos = f.read(_READ_CHUNK_SIZE), 0
+                    eof = not buffer
+                    continue
+                
+                try:
+                    conversation, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    # Value continues past the buffer: read more and retry
+                    chunk = f.read(_READ_CHUNK_SIZE)
+                    eof = not chunk
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+                
+                pos = end
+                yield conversation
     
     @staticmethod
     def format_chat_history_for_prompt(chat_history: List[Dict]) -> str:
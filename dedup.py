@@ -0,0 +1,245 @@
+"""
+Near-duplicate detection for training examples (MinHash + LSH banding).
+
+Exports contain many templated exchanges that teach the prompt nothing new,
+yet each one costs a predict and an editor call. Every example (client
+sequence + consultant reply) gets a MinHash signature over hashed character
+shingles. Signatures are split into bands and bucketed by band, so candidate
+matches are found with a few dict lookups instead of comparing against every
+earlier example. Candidates are then confirmed by their estimated Jaccard
+similarity. Signatures of trained examples are appended to a file on disk, so
+later runs skip what earlier runs already trained on.
+
+The server and train_cli.py runs may share the file. Appends are serialized by
+an exclusive lock on a lock file (POSIX only; on other platforms keep to a
+single writer per directory), and each process picks up signatures appended by
+the others before checking or appending.
+"""
+import hashlib
+import json
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Mersenne prime 2^31 - 1: a * x + b stays below 2^63 for 31-bit a, b and 32-bit x
+_PRIME = np.uint64((1 << 31) - 1)
+
+
+def example_text(example: Dict) -> str:
+    """Text a training example is deduplicated on."""
+    return "\n".join(example["client_sequence"]) + "\n\x1e\n" + example["consultant_reply"]
+
+
+def _example_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class NearDuplicateIndex:
+    """Persistent MinHash LSH index of trained examples."""
+
+    def __init__(self, directory: str, threshold: float = 0.85, num_perm: int = 128,
+                 bands: int = 16, shingle_size: int = 5, seed: int = 1):
+        """
+        Args:
+            directory: Where the signature file and its parameters are stored
+            threshold: Estimated Jaccard similarity at or above which an example is a duplicate
+            num_perm: MinHash signature length
+            bands: LSH bands (num_perm must be divisible by it); more bands catch
+                lower similarities at the cost of more candidate checks
+            shingle_size: Character shingle length
+            seed: Seed of the hash permutations (fixed so signatures stay comparable)
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        os.makedirs(directory, exist_ok=True)
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=(num_perm, 1), dtype=np.uint64)
+
+        self._signatures_path = os.path.join(directory, "signatures.u32")
+        self._params_path = os.path.join(directory, "params.json")
+        self._lock_path = os.path.join(directory, "index.lock")
+        self._lock = threading.Lock()
+        # Bytes of the signature file already loaded
+        self._file_offset = 0
+        self._signatures: List[Optional[np.ndarray]] = []
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        # Example key -> row of examples let through but not yet trained
+        self._pending: Dict[str, int] = {}
+        self._counters = {"checked": 0, "duplicates": 0, "committed": 0, "released": 0}
+        with self._lock, self._file_lock():
+            self._load(seed)
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock on the index directory, shared with other processes."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self, seed: int):
+        params = {"num_perm": self.num_perm, "bands": self.bands,
+                  "shingle_size": self.shingle_size, "seed": seed}
+        if os.path.exists(self._params_path):
+            with open(self._params_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored != params:
+                # Signatures from other parameters aren't comparable; start over
+                print(f"Dedup index parameters changed ({stored} -> {params}), rebuilding")
+                if os.path.exists(self._signatures_path):
+                    os.remove(self._signatures_path)
+        with open(self._params_path, "w", encoding="utf-8") as f:
+            json.dump(params, f)
+        self._read_new_signatures()
+
+    def _read_new_signatures(self) -> bool:
+        """
+        Index signatures appended (by any process) since the last read. Caller holds the lock.
+
+        Returns:
+            Whether the file ends in a partial row (still being written, or left by a crash)
+        """
+        try:
+            size = os.path.getsize(self._signatures_path)
+        except FileNotFoundError:
+            return False
+        if size <= self._file_offset:
+            return False
+        row_bytes = self.num_perm * np.dtype(np.uint32).itemsize
+        with open(self._signatures_path, "rb") as f:
+            f.seek(self._file_offset)
+            data = f.read(size - self._file_offset)
+        whole = len(data) - len(data) % row_bytes
+        for signature in np.frombuffer(data[:whole], dtype=np.uint32).reshape(-1, self.num_perm):
+            self._insert(signature.copy())
+        self._file_offset += whole
+        return whole < len(data)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(1 for s in self._signatures if s is not None)
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (uint32, num_perm) of a text's character shingles."""
+        normalized = " ".join(text.lower().split())
+        k = self.shingle_size
+        shingles = {normalized[i:i + k] for i in range(max(1, len(normalized) - k + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        return ((self._a * hashes + self._b) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _insert(self, signature: np.ndarray) -> int:
+        row = len(self._signatures)
+        self._signatures.append(signature)
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            band.setdefault(key, []).append(row)
+        return row
+
+    def _best_match(self, signature: np.ndarray) -> float:
+        """Highest estimated Jaccard similarity among LSH candidates (0 if none)."""
+        candidates = set()
+        for band, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(band.get(key, ()))
+        best = 0.0
+        for row in candidates:
+            other = self._signatures[row]
+            if other is not None:
+                best = max(best, float(np.mean(other == signature)))
+                if best >= self.threshold:
+                    break
+        return best
+
+    def filter(self, examples: List[Dict]) -> Tuple[List[Dict], int]:
+        """
+        Drop examples that near-duplicate a trained example or an earlier one in `examples`.
+
+        Unique examples are reserved: later calls treat them as seen until they are
+        released. Call commit() once they are trained, or release() if training failed.
+
+        Returns:
+            (unique examples in their original order, number of duplicates dropped)
+        """
+        texts = [example_text(example) for example in examples]
+        signatures = [self.signature(text) for text in texts]
+        unique = []
+        with self._lock:
+            # Include what other processes trained since the last check
+            self._read_new_signatures()
+            for example, text, signature in zip(examples, texts, signatures):
+                self._counters["checked"] += 1
+                key = _example_key(text)
+                if key in self._pending or self._best_match(signature) >= self.threshold:
+                    self._counters["duplicates"] += 1
+                    continue
+                self._pending[key] = self._insert(signature)
+                unique.append(example)
+        return unique, len(examples) - len(unique)
+
+    def commit(self, examples: List[Dict]):
+        """Persist reserved examples that were trained, so later runs skip them too."""
+        with self._lock:
+            rows = [self._pending.pop(_example_key(example_text(e)), None) for e in examples]
+            signatures = [self._signatures[row] for row in rows if row is not None]
+            if signatures:
+                with self._file_lock():
+                    # Our rows go after everything other processes have appended so far
+                    if self._read_new_signatures():
+                        # Nobody else is writing under the lock: the partial row is left by a crash
+                        os.truncate(self._signatures_path, self._file_offset)
+                    with open(self._signatures_path, "ab") as f:
+                        np.stack(signatures).astype(np.uint32).tofile(f)
+                    # Our own rows are indexed already
+                    self._file_offset = os.path.getsize(self._signatures_path)
+                self._counters["committed"] += len(signatures)
+
+    def release(self, examples: List[Dict]):
+        """Forget reserved examples that weren't trained, so a retry isn't a duplicate."""
+        with self._lock:
+            for example in examples:
+                row = self._pending.pop(_example_key(example_text(example)), None)
+                if row is None:
+                    continue
+                signature = self._signatures[row]
+                self._signatures[row] = None
+                for band, key in zip(self._buckets, self._band_keys(signature)):
+                    band[key].remove(row)
+                    if not band[key]:
+                        del band[key]
+                self._counters["released"] += 1
+
+    def settle(self, examples: List[Dict], results: List[Dict]):
+        """Commit or release reserved examples from TrainingPipeline.train_batch results."""
+        self.commit([e for e, r in zip(examples, results) if r["status"] != "error"])
+        self.release([e for e, r in zip(examples, results) if r["status"] == "error"])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["pending"] = len(self._pending)
+        stats["indexed"] = len(self)
+        stats["threshold"] = self.threshold
+        return stats
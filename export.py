@@ -0,0 +1,111 @@
+"""
+Streaming NDJSON export of keyset-paginated tables.
+
+Pages are fetched by a background thread a few pages ahead of the response,
+so the next Supabase round trip overlaps with streaming the current page.
+Memory is bounded by `prefetch` pages regardless of table size.
+"""
+import json
+import queue
+import threading
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+Cursor = Tuple[str, str]
+PageFetcher = Callable[[Optional[Cursor], int], List[Dict]]
+
+_DONE = object()
+
+
+def row_cursor(row: Dict) -> Cursor:
+    """Keyset cursor (created_at, id) of a row."""
+    return row["created_at"], row["id"]
+
+
+def parse_cursor(created_at: str, row_id: str) -> Cursor:
+    """
+    Normalize a client-supplied (created_at, id) cursor.
+
+    The cursor ends up in a PostgREST filter string, so only values rebuilt from a
+    parsed timestamp and UUID are passed on.
+
+    Raises:
+        ValueError: If created_at isn't an ISO 8601 timestamp or id isn't a UUID
+    """
+    return datetime.fromisoformat(created_at).isoformat(), str(uuid.UUID(row_id))
+
+
+def iter_pages(fetch_page: PageFetcher, after: Optional[Cursor] = None, page_size: int = 1000,
+               limit: Optional[int] = None, prefetch: int = 2) -> Iterator[List[Dict]]:
+    """
+    Pages of rows after `after`, fetched ahead of the consumer.
+
+    Args:
+        fetch_page: Function (after, page_size) -> rows ordered by (created_at, id)
+        after: Cursor to resume from, or None to start at the oldest row
+        page_size: Rows per query
+        limit: Stop after this many rows (None for all)
+        prefetch: Pages fetched ahead of the consumer
+
+    Raises:
+        Whatever `fetch_page` raised, once the pages before the failure are consumed
+    """
+    pages: "queue.Queue" = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Give up when the consumer went away (e.g. client disconnected)
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        cursor, remaining = after, limit
+        try:
+            while remaining is None or remaining > 0:
+                size = page_size if remaining is None else min(page_size, remaining)
+                rows = fetch_page(cursor, size)
+                if rows and not put(rows):
+                    return
+                if len(rows) < size:
+                    break
+                cursor = row_cursor(rows[-1])
+                if remaining is not None:
+                    remaining -= len(rows)
+            put(_DONE)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=producer, name="export-prefetch", daemon=True).start()
+    try:
+        while True:
+            item = pages.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def ndjson_export(fetch_page: PageFetcher, after: Optional[Cursor] = None, page_size: int = 1000,
+                  limit: Optional[int] = None, prefetch: int = 2) -> Iterator[str]:
+    """
+    NDJSON lines for every row after `after`, one page at a time.
+
+    A failure mid-export can't change the HTTP status any more, so it ends the
+    stream with an `{"error": ...}` line; clients resume from the last row's
+    (created_at, id).
+    """
+    try:
+        for rows in iter_pages(fetch_page, after, page_size, limit, prefetch):
+            yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+    except Exception as e:
+        print(f"Error during export: {e}")
+        yield json.dumps({"error": str(e)}) + "\n"
@@ -2,9 +2,92 @@
 Gemini API client wrapper.
 """
 import google.generativeai as genai
-from config import GEMINI_API_KEY, GEMINI_MODEL
-from typing import List, Dict, Optional
+from google.api_core import exceptions as google_exceptions
+from config import (
+    GEMINI_API_KEY, GEMINI_API_KEYS, GEMINI_KEY_STRATEGY, GEMINI_KEY_EJECT_SECONDS, GEMINI_MODEL, GEMINI_RPM_LIMIT, GEMINI_TPM_LIMIT,
+    GEMINI_MAX_CONCURRENCY, GEMINI_QUEUE_TIMEOUT, GEMINI_MAX_RETRIES,
+    GEMINI_RETRY_BASE_DELAY, GEMINI_RETRY_MAX_DELAY, SCHEDULER_WEIGHT_INTERACTIVE,
+    SCHEDULER_WEIGHT_MANUAL, SCHEDULER_WEIGHT_BULK, SCHEDULER_RESERVED_INTERACTIVE_SLOTS,
+    SCHEDULER_BULK_QUEUE_TIMEOUT, GEMINI_HEDGE_ENABLED, GEMINI_HEDGE_PERCENTILE,
+    GEMINI_HEDGE_BUDGET, GEMINI_HEDGE_MIN_SAMPLES, GEMINI_REPLY_MODEL,
+    GEMINI_REPLY_FALLBACK_MODEL, GEMINI_EDITOR_MODEL, GEMINI_EDITOR_FALLBACK_MODEL,
+    GEMINI_REPLY_SLO_MS, GEMINI_EDITOR_SLO_MS, GEMINI_ROUTE_COOLDOWN, GEMINI_REPLY_TIMEOUT,
+    GEMINI_EDITOR_TIMEOUT, GEMINI_BREAKER_FAILURE_RATIO, GEMINI_BREAKER_WINDOW,
+    GEMINI_BREAKER_MIN_CALLS, GEMINI_BREAKER_OPEN_SECONDS, GEMINI_BREAKER_HALF_OPEN_PROBES,
+    GEMINI_PRICING, GEMINI_PROMPT_TOKEN_LIMIT, GEMINI_PROMPT_OVERFLOW
+)
+from circuit_breaker import CircuitBreakerRegistry, GeminiUnavailable
+from hedging import Hedger
+from key_pool import KeyPool
+from model_router import ModelRoute, ModelRouter
+from rate_limiter import RateLimitExceeded, RetryPolicy, estimate_tokens
+from scheduler import PriorityScheduler, INTERACTIVE, MANUAL, BULK
+from single_flight import SingleFlight
+from usage import UsageTracker
+from typing import List, Dict, Optional, Sequence
+import hashlib
 import json
+import re
+import threading
+import time
+
+import numpy as np
+
+# HTTP statuses worth retrying: throttling and transient server-side failures
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# 503 is what Gemini returns when the model is overloaded, so it also backs off concurrency
+THROTTLE_STATUS_CODES = {429, 503}
+# Only quota throttling is specific to an API key; a 503 overload hits every key alike
+KEY_QUOTA_STATUS_CODES = {429}
+# Errors that count against a model's circuit breaker. Quota throttling (429) is left to the
+# rate limiter and key pool: a busy quota doesn't mean the model is unhealthy
+BREAKER_FAILURE_STATUS_CODES = RETRYABLE_STATUS_CODES - {429}
+
+# Task names used for model routing
+TASK_GENERATE_REPLY = "generate_reply"
+TASK_IMPROVE_PROMPT = "improve_prompt"
+TASK_MANUAL_UPDATE = "manual_prompt_update"
+TASK_COMPACT_PROMPT = "compact_prompt"
+
+_RETRY_DELAY_PATTERNS = (
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+    re.compile(r"retry in ([\d.]+)s", re.IGNORECASE),
+)
+
+
+class PromptTooLarge(Exception):
+    """Raised when an assembled prompt exceeds GEMINI_PROMPT_TOKEN_LIMIT."""
+
+    def __init__(self, message: str, tokens: int, limit: int):
+        super().__init__(message)
+        self.tokens = tokens
+        self.limit = limit
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """HTTP status of a google-api-core error, if it has one."""
+    if isinstance(error, google_exceptions.GoogleAPICallError):
+        return error.code
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Extract the server-requested delay from a Retry-After header or RetryInfo."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers and headers.get("Retry-After"):
+        try:
+            return float(headers["Retry-After"])
+        except ValueError:
+            pass
+
+    message = str(error)
+    for pattern in _RETRY_DELAY_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
 
 
 class GeminiClient:
@@ -15,18 +98,274 @@ class GeminiClient:
         if not GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY is not set. This should have been caught in config.py")
         
+        # Global key, used for embeddings; generation goes through the key pool
         genai.configure(api_key=GEMINI_API_KEY)
         
         # Use the model from config
         self.model_name = GEMINI_MODEL if GEMINI_MODEL else "gemini-1.5-flash-latest"
-        self.model = genai.GenerativeModel(self.model_name)
 
+        # Fast model for live replies, stronger one for prompt editing
+        editor_route = ModelRoute(
+            primary=GEMINI_EDITOR_MODEL,
+            fallback=GEMINI_EDITOR_FALLBACK_MODEL,
+            latency_slo=GEMINI_EDITOR_SLO_MS / 1000.0,
+            timeout=GEMINI_EDITOR_TIMEOUT
+        )
+        self.router = ModelRouter(
+            routes={
+                TASK_GENERATE_REPLY: ModelRoute(
+                    primary=GEMINI_REPLY_MODEL or self.model_name,
+                    fallback=GEMINI_REPLY_FALLBACK_MODEL,
+                    latency_slo=GEMINI_REPLY_SLO_MS / 1000.0,
+                    timeout=GEMINI_REPLY_TIMEOUT
+                ),
+                TASK_IMPROVE_PROMPT: editor_route,
+                TASK_MANUAL_UPDATE: editor_route,
+                TASK_COMPACT_PROMPT: editor_route
+            },
+            cooldown=GEMINI_ROUTE_COOLDOWN
+        )
+        # Fail fast instead of queueing on a model that is down or far over its SLO
+        self.breakers = CircuitBreakerRegistry(
+            failure_ratio=GEMINI_BREAKER_FAILURE_RATIO,
+            window=GEMINI_BREAKER_WINDOW,
+            min_calls=GEMINI_BREAKER_MIN_CALLS,
+            open_duration=GEMINI_BREAKER_OPEN_SECONDS,
+            half_open_probes=GEMINI_BREAKER_HALF_OPEN_PROBES
+        )
+
+        # Client-side quota enforcement per API key, and retry/backoff
+        self.key_pool = KeyPool(
+            api_keys=GEMINI_API_KEYS,
+            rpm=GEMINI_RPM_LIMIT,
+            tpm=GEMINI_TPM_LIMIT,
+            max_concurrency=GEMINI_MAX_CONCURRENCY,
+            queue_timeout=GEMINI_QUEUE_TIMEOUT,
+            strategy=GEMINI_KEY_STRATEGY,
+            eject_seconds=GEMINI_KEY_EJECT_SECONDS
+        )
+        self.retry_policy = RetryPolicy(
+            max_retries=GEMINI_MAX_RETRIES,
+            base_delay=GEMINI_RETRY_BASE_DELAY,
+            max_delay=GEMINI_RETRY_MAX_DELAY
+        )
+        # Interactive replies go first; bulk training uses whatever capacity is left
+        self.scheduler = PriorityScheduler(
+            capacity=lambda: self.key_pool.capacity,
+            weights={
+                INTERACTIVE: SCHEDULER_WEIGHT_INTERACTIVE,
+                MANUAL: SCHEDULER_WEIGHT_MANUAL,
+                BULK: SCHEDULER_WEIGHT_BULK
+            },
+            queue_timeouts={
+                INTERACTIVE: GEMINI_QUEUE_TIMEOUT,
+                MANUAL: GEMINI_QUEUE_TIMEOUT,
+                BULK: SCHEDULER_BULK_QUEUE_TIMEOUT
+            },
+            reserved_interactive_slots=SCHEDULER_RESERVED_INTERACTIVE_SLOTS
+        )
+        # Coalesces identical concurrent generate_reply calls (double-sends, webhook retries)
+        self.reply_flights = SingleFlight()
+        # Optional hedging of interactive replies to cut tail latency
+        self.hedge_enabled = GEMINI_HEDGE_ENABLED
+        self.hedger = Hedger(
+            percentile=GEMINI_HEDGE_PERCENTILE,
+            budget_ratio=GEMINI_HEDGE_BUDGET,
+            min_samples=GEMINI_HEDGE_MIN_SAMPLES,
+            max_workers=2 * GEMINI_MAX_CONCURRENCY * len(GEMINI_API_KEYS)
+        )
+        # Token/cost accounting and the optional prompt size guard
+        self.usage = UsageTracker(pricing=GEMINI_PRICING)
+        self.prompt_token_limit = GEMINI_PROMPT_TOKEN_LIMIT
+        self.prompt_overflow = GEMINI_PROMPT_OVERFLOW
+        self._guard_lock = threading.Lock()
+        self._guard_counters = {"truncated": 0, "rejected": 0}
+
+    def _count_guard(self, name: str):
+        with self._guard_lock:
+            self._guard_counters[name] += 1
+
+    def _check_prompt_size(self, prompt: str, task: str):
+        """Reject prompts over the token limit before any quota is spent on them."""
+        if not self.prompt_token_limit:
+            return
+        tokens = estimate_tokens(prompt)
+        if tokens > self.prompt_token_limit:
+            self._count_guard("rejected")
+            raise PromptTooLarge(
+                f"Prompt for {task} is about {tokens} tokens, over the limit of "
+                f"{self.prompt_token_limit}",
+                tokens=tokens, limit=self.prompt_token_limit
+            )
 
-    def generate_reply(self, system_prompt: str, client_sequence: List[str],
-                       chat_history: Optional[List[Dict]] = None) -> str:
+    def _generate(self, prompt: str, task: str, priority: str = INTERACTIVE) -> str:
         """
-        Generate a reply using Gemini.
+        Generate with the model routed for `task`, falling back to the alternate model.
+
+        A non-final candidate gets a single attempt so a failing primary doesn't
+        burn the whole retry budget before the fallback is tried.
+
+        Returns:
+            The stripped response text
+
+        Raises:
+            RateLimitExceeded: if we stay throttled after all retries
+            GeminiUnavailable: if the circuit of every candidate model is open
+            PromptTooLarge: if the prompt is over GEMINI_PROMPT_TOKEN_LIMIT
+        """
+        self._check_prompt_size(prompt, task)
+        candidates = self.router.candidates(task)
+        for index, model_name in enumerate(candidates):
+            last = index == len(candidates) - 1
+            try:
+                return self._generate_with_model(
+                    model_name, prompt, task, priority,
+                    max_retries=self.retry_policy.max_retries if last else 0
+                )
+            except GeminiUnavailable:
+                if last:
+                    retry_after = min(self.breakers.get(m).retry_after() for m in candidates)
+                    raise GeminiUnavailable(
+                        f"Gemini is unavailable for {task} (circuit open for {', '.join(candidates)})",
+                        retry_after=max(1.0, retry_after)
+                    )
+                self.router.record_fallback()
+            except Exception as e:
+                if last or not (isinstance(e, RateLimitExceeded)
+                                or _status_code(e) in RETRYABLE_STATUS_CODES):
+                    raise
+                self.router.record_fallback()
+                print(f"Gemini {model_name} failed for {task}, falling back: {e}")
+
+    def _generate_with_model(self, model_name: str, prompt: str, task: str,
+                             priority: str, max_retries: int) -> str:
+        """
+        Call generate_content under the scheduler and a pooled key's rate limiter,
+        retrying transient errors.
+
+        Each attempt queues separately, so calls sleeping in backoff don't hold a slot,
+        and picks its key again, so a retry after throttling lands on another key.
+        Every attempt first asks the model's circuit breaker, so an outage stops the
+        retry loop instead of sleeping through it.
+        """
+        route = self.router.routes[task]
+        request_options = {"timeout": route.timeout} if route.timeout else None
+        breaker = self.breakers.get(model_name)
+        estimated_tokens = estimate_tokens(prompt)
+        attempt = 0
+
+        while True:
+            if not breaker.acquire():
+                raise GeminiUnavailable(
+                    f"Circuit open for {model_name}", retry_after=breaker.retry_after()
+                )
+            key = self.key_pool.select()
+            model = key.model(model_name)
+            try:
+                with self.scheduler.slot(priority), key.rate_limiter.slot(estimated_tokens):
+                    started = time.monotonic()
+                    try:
+                        response = model.generate_content(prompt, request_options=request_options)
+                        text = response.text.strip()
+                    except Exception as e:
+                        error = e
+                        self.usage.record(model_name, task, time.monotonic() - started, ok=False)
+                    else:
+                        latency = time.monotonic() - started
+                        metadata = getattr(response, "usage_metadata", None)
+                        self.usage.record(
+                            model_name, task, latency,
+                            input_tokens=getattr(metadata, "prompt_token_count", 0) or 0,
+                            output_tokens=getattr(metadata, "candidates_token_count", 0) or 0
+                        )
+                        key.rate_limiter.on_success()
+                        self.router.record(task, model_name, latency, ok=True)
+                        breaker.record(ok=True, slow=route.latency_slo is not None
+                                       and latency > route.latency_slo)
+                        return text
+            except RateLimitExceeded:
+                # Timed out in our own queue; the model was never called
+                breaker.release()
+                raise
+
+            status = _status_code(error)
+            if status in BREAKER_FAILURE_STATUS_CODES:
+                breaker.record(ok=False)
+            else:
+                # Throttling and request errors (400 etc.) say nothing about the model's health
+                breaker.release()
+            retry_after = _retry_after_seconds(error)
+            throttled = status in THROTTLE_STATUS_CODES
+            if throttled:
+                key.rate_limiter.on_throttle(retry_after)
+            key_throttled = status in KEY_QUOTA_STATUS_CODES
+            if key_throttled:
+                self.key_pool.eject(key, retry_after)
+            if status in RETRYABLE_STATUS_CODES:
+                self.router.record(task, model_name, time.monotonic() - started, ok=False)
+
+            if status not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+                if throttled:
+                    raise RateLimitExceeded(
+                        f"Gemini is throttling requests ({model_name}): {error}",
+                        retry_after=retry_after or self.retry_policy.max_delay
+                    ) from error
+                raise error
+
+            key.rate_limiter.on_retry()
+            if not (key_throttled and self.key_pool.has_available()):
+                # No need to back off when another key can take the retry right away
+                time.sleep(self.retry_policy.delay(attempt, retry_after))
+            attempt += 1
+
+    def embed_texts(self, texts: Sequence[str], model: str) -> np.ndarray:
+        """
+        Embed texts with a Gemini embedding model.
+
+        Returns:
+            L2-normalized float32 array of shape (len(texts), dim)
         """
+        result = genai.embed_content(model=model, content=list(texts),
+                                     task_type="semantic_similarity")
+        vectors = np.asarray(result["embedding"], dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[np.newaxis, :]
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def stats(self) -> Dict:
+        """Runtime counters for the /metrics endpoint."""
+        return {
+            "model": self.model_name,
+            "routing": self.router.stats(),
+            "circuit_breakers": self.breakers.stats(),
+            "key_pool": self.key_pool.stats(),
+            "scheduler": self.scheduler.stats(),
+            "reply_coalescing": self.reply_flights.stats(),
+            "hedging": dict(self.hedger.stats(), enabled=self.hedge_enabled),
+            "prompt_guard": dict(self._guard_counters, limit=self.prompt_token_limit or None,
+                                 overflow=self.prompt_overflow),
+            "usage": self.usage.totals()
+        }
+
+
+    @staticmethod
+    def _build_reply_prompt(system_prompt: str, client_sequence: List[str],
+                            chat_history: Optional[List[Dict]],
+                            examples: Optional[List[Dict]]) -> str:
+        """Assemble the reply prompt: system prompt, few-shot examples, then the conversation."""
+        # Build the few-shot block from similar past consultant replies
+        few_shot = ""
+        if examples:
+            example_parts = []
+            for example in examples:
+                example_parts.extend(f"Client: {msg}" for msg in example["client_sequence"])
+                example_parts.append(f"Consultant: {example['consultant_reply']}")
+                example_parts.append("")
+            few_shot = (
+                "\n\nSimilar past conversations (real consultant replies, for reference only):\n"
+                + "\n".join(example_parts).rstrip()
+            )
+
         # Build the user message
         user_message_parts = []
 
@@ -42,11 +381,57 @@ class GeminiClient:
         user_message = "\n".join(user_message_parts)
 
         # Build full prompt
-        full_prompt = f"{system_prompt}\n\nConversation:\n{user_message}\n\nConsultant Reply:"
+        return f"{system_prompt}{few_shot}\n\nConversation:\n{user_message}\n\nConsultant Reply:"
+
+    def _truncate_reply_prompt(self, full_prompt: str, system_prompt: str,
+                               client_sequence: List[str], chat_history: Optional[List[Dict]],
+                               examples: Optional[List[Dict]]) -> str:
+        """
+        Shrink an over-limit reply prompt: drop the least similar few-shot examples first,
+        then the oldest chat history. Whatever is still too large is rejected later.
+        """
+        examples = list(examples or [])
+        chat_history = list(chat_history or [])
+        truncated = False
+        while estimate_tokens(full_prompt) > self.prompt_token_limit and (examples or chat_history):
+            if examples:
+                examples.pop()
+            else:
+                chat_history.pop(0)
+            truncated = True
+            full_prompt = self._build_reply_prompt(system_prompt, client_sequence, chat_history, examples)
+        if truncated:
+            self._count_guard("truncated")
+        return full_prompt
+
+    def generate_reply(self, system_prompt: str, client_sequence: List[str],
+                       chat_history: Optional[List[Dict]] = None,
+                       priority: str = INTERACTIVE, hedge: Optional[bool] = None,
+                       examples: Optional[List[Dict]] = None) -> str:
+        """
+        Generate a reply using Gemini.
+
+        `priority` is the scheduling class (interactive, manual or bulk).
+        `hedge` overrides GEMINI_HEDGE_ENABLED; only interactive calls are hedged.
+        `examples` are similar past exchanges (client_sequence, consultant_reply)
+        included as few-shot context.
+        """
+        full_prompt = self._build_reply_prompt(system_prompt, client_sequence, chat_history, examples)
+        if self.prompt_token_limit and self.prompt_overflow == "truncate":
+            full_prompt = self._truncate_reply_prompt(
+                full_prompt, system_prompt, client_sequence, chat_history, examples
+            )
+
+        # The full prompt covers both the prompt version and the conversation
+        flight_key = hashlib.sha256(full_prompt.encode("utf-8")).hexdigest()
+
+        call = lambda: self._generate(full_prompt, TASK_GENERATE_REPLY, priority)
+        if (self.hedge_enabled if hedge is None else hedge) and priority == INTERACTIVE:
+            unhedged = call
+            call = lambda: self.hedger.run(unhedged)
 
         try:
-            response = self.model.generate_content(full_prompt)
-            reply_text = response.text.strip()
+            reply_text, _ = self.reply_flights.do(flight_key, call)
 
             # If model returns JSON
             if reply_text.startswith("{") and "reply" in reply_text:
@@ -58,6 +443,8 @@ class GeminiClient:
 
             return reply_text
 
+        except (RateLimitExceeded, GeminiUnavailable, PromptTooLarge):
+            raise
         except Exception as e:
             raise Exception(
                 f"Error generating reply with Gemini ({self.model_name}): {str(e)}"
@@ -66,9 +453,13 @@ class GeminiClient:
 
     def improve_prompt(self, editor_prompt: str, existing_prompt: str,
                        client_sequence: List[str], chat_history: List[Dict],
-                       real_consultant_reply: str, predicted_ai_reply: str) -> str:
+                       real_consultant_reply: str, predicted_ai_reply: str,
+                       priority: str = MANUAL, base_prompt: Optional[str] = None) -> str:
         """
         Auto-improve the system prompt based on differences between real vs AI reply.
+
+        When `base_prompt` is given, `existing_prompt` is a scenario shard: the base
+        is shown as read-only context and only the shard is rewritten.
         """
         history_text = ""
         if chat_history:
@@ -78,10 +469,17 @@ class GeminiClient:
 
         client_text = "\n".join([f"Client: {msg}" for msg in client_sequence])
 
+        base_section = ""
+        if base_prompt:
+            base_section = f"""Shared Base Prompt (read-only context; do not repeat its rules):
+{base_prompt}
+
+"""
+
         improvement_request = f"""Editor Prompt:
 {editor_prompt}
 
-Current System Prompt:
+{base_section}Current System Prompt:
 {existing_prompt}
 
 Conversation Context:
@@ -102,8 +500,7 @@ Please analyze and improve the prompt. Output only JSON:
 """
 
         try:
-            response = self.model.generate_content(improvement_request)
-            reply_text = response.text.strip()
+            reply_text = self._generate(improvement_request, TASK_IMPROVE_PROMPT, priority)
 
             if reply_text.startswith("{"):
                 try:
@@ -114,6 +511,8 @@ Please analyze and improve the prompt. Output only JSON:
 
             return reply_text
 
+        except (RateLimitExceeded, GeminiUnavailable, PromptTooLarge):
+            raise
         except Exception as e:
             raise Exception(
                 f"Error improving prompt with Gemini ({self.model_name}): {str(e)}"
@@ -121,7 +520,7 @@ Please analyze and improve the prompt. Output only JSON:
 
 
     def manual_prompt_update(self, editor_prompt: str, existing_prompt: str,
-                             instructions: str) -> str:
+                             instructions: str, priority: str = MANUAL) -> str:
         """
         Developer manually updates the system prompt using the editor prompt.
         """
@@ -139,8 +538,7 @@ Return only JSON:
 """
 
         try:
-            response = self.model.generate_content(update_request)
-            reply_text = response.text.strip()
+            reply_text = self._generate(update_request, TASK_MANUAL_UPDATE, priority)
 
             if reply_text.startswith("{"):
                 try:
@@ -151,12 +549,56 @@ Return only JSON:
 
             return reply_text
 
+        except (RateLimitExceeded, GeminiUnavailable, PromptTooLarge):
+            raise
         except Exception as e:
             raise Exception(
                 f"Error manually updating prompt with Gemini ({self.model_name}): {str(e)}"
             )
 
 
+    def compact_prompt(self, editor_prompt: str, existing_prompt: str,
+                       token_budget: int, priority: str = BULK) -> str:
+        """
+        Rewrite the system prompt into a deduplicated, consolidated form within a token budget.
+        """
+        compaction_request = f"""Editor Prompt:
+{editor_prompt}
+
+Current System Prompt:
+{existing_prompt}
+
+Task:
+The system prompt has grown to about {estimate_tokens(existing_prompt)} tokens.
+Rewrite it in at most {token_budget} tokens:
+- Merge duplicate and overlapping rules into one
+- Remove rules that restate other rules
+- Keep every distinct instruction, fact, tone guideline and the required output format
+
+Return only JSON:
+{{ "prompt": "<compacted prompt>" }}
+"""
+
+        try:
+            reply_text = self._generate(compaction_request, TASK_COMPACT_PROMPT, priority)
+
+            if reply_text.startswith("{"):
+                try:
+                    parsed = json.loads(reply_text)
+                    return parsed.get("prompt", existing_prompt)
+                except json.JSONDecodeError:
+                    pass
+
+            return reply_text
+
+        except (RateLimitExceeded, GeminiUnavailable, PromptTooLarge):
+            raise
+        except Exception as e:
+            raise Exception(
+                f"Error compacting prompt with Gemini ({self.model_name}): {str(e)}"
+            )
+
+
 
 ##old code from cursor
 '''
@@ -0,0 +1,119 @@
+"""
+Hedged requests to cut tail latency.
+
+If a call hasn't finished by an adaptive percentile of recent latencies, a
+duplicate is fired and whichever finishes first wins. The number of extra
+calls is capped by a budget expressed as a fraction of all requests.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+from latency import LatencyWindow
+
+
+class Hedger:
+    """Runs a call with an optional hedge after an adaptive delay."""
+
+    def __init__(self, percentile: float = 95.0, budget_ratio: float = 0.05,
+                 min_samples: int = 20, min_delay: float = 0.1, max_workers: int = 16):
+        """
+        Args:
+            percentile: Latency percentile after which the hedge fires
+            budget_ratio: Max hedges as a fraction of requests (e.g. 0.05 = 5%)
+            min_samples: Samples needed before hedging starts (threshold unknown before)
+            min_delay: Lower bound on the hedge delay in seconds
+            max_workers: Threads available for primary and hedge calls
+        """
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies = LatencyWindow()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        # Budget credits accrue per request; a hedge spends one. Capped to limit bursts.
+        self._credits = 0.0
+        self._max_credits = max(1.0, budget_ratio * 100)
+        self._counters = {"requests": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0,
+                          "budget_exhausted": 0}
+
+    def threshold(self) -> Optional[float]:
+        """Current hedge delay in seconds, or None while there is too little data."""
+        if len(self.latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, self.latencies.percentile(self.percentile))
+
+    def _timed(self, fn: Callable[[], Any]) -> Callable[[], Any]:
+        def run():
+            started = time.monotonic()
+            result = fn()
+            self.latencies.record(time.monotonic() - started)
+            return result
+        return run
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self._credits >= 1.0:
+                self._credits -= 1.0
+                return True
+            self._counters["budget_exhausted"] += 1
+            return False
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def run(self, fn: Callable[[], Any]) -> Any:
+        """
+        Execute `fn`, hedging it if it runs past the latency threshold.
+
+        The losing call is cancelled if it hasn't started yet; a call already
+        talking to Gemini can't be interrupted, so its result is discarded.
+        """
+        with self._lock:
+            self._counters["requests"] += 1
+            self._credits = min(self._max_credits, self._credits + self.budget_ratio)
+
+        timed = self._timed(fn)
+        delay = self.threshold()
+        if delay is None:
+            return timed()
+
+        primary = self._executor.submit(contextvars.copy_context().run, timed)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_budget():
+            return primary.result()
+
+        self._count("hedged")
+        hedge = self._executor.submit(contextvars.copy_context().run, timed)
+        pending = {primary, hedge}
+        failed = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # Both may finish in the same round: any success beats a failure
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    self._count("hedge_wins" if future is hedge else "primary_wins")
+                    return future.result()
+            failed.extend(done)
+        # Both attempts failed; report the one that failed first
+        return failed[0].result()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+        requests = stats["requests"]
+        hedged = stats["hedged"]
+        threshold = self.threshold()
+        stats.update({
+            "hedge_rate": round(hedged / requests, 4) if requests else 0.0,
+            "hedge_win_rate": round(stats["hedge_wins"] / hedged, 4) if hedged else 0.0,
+            "threshold_ms": round(threshold * 1000, 1) if threshold is not None else None,
+            "latency": self.latencies.summary()
+        })
+        return stats
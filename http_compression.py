@@ -0,0 +1,236 @@
+"""
+gzip/zstd request decoding and negotiated response compression.
+
+Request bodies sent with `Content-Encoding: gzip` (or `zstd`) are decoded
+chunk by chunk before Flask sees them, and decoding stops with 413 as soon as
+the decoded size passes the limit, so a small compressed upload can't expand
+into an unbounded body. Responses are compressed when the client's
+Accept-Encoding allows it and the body is large enough to be worth it;
+streamed responses are compressed on the fly.
+
+zstd needs the optional `zstandard` package; without it only gzip is offered.
+"""
+import gzip
+import io
+import json
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from flask import Flask, Response, request
+from werkzeug.wsgi import LimitedStream
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = "gzip"
+ZSTD = "zstd"
+IDENTITY = "identity"
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+class BodyTooLarge(Exception):
+    """Decoded request body exceeded the configured limit."""
+
+
+class UnsupportedEncoding(ValueError):
+    """Request body uses a Content-Encoding this server can't decode."""
+
+
+def supported_encodings() -> List[str]:
+    """Content codings this server can decode and produce, in order of preference."""
+    return [ZSTD, GZIP] if zstandard is not None else [GZIP]
+
+
+def _decoder(encoding: str):
+    """Incremental decoder exposing decompress(data, max_length) and unconsumed_tail."""
+    if encoding in (GZIP, "x-gzip"):
+        # 16 + MAX_WBITS: expect a gzip header and trailer
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return zlib.decompressobj()
+    return None
+
+
+def decode_stream(stream, encoding: str, max_size: int) -> bytes:
+    """
+    Decode a compressed body incrementally.
+
+    Args:
+        stream: File-like object with the encoded body
+        encoding: Content-Encoding value (gzip, deflate or zstd)
+        max_size: Maximum decoded size in bytes
+
+    Returns:
+        The decoded body
+
+    Raises:
+        BodyTooLarge: If the decoded body would exceed max_size
+        UnsupportedEncoding: If the encoding can't be decoded here
+        ValueError: If the body is corrupt
+    """
+    output = io.BytesIO()
+
+    def write(data: bytes):
+        if output.tell() + len(data) > max_size:
+            raise BodyTooLarge(f"Decoded request body exceeds {max_size} bytes")
+        output.write(data)
+
+    if encoding == ZSTD:
+        if zstandard is None:
+            raise UnsupportedEncoding("zstd request bodies need the zstandard package")
+        try:
+            reader = zstandard.ZstdDecompressor().stream_reader(stream)
+            while True:
+                chunk = reader.read(_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                write(chunk)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid zstd body: {e}")
+        return output.getvalue()
+
+    decoder = _decoder(encoding)
+    if decoder is None:
+        raise UnsupportedEncoding(f"Unsupported Content-Encoding: {encoding}")
+    try:
+        while True:
+            chunk = stream.read(_READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            # Bounded output per step, so a compression bomb is caught before it is inflated
+            data = decoder.decompress(chunk, _READ_CHUNK_SIZE)
+            write(data)
+            while decoder.unconsumed_tail:
+                write(decoder.decompress(decoder.unconsumed_tail, _READ_CHUNK_SIZE))
+        write(decoder.flush())
+    except zlib.error as e:
+        raise ValueError(f"Invalid {encoding} body: {e}")
+    if not decoder.eof:
+        raise ValueError(f"Truncated {encoding} body")
+    return output.getvalue()
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Best supported coding from an Accept-Encoding header, or None for identity."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        fields = part.strip().split(";")
+        coding = fields[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    for coding in supported_encodings():
+        if weights.get(coding, weights.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=min(level, 19)).compress(data)
+    return gzip.compress(data, compresslevel=min(level, 9))
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str, level: int) -> Iterator[bytes]:
+    """Compress a streamed response, flushing after each chunk so rows arrive promptly."""
+    if encoding == ZSTD:
+        compressor = zstandard.ZstdCompressor(level=min(level, 19)).compressobj()
+        flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            yield data + compressor.flush(flush_block)
+        yield compressor.flush()
+        return
+    compressor = zlib.compressobj(min(level, 9), zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        yield data + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+class DecompressionMiddleware:
+    """WSGI middleware that decodes compressed request bodies before Flask parses them."""
+
+    def __init__(self, wsgi_app: Callable, max_size: int):
+        """
+        Args:
+            wsgi_app: The wrapped WSGI application
+            max_size: Maximum decoded request body size in bytes
+        """
+        self.wsgi_app = wsgi_app
+        self.max_size = max_size
+
+    def __call__(self, environ: Dict, start_response: Callable):
+        encoding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if encoding and encoding != IDENTITY:
+            stream = environ["wsgi.input"]
+            if environ.get("CONTENT_LENGTH"):
+                # Don't read past the body on keep-alive connections
+                stream = LimitedStream(stream, int(environ["CONTENT_LENGTH"]))
+            try:
+                body = decode_stream(stream, encoding, self.max_size)
+            except BodyTooLarge as e:
+                return self._error(start_response, "413 Request Entity Too Large", str(e))
+            except UnsupportedEncoding as e:
+                return self._error(start_response, "415 Unsupported Media Type", str(e))
+            except ValueError as e:
+                return self._error(start_response, "400 Bad Request", str(e))
+            environ["wsgi.input"] = io.BytesIO(body)
+            environ["CONTENT_LENGTH"] = str(len(body))
+            environ.pop("HTTP_CONTENT_ENCODING", None)
+        return self.wsgi_app(environ, start_response)
+
+    @staticmethod
+    def _error(start_response: Callable, status: str, message: str):
+        body = json.dumps({"error": message}).encode("utf-8")
+        headers = [("Content-Type", "application/json"), ("Content-Length", str(len(body)))]
+        if status.startswith("415"):
+            headers.append(("Accept-Encoding", ", ".join(supported_encodings())))
+        start_response(status, headers)
+        return [body]
+
+
+def enable_compression(app: Flask, max_request_size: int, min_response_size: int = 1024,
+                       level: int = 6):
+    """
+    Decode compressed request bodies and compress large responses for `app`.
+
+    Args:
+        app: Flask application
+        max_request_size: Maximum decoded request body size in bytes
+        min_response_size: Responses smaller than this are sent uncompressed
+        level: Compression level (capped at 9 for gzip)
+    """
+    app.wsgi_app = DecompressionMiddleware(app.wsgi_app, max_request_size)
+
+    @app.after_request
+    def compress_response(response: Response) -> Response:
+        response.vary.add("Accept-Encoding")
+        if "Content-Encoding" in response.headers or response.status_code < 200 \
+                or response.status_code in (204, 304) or request.method == "HEAD":
+            return response
+        encoding = negotiate(request.headers.get("Accept-Encoding", ""))
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, level)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < min_response_size:
+                return response
+            response.set_data(compress(data, encoding, level))
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,120 @@
+"""
+Idempotency-Key handling for retried webhook requests.
+
+The first request with a key runs the handler. A retry arriving while it is
+still running waits for the same result; a retry arriving afterwards gets the
+stored result. Failed runs are forgotten so the next retry starts fresh.
+Completed results are kept for `ttl` seconds, up to `max_entries` (oldest
+evicted first).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class IdempotencyConflict(Exception):
+    """Raised when a key is reused with a different request body."""
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "result", "error", "completed_at")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.completed_at: Optional[float] = None
+
+
+class IdempotencyStore:
+    """Bounded store of in-flight and completed results by idempotency key."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400.0):
+        """
+        Args:
+            max_entries: Completed results kept; in-flight entries are never evicted
+            ttl: Seconds a completed result is replayed for
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._in_flight: Dict[str, _Entry] = {}
+        # Completed entries in completion order, so eviction only looks at the front
+        self._completed: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "executed": 0, "replayed": 0, "joined": 0,
+                          "conflicts": 0, "evictions": 0}
+
+    def _evict(self):
+        """Drop expired and overflowing completed entries. Caller holds the lock."""
+        expired_before = time.time() - self.ttl
+        while self._completed:
+            oldest = next(iter(self._completed.values()))
+            if len(self._completed) <= self.max_entries and oldest.completed_at >= expired_before:
+                break
+            self._completed.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def run(self, key: str, fingerprint: str, fn: Callable[[], Any],
+            keep: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, bool]:
+        """
+        Run `fn` at most once per key.
+
+        Args:
+            key: Idempotency key (scoped by the caller, e.g. per endpoint)
+            fingerprint: Hash of the request body; a retry must match it
+            fn: Zero-argument function producing the result
+            keep: Decides whether a result is stored for replay (default: always)
+
+        Returns:
+            (result, replayed) where replayed is True if the result came from an earlier request
+
+        Raises:
+            IdempotencyConflict: if the key was used with a different request body
+        """
+        with self._lock:
+            self._counters["requests"] += 1
+            self._evict()
+            entry = self._completed.get(key) or self._in_flight.get(key)
+            if entry is not None and entry.fingerprint != fingerprint:
+                self._counters["conflicts"] += 1
+                raise IdempotencyConflict(
+                    "Idempotency-Key was already used with a different request body"
+                )
+            if entry is None:
+                entry = self._in_flight[key] = _Entry(fingerprint)
+                self._counters["executed"] += 1
+                leader = True
+            else:
+                self._counters["replayed" if entry.completed_at is not None else "joined"] += 1
+                leader = False
+
+        if not leader:
+            entry.done.wait()
+            if entry.error is not None:
+                raise entry.error
+            return entry.result, True
+
+        try:
+            entry.result = fn()
+        except Exception as e:
+            # Forget failures so the sender's next retry runs again
+            entry.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                if entry.error is None and (keep is None or keep(entry.result)):
+                    entry.completed_at = time.time()
+                    self._completed[key] = entry
+                    self._evict()
+            entry.done.set()
+        return entry.result, False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["in_flight"] = len(self._in_flight)
+            stats["stored"] = len(self._completed)
+        return stats
@@ -25,8 +25,62 @@ CREATE TABLE IF NOT EXISTS training_examples (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Table for storing per-scenario prompt shards (with versioning)
+-- The live system prompt for a conversation is the latest base prompt plus the
+-- latest shard for its scenario (only used when PROMPT_SHARDING_ENABLED=true)
+CREATE TABLE IF NOT EXISTS prompt_shards (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    scenario TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Table for system prompt candidates under shadow evaluation
+-- With SHADOW_EVAL_ENABLED=true, new system prompts land here first and are copied
+-- into prompts only when they do no worse than the live prompt on sampled traffic
+CREATE TABLE IF NOT EXISTS prompt_candidates (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    content TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'shadow',  -- queued | shadow | promoted | rejected | superseded
+    metrics JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    decided_at TIMESTAMP WITH TIME ZONE
+);
+
 -- Create indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_prompts_created_at ON prompts(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_editor_prompt_created_at ON editor_prompt(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_training_examples_created_at ON training_examples(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_prompt_shards_scenario_created_at ON prompt_shards(scenario, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_prompt_candidates_status_created_at ON prompt_candidates(status, created_at DESC);
+
+-- Keyset pagination for exports: ORDER BY created_at, id with a (created_at, id) cursor
+CREATE INDEX IF NOT EXISTS idx_prompts_created_at_id ON prompts(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_training_examples_created_at_id ON training_examples(created_at, id);
+
+-- Notify listeners (DATABASE_URL direct connections) when a new prompt version is written,
+-- so every worker can drop its prompt cache right away. Payload: table name, plus the
+-- scenario for prompt_shards (e.g. "prompt_shards:dtv")
+CREATE OR REPLACE FUNCTION notify_prompt_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'prompt_shards' THEN
+        PERFORM pg_notify('prompt_versions', TG_TABLE_NAME || ':' || NEW.scenario);
+    ELSE
+        PERFORM pg_notify('prompt_versions', TG_TABLE_NAME);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
 
+DROP TRIGGER IF EXISTS prompts_notify_version ON prompts;
+CREATE TRIGGER prompts_notify_version AFTER INSERT ON prompts
+    FOR EACH ROW EXECUTE FUNCTION notify_prompt_version();
+DROP TRIGGER IF EXISTS editor_prompt_notify_version ON editor_prompt;
+CREATE TRIGGER editor_prompt_notify_version AFTER INSERT ON editor_prompt
+    FOR EACH ROW EXECUTE FUNCTION notify_prompt_version();
+DROP TRIGGER IF EXISTS prompt_shards_notify_version ON prompt_shards;
+CREATE TRIGGER prompt_shards_notify_version AFTER INSERT ON prompt_shards
+    FOR EACH ROW EXECUTE FUNCTION notify_prompt_version();
+DROP TRIGGER IF EXISTS prompt_candidates_notify_version ON prompt_candidates;
+CREATE TRIGGER prompt_candidates_notify_version AFTER INSERT OR UPDATE ON prompt_candidates
+    FOR EACH ROW EXECUTE FUNCTION notify_prompt_version();
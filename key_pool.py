@@ -0,0 +1,153 @@
+"""
+Pool of Gemini API keys (one per project/quota).
+
+Each key has its own RateLimiter, so RPM/TPM/concurrency are tracked per
+quota. Calls go to the least-loaded key that isn't ejected; a key that keeps
+hitting its quota (429) is ejected for a while so traffic shifts to the others.
+Each key also gets its own GenerativeServiceClient, since genai.configure()
+only holds one global key.
+"""
+import inspect
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional
+
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+
+from rate_limiter import RateLimiter
+
+LEAST_LOADED = "least_loaded"
+ROUND_ROBIN = "round_robin"
+
+
+def _check_sdk():
+    """
+    Fail at startup if the SDK lacks what the pool relies on.
+
+    GenerativeModel._client is private; without it every key's traffic would
+    silently go through the global key. request_options carries the call timeouts.
+    """
+    model = genai.GenerativeModel("gemini-2.5-flash")
+    if not hasattr(model, "_client"):
+        raise RuntimeError("This google-generativeai version has no GenerativeModel._client, "
+                           "so per-key clients can't be used (tested with 0.6-0.8)")
+    if "request_options" not in inspect.signature(model.generate_content).parameters:
+        raise RuntimeError("google-generativeai>=0.6.0 is required (generate_content "
+                           "has no request_options)")
+
+
+class PooledKey:
+    """One API key with its own quota tracking and generative client."""
+
+    def __init__(self, index: int, api_key: str, rate_limiter: RateLimiter):
+        self.index = index
+        self.label = f"key-{index}:…{api_key[-4:]}"
+        self.rate_limiter = rate_limiter
+        self.client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+        self.ejected_until = 0.0
+        self._models: Dict[str, genai.GenerativeModel] = {}
+        self._lock = threading.Lock()
+
+    def model(self, model_name: str) -> genai.GenerativeModel:
+        """GenerativeModel bound to this key's client instead of the global one."""
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = genai.GenerativeModel(model_name)
+                # GenerativeModel falls back to the global client only when _client is unset
+                # (checked at startup by _check_sdk)
+                model._client = self.client
+                self._models[model_name] = model
+            return model
+
+    def load(self) -> float:
+        """Share of this key's concurrency limit in use."""
+        concurrency = self.rate_limiter.concurrency
+        return concurrency.in_flight / max(1, concurrency.limit)
+
+
+class KeyPool:
+    """Selects an API key per call and ejects throttled keys temporarily."""
+
+    def __init__(self, api_keys: List[str], rpm: int, tpm: int, max_concurrency: int,
+                 queue_timeout: float = 30.0, strategy: str = LEAST_LOADED,
+                 eject_seconds: float = 60.0):
+        """
+        Args:
+            api_keys: API keys, each with its own quota
+            rpm / tpm / max_concurrency: Quota of a single key
+            queue_timeout: Seconds a call may wait for a key's quota
+            strategy: "least_loaded" or "round_robin"
+            eject_seconds: Minimum time a throttled key is skipped
+        """
+        if not api_keys:
+            raise ValueError("KeyPool needs at least one API key")
+        _check_sdk()
+        if strategy not in (LEAST_LOADED, ROUND_ROBIN):
+            raise ValueError(f"Unknown key selection strategy: {strategy}")
+        self.strategy = strategy
+        self.eject_seconds = eject_seconds
+        self.keys = [
+            PooledKey(index, api_key, RateLimiter(
+                rpm=rpm,
+                tpm=tpm,
+                max_concurrency=max_concurrency,
+                initial_concurrency=max(1, max_concurrency // 2),
+                queue_timeout=queue_timeout
+            ))
+            for index, api_key in enumerate(api_keys)
+        ]
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self._counters = {"ejections": 0, "all_ejected": 0}
+
+    @property
+    def capacity(self) -> int:
+        """Total concurrency across keys that are currently usable."""
+        now = time.monotonic()
+        usable = [k for k in self.keys if k.ejected_until <= now] or self.keys
+        return sum(k.rate_limiter.concurrency.limit for k in usable)
+
+    def has_available(self) -> bool:
+        """Whether any key is currently not ejected."""
+        now = time.monotonic()
+        return any(k.ejected_until <= now for k in self.keys)
+
+    def select(self) -> PooledKey:
+        """Key for the next call (ejected keys are used only when all are ejected)."""
+        now = time.monotonic()
+        with self._lock:
+            available = [k for k in self.keys if k.ejected_until <= now]
+            if not available:
+                self._counters["all_ejected"] += 1
+                # Its limiter is blocked until Retry-After, so the call waits rather than fails
+                return min(self.keys, key=lambda k: k.ejected_until)
+            if self.strategy == ROUND_ROBIN:
+                return available[next(self._round_robin) % len(available)]
+            offset = next(self._round_robin)
+            # Least loaded; rotate the start so ties spread across keys
+            rotated = available[offset % len(available):] + available[:offset % len(available)]
+            return min(rotated, key=lambda k: k.load())
+
+    def eject(self, key: PooledKey, retry_after: Optional[float] = None):
+        """Skip `key` for at least eject_seconds (or the server's Retry-After, if longer)."""
+        until = time.monotonic() + max(self.eject_seconds, retry_after or 0.0)
+        with self._lock:
+            if key.ejected_until <= time.monotonic():
+                self._counters["ejections"] += 1
+                print(f"Gemini {key.label} throttled, ejected for {until - time.monotonic():.0f}s")
+            key.ejected_until = max(key.ejected_until, until)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._counters)
+        stats["strategy"] = self.strategy
+        stats["keys"] = {
+            key.label: dict(key.rate_limiter.stats(),
+                            ejected_for=round(max(0.0, key.ejected_until - now), 1))
+            for key in self.keys
+        }
+        return stats
@@ -0,0 +1,38 @@
+"""
+Rolling latency statistics.
+"""
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+
+class LatencyWindow:
+    """Thread-safe window of the most recent latency samples (in seconds)."""
+
+    def __init__(self, size: int = 500):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """The p-th percentile (0-100) of the window, or None if empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(p / 100.0 * (len(samples) - 1)))))
+        return samples[index]
+
+    def summary(self) -> Dict:
+        """p50/p95/p99 in milliseconds for metrics output."""
+        result = {"samples": len(self)}
+        for p in (50, 95, 99):
+            value = self.percentile(p)
+            result[f"p{p}_ms"] = round(value * 1000, 1) if value is not None else None
+        return result
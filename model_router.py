@@ -0,0 +1,124 @@
+"""
+Per-task model routing with latency/error based fallback.
+
+Each task (generate_reply, improve_prompt, ...) has a primary and an optional
+fallback model. The router keeps per-route latency and error stats; when the
+primary breaches its latency SLO or keeps failing, traffic goes to the
+fallback for a cooldown period, after which the primary is tried again.
+"""
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from latency import LatencyWindow
+
+
+class ModelRoute:
+    """Routing settings for one task."""
+
+    def __init__(self, primary: str, fallback: Optional[str] = None,
+                 latency_slo: Optional[float] = None, timeout: Optional[float] = None):
+        """
+        Args:
+            primary: Model used while healthy
+            fallback: Alternate model used when the primary is degraded or errors
+            latency_slo: p95 latency (seconds) the primary must stay under
+            timeout: Seconds a single call may take before it is abandoned
+        """
+        self.primary = primary
+        self.fallback = fallback if fallback != primary else None
+        self.latency_slo = latency_slo
+        self.timeout = timeout
+
+
+class ModelRouter:
+    """Chooses the model for each task from observed per-route latency and errors."""
+
+    def __init__(self, routes: Dict[str, ModelRoute], error_threshold: float = 0.5,
+                 min_samples: int = 10, cooldown: float = 60.0):
+        """
+        Args:
+            routes: Task name -> route
+            error_threshold: Error ratio over recent calls that degrades the primary
+            min_samples: Calls needed before stats can degrade a route
+            cooldown: Seconds traffic stays on the fallback before probing the primary
+        """
+        self.routes = routes
+        self.error_threshold = error_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self._latencies: Dict[Tuple[str, str], LatencyWindow] = {}
+        self._outcomes: Dict[Tuple[str, str], deque] = {}
+        self._degraded_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._counters = {"fallbacks": 0, "degradations": 0}
+
+    def _route(self, task: str) -> ModelRoute:
+        route = self.routes.get(task)
+        if route is None:
+            raise ValueError(f"No model route for task: {task}")
+        return route
+
+    def candidates(self, task: str) -> List[str]:
+        """Models to try for `task`, in order."""
+        route = self._route(task)
+        if not route.fallback:
+            return [route.primary]
+        with self._lock:
+            degraded = self._degraded_until.get(task, 0.0) > time.monotonic()
+        if degraded:
+            return [route.fallback, route.primary]
+        return [route.primary, route.fallback]
+
+    def record(self, task: str, model: str, latency: float, ok: bool):
+        """Record the outcome of one call and re-evaluate the route's health."""
+        key = (task, model)
+        with self._lock:
+            window = self._latencies.setdefault(key, LatencyWindow(size=200))
+            outcomes = self._outcomes.setdefault(key, deque(maxlen=50))
+            outcomes.append(ok)
+            if ok:
+                window.record(latency)
+
+            route = self._route(task)
+            if model != route.primary or not route.fallback:
+                return
+            if len(outcomes) < self.min_samples:
+                return
+
+            error_ratio = outcomes.count(False) / len(outcomes)
+            p95 = window.percentile(95) if len(window) >= self.min_samples else None
+            breached = route.latency_slo is not None and p95 is not None and p95 > route.latency_slo
+            if breached or error_ratio >= self.error_threshold:
+                if self._degraded_until.get(task, 0.0) <= time.monotonic():
+                    self._counters["degradations"] += 1
+                self._degraded_until[task] = time.monotonic() + self.cooldown
+                # Start the next probe period from a clean slate
+                outcomes.clear()
+                self._latencies[key] = LatencyWindow(size=200)
+
+    def record_fallback(self):
+        with self._lock:
+            self._counters["fallbacks"] += 1
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            result = dict(self._counters)
+            routes = {}
+            for task, route in self.routes.items():
+                routes[task] = {
+                    "primary": route.primary,
+                    "fallback": route.fallback,
+                    "latency_slo_ms": round(route.latency_slo * 1000) if route.latency_slo else None,
+                    "degraded": self._degraded_until.get(task, 0.0) > now,
+                    "models": {}
+                }
+            for (task, model), window in self._latencies.items():
+                outcomes = self._outcomes.get((task, model), ())
+                stats = window.summary()
+                stats["error_ratio"] = round(list(outcomes).count(False) / len(outcomes), 3) if outcomes else 0.0
+                routes[task]["models"][model] = stats
+            result["routes"] = routes
+        return result
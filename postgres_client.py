@@ -0,0 +1,280 @@
+"""
+Direct Postgres access path for the hot prompt queries.
+
+Every SupabaseDB call is an HTTPS request to PostgREST, which is a lot of
+overhead for a single-row indexed lookup. With DATABASE_URL set, PostgresDB
+serves the latest-prompt lookups and the prompt/training-example inserts
+over a pool of direct connections, using server-side prepared statements.
+Everything else still goes through PostgREST.
+
+A dedicated connection LISTENs on the `prompt_versions` channel (fed by the
+triggers in init_supabase.sql), so every worker hears about new prompt
+versions as soon as they are committed and can drop its cached prompts.
+
+Needs the optional `psycopg2` package (`pip install psycopg2-binary`), and a
+direct or session-mode connection: PREPARE and LISTEN don't work through a
+transaction-mode pooler (Supabase's pooler on port 6543).
+"""
+import json
+import select
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+
+# SQLSTATE invalid_sql_statement_name: the connection lost its prepared statements
+_UNKNOWN_STATEMENT = "26000"
+
+from supabase_client import SupabaseDB
+
+NOTIFY_CHANNEL = "prompt_versions"
+
+# name -> (parameter types, query); prepared once per pooled connection
+_STATEMENTS: Dict[str, Tuple[str, str]] = {
+    "latest_prompt": (
+        "", "SELECT content FROM prompts ORDER BY created_at DESC LIMIT 1"
+    ),
+    "latest_editor_prompt": (
+        "", "SELECT content FROM editor_prompt ORDER BY created_at DESC LIMIT 1"
+    ),
+    "latest_prompt_shard": (
+        "(text)",
+        "SELECT content FROM prompt_shards WHERE scenario = $1 ORDER BY created_at DESC LIMIT 1"
+    ),
+    "insert_prompt": (
+        "(text)",
+        "INSERT INTO prompts (content) VALUES ($1) RETURNING id, content, created_at"
+    ),
+    "insert_editor_prompt": (
+        "(text)",
+        "INSERT INTO editor_prompt (content) VALUES ($1) RETURNING id, content, created_at"
+    ),
+    "insert_prompt_shard": (
+        "(text, text)",
+        "INSERT INTO prompt_shards (scenario, content) VALUES ($1, $2) "
+        "RETURNING id, scenario, content, created_at"
+    ),
+    "insert_training_example": (
+        "(jsonb, jsonb, text, text)",
+        "INSERT INTO training_examples (client_sequence, chat_history, consultant_reply, ai_reply) "
+        "VALUES ($1, $2, $3, $4) "
+        "RETURNING id, client_sequence, chat_history, consultant_reply, ai_reply, created_at"
+    ),
+}
+
+
+def _record(cursor, row) -> Dict:
+    """Row as the JSON-shaped dict PostgREST would return."""
+    record = {}
+    for column, value in zip((c.name for c in cursor.description), row):
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif value is not None and column == "id":
+            value = str(value)
+        record[column] = value
+    return record
+
+
+if psycopg2 is not None:
+    class _Connection(psycopg2.extensions.connection):
+        """Connection that remembers whether the statements are prepared on it."""
+        prepared = False
+else:
+    _Connection = None
+
+
+class PostgresDB(SupabaseDB):
+    """SupabaseDB with pooled direct Postgres connections for the hot prompt queries."""
+
+    def __init__(self, dsn: str, pool_size: int = 5):
+        """
+        Args:
+            dsn: Postgres connection string (Supabase: Project Settings → Database);
+                direct or session-mode, not the transaction pooler on port 6543
+            pool_size: Connections kept open
+        """
+        if psycopg2 is None:
+            raise ImportError("DATABASE_URL is set but psycopg2 is not installed "
+                              "(pip install psycopg2-binary)")
+        super().__init__()
+        if ":6543" in dsn:
+            print("Warning: DATABASE_URL points at port 6543 (transaction pooler); "
+                  "prepared statements and LISTEN need a direct or session-mode connection")
+        self.dsn = dsn
+        # minconn == maxconn: the pool closes returned connections beyond minconn,
+        # which would throw away their prepared statements
+        pool_size = max(1, pool_size)
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            pool_size, pool_size, dsn, connection_factory=_Connection
+        )
+        self._listeners: List[Callable[[Optional[str]], None]] = []
+        self._listener_thread: Optional[threading.Thread] = None
+        self._listener_lock = threading.Lock()
+
+    # ========== POOLED CONNECTIONS ==========
+
+    @contextmanager
+    def _connection(self):
+        """Pooled connection with the statements prepared; commits on success."""
+        conn = self.pool.getconn()
+        try:
+            self._prepare(conn)
+        except Exception:
+            # Statements prepared before the failure survive a rollback; start over on a new connection
+            self.pool.putconn(conn, close=True)
+            raise
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            # Replace connections that died or lost their statements (e.g. a server-side reset)
+            broken = conn.closed != 0 or getattr(e, "pgcode", None) == _UNKNOWN_STATEMENT
+            if conn.closed == 0:
+                conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn, close=broken)
+
+    @staticmethod
+    def _prepare(conn):
+        # The connection is checked out by this thread only, so no lock is needed
+        if conn.prepared:
+            return
+        with conn.cursor() as cursor:
+            # Prepared statements are per session and not undone by rollback: clear leftovers
+            cursor.execute("DEALLOCATE ALL")
+            for name, (types, query) in _STATEMENTS.items():
+                cursor.execute(f"PREPARE {name}{types} AS {query}")
+        conn.commit()
+        conn.prepared = True
+
+    def _execute(self, statement: str, *params) -> Optional[Dict]:
+        """Run a prepared statement and return its first row (or None)."""
+        placeholders = f"({', '.join(['%s'] * len(params))})" if params else ""
+        with self._connection() as conn, conn.cursor() as cursor:
+            cursor.execute(f"EXECUTE {statement}{placeholders}", params)
+            row = cursor.fetchone()
+            return _record(cursor, row) if row is not None else None
+
+    # ========== HOT QUERIES ==========
+
+    def get_latest_prompt(self) -> Optional[str]:
+        try:
+            row = self._execute("latest_prompt")
+            return row["content"] if row else None
+        except Exception as e:
+            print(f"Error fetching latest prompt: {e}")
+            return None
+
+    def save_prompt(self, content: str) -> Dict:
+        try:
+            return self._execute("insert_prompt", content) or {}
+        except Exception as e:
+            print(f"Error saving prompt: {e}")
+            raise
+
+    def get_latest_editor_prompt(self) -> Optional[str]:
+        try:
+            row = self._execute("latest_editor_prompt")
+            return row["content"] if row else None
+        except Exception as e:
+            print(f"Error fetching latest editor prompt: {e}")
+            return None
+
+    def save_editor_prompt(self, content: str) -> Dict:
+        try:
+            return self._execute("insert_editor_prompt", content) or {}
+        except Exception as e:
+            print(f"Error saving editor prompt: {e}")
+            raise
+
+    def get_latest_prompt_shard(self, scenario: str) -> Optional[str]:
+        try:
+            row = self._execute("latest_prompt_shard", scenario)
+            return row["content"] if row else None
+        except Exception as e:
+            print(f"Error fetching prompt shard for {scenario}: {e}")
+            return None
+
+    def save_prompt_shard(self, scenario: str, content: str) -> Dict:
+        try:
+            return self._execute("insert_prompt_shard", scenario, content) or {}
+        except Exception as e:
+            print(f"Error saving prompt shard: {e}")
+            raise
+
+    def save_training_example(self, client_sequence: List[str], chat_history: List[Dict],
+                              consultant_reply: str, ai_reply: Optional[str] = None) -> Dict:
+        try:
+            return self._execute(
+                "insert_training_example",
+                json.dumps(client_sequence), json.dumps(chat_history), consultant_reply, ai_reply
+            ) or {}
+        except Exception as e:
+            print(f"Error saving training example: {e}")
+            raise
+
+    # ========== PROMPT CHANGE NOTIFICATIONS ==========
+
+    def subscribe_prompt_changes(self, callback: Callable[[Optional[str]], None]) -> bool:
+        """
+        Call `callback(payload)` for every new prompt version, from any worker.
+
+        The payload is the table name ("prompts", "editor_prompt", "prompt_candidates")
+        or "prompt_shards:<scenario>". None means notifications may have been missed
+        (the listener reconnected), so all cached prompts should be dropped.
+        """
+        with self._listener_lock:
+            self._listeners.append(callback)
+            if self._listener_thread is None:
+                self._listener_thread = threading.Thread(
+                    target=self._listen, name="prompt-listener", daemon=True
+                )
+                self._listener_thread.start()
+        return True
+
+    def _notify(self, payload: Optional[str]):
+        with self._listener_lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"Error in prompt change listener: {e}")
+
+    def _listen(self):
+        backoff = 1.0
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Anything written while we weren't listening is unknown
+                self._notify(None)
+                backoff = 1.0
+                while True:
+                    if select.select([conn], [], [], 30.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self._notify(conn.notifies.pop(0).payload)
+                    else:
+                        # Idle: make sure the connection is still alive
+                        with conn.cursor() as cursor:
+                            cursor.execute("SELECT 1")
+            except Exception as e:
+                print(f"Prompt listener disconnected: {e}; reconnecting in {backoff:.0f}s")
+                if conn is not None:
+                    conn.close()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
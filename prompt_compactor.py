@@ -0,0 +1,109 @@
+"""
+System prompt compaction.
+
+Each improvement cycle tends to append rules, and the whole prompt is sent
+with every reply. When the prompt crosses a token budget, the editor model
+rewrites it into a consolidated form, which is only accepted if a quick
+replay against recent training examples shows no quality regression.
+A rejected or failed rewrite leaves the prompt over budget; compaction is then
+retried only once the prompt has grown by a margin, not on every update.
+"""
+import threading
+from typing import Dict
+
+from gemini_client import GeminiClient
+from prompt_replay import PromptReplayer
+from rate_limiter import estimate_tokens
+from scheduler import BULK
+
+
+class PromptCompactor:
+    """Rewrites over-budget prompts and validates the result by replay."""
+
+    def __init__(self, gemini_client: GeminiClient, replayer: PromptReplayer,
+                 token_budget: int, target_ratio: float = 0.7, tolerance: float = 0.02,
+                 retry_growth: float = 0.1):
+        """
+        Args:
+            gemini_client: Client used for the rewrite
+            replayer: Validates the rewrite against recent training examples
+            token_budget: Prompt size (estimated tokens) that triggers compaction
+            target_ratio: Size to aim for, as a fraction of the budget
+            tolerance: Allowed drop in replay score for the compacted prompt
+            retry_growth: After a rejected or failed attempt, growth (as a fraction of
+                that prompt's size) needed before compaction is tried again
+        """
+        self.gemini_client = gemini_client
+        self.replayer = replayer
+        self.token_budget = token_budget
+        self.target_ratio = target_ratio
+        self.tolerance = tolerance
+        self.retry_growth = retry_growth
+        self._lock = threading.Lock()
+        # Size (estimated tokens) a prompt must exceed before the next attempt, after one didn't take
+        self._retry_after_tokens = 0
+        self._counters = {"attempted": 0, "accepted": 0, "rejected": 0, "failed": 0, "deferred": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def needs_compaction(self, prompt: str) -> bool:
+        """Whether `prompt` is over budget and has grown enough since the last unsuccessful attempt."""
+        tokens = estimate_tokens(prompt)
+        if self.token_budget <= 0 or tokens <= self.token_budget:
+            return False
+        with self._lock:
+            if tokens <= self._retry_after_tokens:
+                self._counters["deferred"] += 1
+                return False
+        return True
+
+    def _give_up(self, prompt: str, outcome: str) -> str:
+        """Count an unsuccessful attempt and hold off until the prompt grows past the margin."""
+        with self._lock:
+            self._counters[outcome] += 1
+            self._retry_after_tokens = int(estimate_tokens(prompt) * (1 + self.retry_growth))
+        return prompt
+
+    def compact(self, prompt: str, editor_prompt: str, priority: str = BULK) -> str:
+        """
+        Return a compacted version of `prompt` if it is over budget and the rewrite validates.
+
+        Falls back to the original prompt on any failure, so learning is never lost.
+        """
+        if not self.needs_compaction(prompt):
+            return prompt
+
+        self._count("attempted")
+        try:
+            compacted = self.gemini_client.compact_prompt(
+                editor_prompt=editor_prompt,
+                existing_prompt=prompt,
+                token_budget=int(self.token_budget * self.target_ratio),
+                priority=priority
+            )
+            if not compacted or len(compacted) >= len(prompt):
+                return self._give_up(prompt, "rejected")
+
+            baseline, candidate = self.replayer.score_many([prompt, compacted], priority)
+            if candidate < baseline - self.tolerance:
+                print(f"Rejected prompt compaction: replay score {candidate:.3f} < {baseline:.3f}")
+                return self._give_up(prompt, "rejected")
+        except Exception as e:
+            print(f"Prompt compaction failed: {e}")
+            return self._give_up(prompt, "failed")
+
+        print(f"✓ Compacted system prompt: {estimate_tokens(prompt)} -> "
+              f"{estimate_tokens(compacted)} tokens")
+        with self._lock:
+            self._counters["accepted"] += 1
+            self._retry_after_tokens = 0
+        return compacted
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["retry_after_tokens"] = self._retry_after_tokens or None
+        stats["token_budget"] = self.token_budget
+        return stats
@@ -2,14 +2,46 @@
 Manages prompts: loading, updating, and initializing base prompts.
 """
 from supabase_client import SupabaseDB
-from typing import Optional
+from prompt_compactor import PromptCompactor
+from rate_limiter import estimate_tokens
+from scheduler import MANUAL
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Optional
+import hashlib
+import threading
+
+
+def compose_prompt(base_prompt: str, scenario: str, shard: str) -> str:
+    """Base system prompt followed by a scenario's shard section."""
+    return f"{base_prompt}\n\nScenario-specific guidance ({scenario}):\n{shard}"
+
+
+def prompt_version(content: str) -> str:
+    """Short, stable identifier for a prompt's content."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
 
 
 class PromptManager:
     """Manages system prompts and editor prompts."""
     
-    def __init__(self, db: SupabaseDB):
+    def __init__(self, db: SupabaseDB, compactor: Optional[PromptCompactor] = None,
+                 sharding_enabled: bool = False, shadow_enabled: bool = False):
         self.db = db
+        self.compactor = compactor
+        self.sharding_enabled = sharding_enabled
+        # New base prompt versions become shadow candidates instead of going live
+        self.shadow_enabled = shadow_enabled
+        # Recent system prompt sizes, to watch prompt growth over a training run
+        self._size_history = deque(maxlen=200)
+        self._size_lock = threading.Lock()
+        # Latest prompts cached in memory, but only when the database pushes change
+        # notifications (direct Postgres); otherwise every lookup reads the database
+        self._cache: Dict[tuple, object] = {}
+        self._cache_generation = 0
+        self._cache_lock = threading.Lock()
+        self._cache_counters = {"hits": 0, "misses": 0, "invalidations": 0}
+        self.cache_enabled = db.subscribe_prompt_changes(self._on_prompt_change)
         self._initialize_base_prompts()
     
     def _initialize_base_prompts(self):
@@ -64,21 +96,175 @@ Always respond in JSON format:
             self.db.save_editor_prompt(editor_prompt)
             print("✓ Initialized base editor prompt")
     
-    def get_system_prompt(self) -> str:
-        """Get the latest system prompt."""
-        prompt = self.db.get_latest_prompt()
+    def _cached(self, key: tuple, load: Callable[[], Optional[object]]) -> Optional[object]:
+        """Cached value for `key`, loading it on a miss. Missing values (None) aren't cached."""
+        if not self.cache_enabled:
+            return load()
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache_counters["hits"] += 1
+                return self._cache[key]
+            self._cache_counters["misses"] += 1
+            generation = self._cache_generation
+        value = load()
+        with self._cache_lock:
+            # Skip the fill if a new version was announced while we were reading
+            if value is not None and generation == self._cache_generation:
+                self._cache[key] = value
+        return value
+    
+    def _on_prompt_change(self, payload: Optional[str]):
+        """Drop cached prompts for a change notification ("<table>[:<scenario>]", None = all)."""
+        with self._cache_lock:
+            self._cache_generation += 1
+            self._cache_counters["invalidations"] += 1
+            if payload is None:
+                self._cache.clear()
+                return
+            table, _, scenario = payload.partition(":")
+            keys = {
+                "prompts": [("prompt",)],
+                "editor_prompt": [("editor",)],
+                "prompt_candidates": [("candidate",), ("queued",)],
+                "prompt_shards": [("shard", scenario)]
+            }.get(table)
+            if keys is None:
+                self._cache.clear()
+            else:
+                for key in keys:
+                    self._cache.pop(key, None)
+    
+    def get_system_prompt(self, scenario: Optional[str] = None) -> str:
+        """
+        Get the latest system prompt.
+        
+        With sharding enabled and a scenario given, the scenario's shard is appended
+        to the shared base prompt.
+        """
+        prompt = self._cached(("prompt",), self.db.get_latest_prompt)
         if not prompt:
             raise ValueError("No system prompt found in database")
+        
+        shard = self.get_scenario_prompt(scenario) if scenario else None
+        if shard:
+            return compose_prompt(prompt, scenario, shard)
         return prompt
     
+    def get_base_prompt(self) -> str:
+        """Get the latest shared base system prompt (without any scenario shard)."""
+        return self.get_system_prompt()
+    
+    def get_scenario_prompt(self, scenario: str) -> Optional[str]:
+        """Get the latest prompt shard for a scenario, if sharding is enabled and one exists."""
+        if not self.sharding_enabled:
+            return None
+        return self._cached(("shard", scenario), lambda: self.db.get_latest_prompt_shard(scenario))
+    
+    def get_candidate_prompt(self) -> Optional[Dict]:
+        """Latest base prompt candidate under shadow evaluation, if shadow mode is on."""
+        if not self.shadow_enabled:
+            return None
+        return self._cached(("candidate",), self.db.get_latest_prompt_candidate)
+    
+    def get_queued_prompt(self) -> Optional[Dict]:
+        """Latest base prompt edits waiting for the current candidate's evaluation to end."""
+        if not self.shadow_enabled:
+            return None
+        return self._cached(("queued",), lambda: self.db.get_latest_prompt_candidate("queued"))
+    
+    def get_working_prompt(self) -> str:
+        """
+        Base prompt that training edits: the queued edits, else the shadow candidate, else the live prompt.
+        
+        Lets consecutive edits build on each other while the candidate is being evaluated.
+        """
+        working = self.get_queued_prompt() or self.get_candidate_prompt()
+        return working["content"] if working else self.get_base_prompt()
+    
     def get_editor_prompt(self) -> str:
         """Get the latest editor prompt."""
-        prompt = self.db.get_latest_editor_prompt()
+        prompt = self._cached(("editor",), self.db.get_latest_editor_prompt)
         if not prompt:
             raise ValueError("No editor prompt found in database")
         return prompt
     
-    def update_system_prompt(self, new_prompt: str) -> dict:
-        """Update the system prompt with a new version."""
-        return self.db.save_prompt(new_prompt)
+    def update_system_prompt(self, new_prompt: str, priority: str = MANUAL) -> dict:
+        """
+        Update the system prompt with a new version.
+        
+        Prompts over the token budget are compacted first (when a compactor is set).
+        With shadow mode on, the new version is saved as a candidate and only goes
+        live once shadow evaluation promotes it. While a candidate is being evaluated
+        it stays frozen: new versions are queued, and the latest queued version becomes
+        the next candidate once the current one is promoted. Rejecting the candidate
+        also discards the queued versions built on it.
+        """
+        if self.compactor is not None and self.compactor.needs_compaction(new_prompt):
+            new_prompt = self.compactor.compact(new_prompt, self.get_editor_prompt(), priority)
+        
+        if self.shadow_enabled:
+            status = "queued" if self.get_candidate_prompt() else "shadow"
+            record = self.db.save_prompt_candidate(new_prompt, status)
+            self._on_prompt_change("prompt_candidates")
+            return record
+        
+        record = self.db.save_prompt(new_prompt)
+        # Our own write is visible at once; other workers hear about it via notification
+        self._on_prompt_change("prompts")
+        self._record_size(new_prompt)
+        return record
+    
+    def promote_candidate(self, candidate: Dict, metrics: Dict) -> dict:
+        """Make a shadow candidate the live system prompt."""
+        record = self.db.save_prompt(candidate["content"])
+        self.db.update_prompt_candidate(candidate["id"], "promoted", metrics)
+        self._on_prompt_change("prompts")
+        self._start_next_candidate()
+        self._record_size(candidate["content"])
+        return record
+    
+    def reject_candidate(self, candidate: Dict, metrics: Dict):
+        """
+        Discard a shadow candidate.
+        
+        Queued edits were built on top of the rejected one and still contain it, so
+        they are superseded too; the next edit starts from the live prompt.
+        """
+        self.db.update_prompt_candidate(candidate["id"], "rejected", metrics)
+        self.db.supersede_prompt_candidates("queued")
+        self._on_prompt_change("prompt_candidates")
+    
+    def _start_next_candidate(self):
+        """Put the latest queued version (if any) into shadow evaluation."""
+        queued = self.db.get_latest_prompt_candidate("queued")
+        if queued:
+            self.db.start_prompt_candidate(queued["id"])
+        self._on_prompt_change("prompt_candidates")
+    
+    def update_scenario_prompt(self, scenario: str, new_prompt: str) -> dict:
+        """Save a new version of a scenario's prompt shard."""
+        record = self.db.save_prompt_shard(scenario, new_prompt)
+        self._on_prompt_change(f"prompt_shards:{scenario}")
+        return record
+    
+    def _record_size(self, prompt: str):
+        with self._size_lock:
+            self._size_history.append({
+                "at": datetime.utcnow().isoformat(),
+                "tokens": estimate_tokens(prompt),
+                "chars": len(prompt)
+            })
+    
+    def stats(self) -> Dict:
+        """Prompt size over time, compaction and prompt cache counters."""
+        with self._size_lock:
+            history = list(self._size_history)
+        with self._cache_lock:
+            cache = dict(self._cache_counters, enabled=self.cache_enabled, entries=len(self._cache))
+        return {
+            "system_prompt_tokens": history[-1]["tokens"] if history else None,
+            "size_history": history,
+            "compaction": self.compactor.stats() if self.compactor else None,
+            "cache": cache
+        }
 
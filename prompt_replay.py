@@ -0,0 +1,118 @@
+"""
+Replay of candidate prompts against recent training examples.
+
+Used to validate prompt rewrites: each candidate generates replies for a
+small cached validation set (in parallel) and is scored by local similarity
+to what the consultants actually said. Replies get the same few-shot examples
+that /generate-reply would add, so prompts are scored under live conditions.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from gemini_client import GeminiClient
+from scheduler import BULK
+from similarity import SimilarityScorer
+from supabase_client import SupabaseDB
+
+
+# (client_sequence, example to leave out) -> few-shot examples, as in TrainingPipeline.similar_examples
+FewShotSource = Callable[[List[str], Optional[Dict]], List[Dict]]
+
+
+class PromptReplayer:
+    """Scores prompts by replaying them on a cached set of recent training examples."""
+
+    def __init__(self, db: SupabaseDB, gemini_client: GeminiClient, scorer: SimilarityScorer,
+                 sample_size: int = 5, refresh_interval: float = 300.0, max_workers: int = 4,
+                 few_shot: Optional[FewShotSource] = None):
+        """
+        Args:
+            db: Source of recent training examples
+            gemini_client: Client used to generate replay replies
+            scorer: Local similarity scorer
+            sample_size: Number of validation examples
+            refresh_interval: Seconds before the validation set is re-fetched
+            max_workers: Parallel replay calls
+            few_shot: Source of few-shot examples per replayed conversation (none if unset)
+        """
+        self.db = db
+        self.gemini_client = gemini_client
+        self.scorer = scorer
+        self.sample_size = sample_size
+        self.refresh_interval = refresh_interval
+        self.few_shot = few_shot
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="replay")
+        self._lock = threading.Lock()
+        self._examples: List[Dict] = []
+        self._fetched_at = 0.0
+
+    def validation_set(self) -> List[Dict]:
+        """Recent training examples, cached for refresh_interval seconds."""
+        with self._lock:
+            if time.monotonic() - self._fetched_at > self.refresh_interval:
+                self._examples = self.db.get_recent_training_examples(limit=self.sample_size)
+                self._fetched_at = time.monotonic()
+            return list(self._examples)
+
+    def _few_shot_examples(self, example: Dict) -> Optional[List[Dict]]:
+        if self.few_shot is None:
+            return None
+        try:
+            # Leave the example itself out: a live conversation isn't in the index yet
+            return self.few_shot(example["client_sequence"], example)
+        except Exception as e:
+            print(f"Few-shot lookup for replay failed: {e}")
+            return None
+
+    def _replay(self, prompt: str, example: Dict, few_shot: Optional[List[Dict]],
+                priority: str) -> str:
+        return self.gemini_client.generate_reply(
+            system_prompt=prompt,
+            client_sequence=example["client_sequence"],
+            chat_history=example.get("chat_history") or None,
+            priority=priority,
+            examples=few_shot
+        )
+
+    def score(self, prompt: str, priority: str = BULK) -> float:
+        """
+        Mean similarity of the prompt's replies to the consultants' replies.
+
+        Returns:
+            Score in [0, 1]; 0.0 if there is no validation data
+        """
+        return self.score_many([prompt], priority)[0]
+
+    def score_many(self, prompts: List[str], priority: str = BULK,
+                   extra_examples: Optional[List[Dict]] = None) -> List[float]:
+        """
+        Score several prompts, replaying every (prompt, example) pair concurrently.
+
+        Args:
+            prompts: Prompts to score
+            priority: Scheduling class of the replay calls
+            extra_examples: Examples replayed in addition to the cached validation set
+        """
+        examples = self.validation_set() + list(extra_examples or [])
+        if not examples or not prompts:
+            return [0.0] * len(prompts)
+
+        # Looked up once per conversation, so every prompt is scored with the same context
+        few_shots = [self._few_shot_examples(example) for example in examples]
+        futures = [
+            [self._executor.submit(contextvars.copy_context().run, self._replay, prompt, example,
+                                   few_shot, priority)
+             for example, few_shot in zip(examples, few_shots)]
+            for prompt in prompts
+        ]
+        consultant_replies = [example["consultant_reply"] for example in examples]
+        scores = []
+        for prompt_futures in futures:
+            replies = [future.result() for future in prompt_futures]
+            scores.append(float(np.mean(self.scorer.score_pairs(replies, consultant_replies))))
+        return scores
@@ -0,0 +1,254 @@
+"""
+Client-side rate limiting and retry policy for Gemini calls.
+
+The limiter keeps us inside the project's RPM/TPM quota (token buckets) and
+adapts the number of concurrent calls AIMD-style: every success nudges the
+limit up, every throttle response cuts it in half.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call could not be admitted or kept being throttled."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at a per-minute rate."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """
+        Take `amount` tokens if available.
+
+        Returns:
+            0.0 if the tokens were taken, otherwise the seconds to wait before retrying
+        """
+        # A single request larger than the bucket could never be admitted
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._refill(now)
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return self._shortfall(amount)
+
+    def _shortfall(self, amount: float) -> float:
+        return (amount - self._tokens) / self.rate if self.rate > 0 else 1.0
+
+    def wait_time(self, amount: float = 1.0) -> float:
+        """Seconds until `amount` tokens would be available, without taking them."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._refill(now)
+            return max(0.0, self._shortfall(amount))
+
+    def acquire(self, amount: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Block until `amount` tokens are taken. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(amount)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(min(wait, 1.0))
+
+    def release(self, amount: float = 1.0):
+        """Give back tokens taken for a call that was never made."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def block_for(self, seconds: float):
+        """Refuse all acquisitions for `seconds` (used to honor Retry-After)."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Concurrency limit that grows additively on success and shrinks
+    multiplicatively on throttling (AIMD).
+    """
+
+    def __init__(self, initial: int, min_limit: int = 1, max_limit: int = 16,
+                 decrease_factor: float = 0.5, decrease_cooldown: float = 2.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._in_flight < int(self._limit), timeout):
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        # Roughly +1 per "round trip" of the whole window
+        with self._cond:
+            self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            self._cond.notify()
+
+    def on_throttle(self):
+        # Many in-flight calls fail together on a 429 burst; only cut once per cooldown
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease < self.decrease_cooldown:
+                return
+            self._last_decrease = now
+            self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honoring server-provided Retry-After."""
+
+    def __init__(self, max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Seconds to sleep before retry number `attempt` (0-based).
+
+        Args:
+            attempt: How many retries have already been made
+            retry_after: Delay requested by the server, if any
+        """
+        if retry_after is not None:
+            # Never retry earlier than asked; a little jitter avoids a thundering herd
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class RateLimiter:
+    """Admission control for one quota (API key/project): RPM, TPM and concurrency."""
+
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int,
+                 initial_concurrency: Optional[int] = None, queue_timeout: float = 30.0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AdaptiveConcurrencyLimiter(
+            initial=initial_concurrency or max_concurrency,
+            max_limit=max_concurrency
+        )
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._counters = {"admitted": 0, "rejected": 0, "throttled": 0, "retries": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    @contextmanager
+    def slot(self, estimated_tokens: int):
+        """
+        Hold a concurrency slot and charge the request against RPM/TPM.
+
+        Raises:
+            RateLimitExceeded: if the call can't be admitted within queue_timeout
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        if not self.concurrency.acquire(timeout=self.queue_timeout):
+            self._count("rejected")
+            raise RateLimitExceeded("Gemini concurrency limit reached", retry_after=1.0)
+        try:
+            taken = []
+            for bucket, amount in ((self.requests, 1), (self.tokens, estimated_tokens)):
+                if not bucket.acquire(amount, timeout=max(0.0, deadline - time.monotonic())):
+                    # The call is never made, so it shouldn't use up request quota either
+                    for taken_bucket, taken_amount in taken:
+                        taken_bucket.release(taken_amount)
+                    self._count("rejected")
+                    raise RateLimitExceeded(
+                        "Gemini request quota exhausted",
+                        retry_after=max(1.0, bucket.wait_time(amount))
+                    )
+                taken.append((bucket, amount))
+            self._count("admitted")
+            yield
+        finally:
+            self.concurrency.release()
+
+    def on_success(self):
+        self.concurrency.on_success()
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        self._count("throttled")
+        self.concurrency.on_throttle()
+        if retry_after:
+            self.requests.block_for(retry_after)
+
+    def on_retry(self):
+        self._count("retries")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({
+            "concurrency_limit": self.concurrency.limit,
+            "in_flight": self.concurrency.in_flight,
+            "rpm_available": round(self.requests.available(), 1),
+            "tpm_available": round(self.tokens.available(), 1)
+        })
+        return counters
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate (~4 characters per token for Gemini models)."""
+    return len(text) // 4 + 1
@@ -0,0 +1,77 @@
+"""
+Routes conversations to per-scenario prompt shards.
+
+The scenario comes from an explicit field when the caller knows it (e.g. the
+`scenario` of an exported conversation), otherwise from a cheap local
+keyword classifier over the conversation text.
+"""
+import re
+from typing import Dict, List, Optional
+
+# Shard key -> keywords/phrases that indicate it (matched on word boundaries, lowercase)
+DEFAULT_SCENARIO_KEYWORDS: Dict[str, List[str]] = {
+    "dtv": ["dtv", "destination thailand", "digital nomad", "remote work", "remote worker",
+            "freelancer", "soft power", "muay thai", "workcation"],
+    "tourist": ["tourist", "tourist visa", "holiday", "vacation", "visa exemption",
+                "visa on arrival", "sightseeing"],
+    "retirement": ["retire", "retired", "retirement", "pension", "pensioner", "non-o-a", "o-a",
+                   "over 50"],
+    "education": ["student", "education", "ed visa", "study", "studying", "school",
+                  "university", "language school", "course"],
+    "business": ["business", "work permit", "non-b", "employer", "employment", "company",
+                 "smart visa", "investor", "ltr"],
+    "family": ["marriage", "married", "wife", "husband", "spouse", "fiance", "family",
+               "thai partner", "child", "children"],
+}
+
+
+class ScenarioRouter:
+    """Maps a conversation to a scenario shard key (or None for base-only)."""
+
+    def __init__(self, keywords: Optional[Dict[str, List[str]]] = None):
+        self.keywords = keywords or DEFAULT_SCENARIO_KEYWORDS
+        self._patterns = {
+            scenario: [re.compile(r"(?<!\w)" + re.escape(phrase) + r"(?!\w)") for phrase in phrases]
+            for scenario, phrases in self.keywords.items()
+        }
+
+    @property
+    def scenarios(self) -> List[str]:
+        return list(self.keywords)
+
+    def _score(self, text: str) -> Optional[str]:
+        text = (text or "").lower()
+        best, best_hits = None, 0
+        for scenario, patterns in self._patterns.items():
+            hits = sum(len(pattern.findall(text)) for pattern in patterns)
+            if hits > best_hits:
+                best, best_hits = scenario, hits
+        return best
+
+    def classify(self, client_sequence: List[str], chat_history: Optional[List[Dict]] = None,
+                 scenario: Optional[str] = None) -> Optional[str]:
+        """
+        Pick the shard for a conversation.
+
+        Args:
+            client_sequence: Current client messages
+            chat_history: Earlier messages, used when the client sequence has no signal
+            scenario: Explicit scenario from the caller (shard key or free-text label);
+                values from request JSON that aren't strings are ignored
+
+        Returns:
+            Shard key, or None if the conversation should use the base prompt only
+        """
+        if isinstance(scenario, str) and scenario:
+            key = scenario.strip().lower()
+            if key in self.keywords:
+                return key
+            # Free-text labels like "First-time DTV applicant – Digital Nomad"
+            labelled = self._score(scenario)
+            if labelled:
+                return labelled
+
+        detected = self._score("\n".join(client_sequence))
+        if detected or not chat_history:
+            return detected
+        return self._score("\n".join(msg.get("text", "") for msg in chat_history))
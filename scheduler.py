@@ -0,0 +1,137 @@
+"""
+Priority scheduling of Gemini calls.
+
+Interactive replies, manual prompt improvements and bulk training share one
+quota. Calls wait here for a concurrency slot and are dispatched with
+start-time weighted fair queueing, so bulk work soaks up spare capacity
+while interactive traffic keeps the lion's share (plus reserved slots)
+whenever it is waiting.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict
+
+from rate_limiter import RateLimitExceeded
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"
+MANUAL = "manual"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, MANUAL, BULK)
+
+
+class _Ticket:
+    __slots__ = ("priority", "tag", "enqueued_at", "granted")
+
+    def __init__(self, priority: str, tag: float):
+        self.priority = priority
+        self.tag = tag
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class PriorityScheduler:
+    """Weighted fair queueing of calls across priority classes."""
+
+    def __init__(self, capacity: Callable[[], int], weights: Dict[str, float],
+                 queue_timeouts: Dict[str, float], reserved_interactive_slots: int = 1):
+        """
+        Args:
+            capacity: Returns the current number of concurrent calls allowed
+            weights: Share of capacity per priority class when all are busy
+            queue_timeouts: Max seconds a call of each class may wait for a slot
+            reserved_interactive_slots: Slots only interactive calls may use
+        """
+        self.capacity = capacity
+        self.weights = {p: max(weights.get(p, 1.0), 0.001) for p in PRIORITIES}
+        self.queue_timeouts = queue_timeouts
+        self.reserved_interactive_slots = reserved_interactive_slots
+        self._queues: Dict[str, Deque[_Ticket]] = {p: deque() for p in PRIORITIES}
+        self._last_tag = {p: 0.0 for p in PRIORITIES}
+        self._virtual_time = 0.0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {p: {"dispatched": 0, "timed_out": 0, "wait_total": 0.0, "wait_max": 0.0}
+                       for p in PRIORITIES}
+
+    def _eligible(self, priority: str) -> bool:
+        limit = self.capacity()
+        if priority != INTERACTIVE:
+            # Keep a few slots free so a burst of interactive calls never queues behind batch work
+            limit = max(1, limit - self.reserved_interactive_slots)
+        return self._in_use < limit
+
+    def _dispatch(self):
+        """Grant slots to queued tickets in virtual-finish-tag order."""
+        while True:
+            best = None
+            for priority in PRIORITIES:
+                queue = self._queues[priority]
+                if queue and self._eligible(priority) and (best is None or queue[0].tag < best.tag):
+                    best = queue[0]
+            if best is None:
+                return
+            self._queues[best.priority].popleft()
+            best.granted = True
+            self._in_use += 1
+            self._virtual_time = max(self._virtual_time, best.tag)
+            self._record_wait(best)
+            self._cond.notify_all()
+
+    def _record_wait(self, ticket: _Ticket):
+        waited = time.monotonic() - ticket.enqueued_at
+        stats = self._stats[ticket.priority]
+        stats["dispatched"] += 1
+        stats["wait_total"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE):
+        """
+        Wait for a slot in the given priority class.
+
+        Raises:
+            RateLimitExceeded: if no slot was granted within the class's queue timeout
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        with self._cond:
+            tag = max(self._virtual_time, self._last_tag[priority]) + 1.0 / self.weights[priority]
+            self._last_tag[priority] = tag
+            ticket = _Ticket(priority, tag)
+            self._queues[priority].append(ticket)
+            self._dispatch()
+
+            timeout = self.queue_timeouts.get(priority)
+            if not self._cond.wait_for(lambda: ticket.granted, timeout):
+                self._queues[priority].remove(ticket)
+                self._stats[priority]["timed_out"] += 1
+                raise RateLimitExceeded(
+                    f"Timed out waiting for a Gemini slot ({priority})",
+                    retry_after=1.0
+                )
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_use -= 1
+                self._dispatch()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            result = {"in_use": self._in_use, "capacity": self.capacity()}
+            for priority in PRIORITIES:
+                stats = self._stats[priority]
+                dispatched = stats["dispatched"]
+                result[priority] = {
+                    "queued": len(self._queues[priority]),
+                    "dispatched": dispatched,
+                    "timed_out": stats["timed_out"],
+                    "avg_wait_ms": round(1000 * stats["wait_total"] / dispatched, 1) if dispatched else 0.0,
+                    "max_wait_ms": round(1000 * stats["wait_max"], 1)
+                }
+            return result
+
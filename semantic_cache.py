@@ -0,0 +1,195 @@
+"""
+Semantic reply cache for first-message style questions.
+
+Paraphrases like "how long for tourist visa" / "tourist visa processing
+time?" miss an exact-match cache. This cache embeds the client sequence and
+answers from the nearest cached question above a similarity threshold.
+Entries are partitioned by the prompt version that produced them, bounded in
+number per version (oldest evicted first) and expire after a TTL. With
+scenario shards each scenario has its own composed prompt version, so each
+keeps its own partition; a partition is dropped once its scenario's prompt
+moves on to a new version.
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from similarity import SimilarityScorer, hashed_ngram_vectors
+from vector_index import example_query_text
+
+Embedder = Callable[[Sequence[str]], np.ndarray]
+
+
+class _Partition:
+    """Ring of cached (vector, reply) entries for one prompt version."""
+
+    def __init__(self, max_entries: int, dim: int):
+        self.vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self.replies: List[Optional[str]] = [None] * max_entries
+        self.created = np.zeros(max_entries, dtype=np.float64)
+        self.filled = 0
+        self.next = 0
+
+
+class SemanticReplyCache:
+    """Nearest-neighbour reply cache over embedded client sequences."""
+
+    def __init__(self, threshold: float = 0.9, max_entries: int = 2000, ttl: float = 3600.0,
+                 max_history: int = 0, embed: Optional[Embedder] = None,
+                 false_hit_threshold: float = 0.25):
+        """
+        Args:
+            threshold: Cosine similarity needed to serve a cached reply
+            max_entries: Size bound per prompt version; the oldest entry is evicted when full
+            ttl: Seconds a cached reply stays valid
+            max_history: Only conversations with at most this many history messages are cached
+            embed: Returns L2-normalized vectors for texts (local hashing by default)
+            false_hit_threshold: Audits scoring a cached reply below this against the
+                real consultant reply count as false hits
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_history = max_history
+        self.embed = embed or hashed_ngram_vectors
+        self.false_hit_threshold = false_hit_threshold
+        self._lock = threading.Lock()
+        # Prompt version -> its entries, and scope (scenario, None for the base) -> its version
+        self._partitions: Dict[str, _Partition] = {}
+        self._scope_versions: Dict[Optional[str], str] = {}
+        self._counters = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0,
+                          "evictions": 0, "audits": 0, "false_hits": 0, "embed_errors": 0}
+
+    def eligible(self, chat_history: Optional[List[Dict]]) -> bool:
+        """Whether a conversation is short enough to be answered from the cache."""
+        return len(chat_history or []) <= self.max_history
+
+    def _embed(self, client_sequence: List[str]) -> Optional[np.ndarray]:
+        try:
+            return np.asarray(self.embed([example_query_text(client_sequence)]),
+                              dtype=np.float32)[0]
+        except Exception as e:
+            print(f"Semantic cache embedding failed: {e}")
+            with self._lock:
+                self._counters["embed_errors"] += 1
+            return None
+
+    def _partition(self, prompt_version: str, scope: Optional[str], dim: int) -> _Partition:
+        """Partition to store into, dropping the scope's previous version. Caller holds the lock."""
+        previous = self._scope_versions.get(scope)
+        self._scope_versions[scope] = prompt_version
+        # A new prompt version of this scope invalidates its cached replies, unless another
+        # scope still uses that version (a scenario without a shard shares the base prompt)
+        if previous is not None and previous != prompt_version \
+                and previous not in self._scope_versions.values():
+            old = self._partitions.pop(previous, None)
+            if old is not None:
+                self._counters["evictions"] += old.filled
+        partition = self._partitions.get(prompt_version)
+        if partition is None or partition.vectors.shape[1] != dim:
+            partition = self._partitions[prompt_version] = _Partition(self.max_entries, dim)
+        return partition
+
+    def _nearest(self, prompt_version: str, vector: np.ndarray):
+        """Best live (partition, slot, similarity) for `vector`, or (None, None, 0.0). Caller holds the lock."""
+        partition = self._partitions.get(prompt_version)
+        if partition is None or partition.filled == 0 or partition.vectors.shape[1] != vector.shape[0]:
+            return None, None, 0.0
+        scores = partition.vectors[:partition.filled] @ vector
+        expired = partition.created[:partition.filled] < time.time() - self.ttl
+        scores[expired] = -1.0
+        slot = int(np.argmax(scores))
+        return partition, slot, float(scores[slot])
+
+    def lookup(self, prompt_version: str, client_sequence: List[str],
+               threshold: Optional[float] = None) -> Optional[Dict]:
+        """
+        Find a cached reply for a semantically equivalent client sequence.
+
+        Args:
+            prompt_version: Version of the prompt the reply must come from
+            client_sequence: Client messages to answer
+            threshold: Overrides the configured similarity threshold (degraded mode)
+
+        Returns:
+            Dict with reply and similarity on a hit, otherwise None
+        """
+        vector = self._embed(client_sequence)
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            self._counters["lookups"] += 1
+            if vector is not None:
+                partition, slot, similarity = self._nearest(prompt_version, vector)
+                if partition is not None and similarity >= threshold:
+                    self._counters["hits"] += 1
+                    return {"reply": partition.replies[slot], "similarity": round(similarity, 4)}
+            self._counters["misses"] += 1
+            return None
+
+    def store(self, prompt_version: str, client_sequence: List[str], reply: str,
+              scope: Optional[str] = None):
+        """
+        Cache `reply` for `client_sequence` under `prompt_version`.
+
+        Args:
+            prompt_version: Version of the prompt that produced the reply
+            client_sequence: Client messages the reply answers
+            reply: The generated reply
+            scope: Scenario whose prompt produced it (None for the base prompt); a new
+                version within a scope drops that scope's older entries
+        """
+        vector = self._embed(client_sequence)
+        if vector is None:
+            return
+        with self._lock:
+            partition = self._partition(prompt_version, scope, vector.shape[0])
+            if partition.filled == self.max_entries:
+                self._counters["evictions"] += 1
+            slot = partition.next
+            partition.vectors[slot] = vector
+            partition.replies[slot] = reply
+            partition.created[slot] = time.time()
+            partition.next = (slot + 1) % self.max_entries
+            partition.filled = min(partition.filled + 1, self.max_entries)
+            self._counters["stores"] += 1
+
+    def audit(self, prompt_version: str, client_sequence: List[str],
+              consultant_reply: str, scorer: SimilarityScorer) -> Optional[bool]:
+        """
+        Check what the cache would have answered against a real consultant reply.
+
+        A cached reply that scores below false_hit_threshold is a false hit and is dropped.
+
+        Returns:
+            True for a false hit, False for a good hit, None if the cache wouldn't have answered
+        """
+        vector = self._embed(client_sequence)
+        if vector is None:
+            return None
+        with self._lock:
+            partition, slot, similarity = self._nearest(prompt_version, vector)
+            if partition is None or similarity < self.threshold:
+                return None
+            cached_reply = partition.replies[slot]
+
+        false_hit = scorer.score(cached_reply, consultant_reply) < self.false_hit_threshold
+        with self._lock:
+            self._counters["audits"] += 1
+            if false_hit:
+                self._counters["false_hits"] += 1
+                if partition.replies[slot] is cached_reply:
+                    partition.created[slot] = 0.0
+        return false_hit
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = sum(p.filled for p in self._partitions.values())
+            stats["prompt_versions"] = len(self._partitions)
+        lookups = stats["lookups"]
+        audits = stats["audits"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["false_hit_rate"] = round(stats["false_hits"] / audits, 4) if audits else 0.0
+        return stats
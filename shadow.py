@@ -0,0 +1,251 @@
+"""
+Shadow evaluation of candidate system prompts on live traffic.
+
+With shadow mode on, new system prompt versions become candidates instead of
+going live. A sample of /generate-reply requests is replayed against the
+candidate in the background, at bulk priority and under its own rate cap, so
+the shadow load never delays interactive replies. For each sample we compare
+the candidate's model latency and reply length with the live reply, and when
+the consultant's real reply for that conversation arrives through training,
+both replies are scored against it. The candidate is promoted once it is no
+worse than the live prompt on all three, and rejected if it still isn't after
+`max_samples` scored conversations.
+"""
+import contextvars
+import hashlib
+import random
+import statistics
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from gemini_client import GeminiClient
+from prompt_manager import PromptManager, prompt_version
+from rate_limiter import TokenBucket
+from scheduler import BULK
+from similarity import SimilarityScorer
+from usage import track_call_latencies, usage_context
+
+
+def conversation_key(client_sequence: List[str]) -> str:
+    """Identity of a conversation turn, shared by /generate-reply and /improve-ai."""
+    return hashlib.sha256("\n".join(client_sequence).encode("utf-8")).hexdigest()
+
+
+class _Comparison:
+    """Paired live vs. candidate observations for one candidate version."""
+
+    def __init__(self, candidate: Dict, live_version: str):
+        self.candidate = candidate
+        self.candidate_version = prompt_version(candidate["content"])
+        self.live_version = live_version
+        self.live_latency: List[float] = []
+        self.candidate_latency: List[float] = []
+        self.live_length: List[int] = []
+        self.candidate_length: List[int] = []
+        self.live_similarity: List[float] = []
+        self.candidate_similarity: List[float] = []
+        # conversation key -> (live reply, candidate reply), waiting for the consultant reply
+        self.pending: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def summary(self) -> Dict:
+        def mean(values):
+            return round(statistics.fmean(values), 4) if values else None
+
+        def median_ms(values):
+            return round(statistics.median(values) * 1000, 1) if values else None
+
+        return {
+            "candidate_id": self.candidate.get("id"),
+            "candidate_version": self.candidate_version,
+            "live_version": self.live_version,
+            "samples": len(self.candidate_latency),
+            "scored": len(self.candidate_similarity),
+            "live_similarity": mean(self.live_similarity),
+            "candidate_similarity": mean(self.candidate_similarity),
+            "live_latency_p50_ms": median_ms(self.live_latency),
+            "candidate_latency_p50_ms": median_ms(self.candidate_latency),
+            "live_reply_chars": mean(self.live_length),
+            "candidate_reply_chars": mean(self.candidate_length)
+        }
+
+
+class ShadowEvaluator:
+    """Mirrors sampled live replies to the candidate prompt and decides on promotion."""
+
+    def __init__(self, prompt_manager: PromptManager, gemini_client: GeminiClient,
+                 scorer: SimilarityScorer, sample_rate: float = 0.2, rpm: float = 30,
+                 max_in_flight: int = 2, min_samples: int = 20, max_samples: int = 200,
+                 similarity_tolerance: float = 0.01, latency_tolerance: float = 0.1,
+                 length_tolerance: float = 0.1, max_pending: int = 1000):
+        """
+        Args:
+            prompt_manager: Source of the live and candidate prompts; performs promotion
+            gemini_client: Client used for the shadow replies (at bulk priority)
+            scorer: Local similarity scorer against consultant replies
+            sample_rate: Share of live replies mirrored to the candidate
+            rpm: Cap on shadow calls per minute
+            max_in_flight: Shadow calls running at once; extra samples are dropped
+            min_samples: Scored conversations needed before promotion
+            max_samples: Scored conversations after which a non-promoted candidate is rejected
+            similarity_tolerance: How much lower the candidate's mean similarity may be
+            latency_tolerance: Allowed relative increase in median model latency
+            length_tolerance: Allowed relative increase in mean reply length
+            max_pending: Shadowed conversations kept while waiting for consultant replies
+        """
+        self.prompt_manager = prompt_manager
+        self.gemini_client = gemini_client
+        self.scorer = scorer
+        self.sample_rate = sample_rate
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.similarity_tolerance = similarity_tolerance
+        self.latency_tolerance = latency_tolerance
+        self.length_tolerance = length_tolerance
+        self.max_pending = max_pending
+        self.max_in_flight = max_in_flight
+        self._budget = TokenBucket(rpm, capacity=max(1.0, rpm / 6))
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="shadow")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._comparison: Optional[_Comparison] = None
+        self._counters = {"sampled": 0, "shadowed": 0, "dropped": 0, "errors": 0,
+                          "scored": 0, "promoted": 0, "rejected": 0}
+
+    def submit(self, live_version: str, client_sequence: List[str],
+               chat_history: Optional[List[Dict]], examples: Optional[List[Dict]],
+               live_reply: str, live_latency: float):
+        """
+        Maybe mirror a live reply to the candidate prompt. Never blocks the caller.
+
+        Args:
+            live_version: Version of the live prompt that produced `live_reply`
+            client_sequence / chat_history / examples: The live request's inputs
+            live_reply: Reply served to the customer
+            live_latency: Model latency of the live call in seconds
+        """
+        if random.random() >= self.sample_rate:
+            return
+        with self._lock:
+            self._counters["sampled"] += 1
+            if self._in_flight >= self.max_in_flight or self._budget.try_acquire() > 0:
+                self._counters["dropped"] += 1
+                return
+            self._in_flight += 1
+        self._executor.submit(
+            contextvars.copy_context().run, self._shadow, live_version, client_sequence,
+            chat_history, examples, live_reply, live_latency
+        )
+
+    def _current(self, live_version: str) -> Optional[_Comparison]:
+        """Comparison for the current candidate, reset when the candidate or live prompt changes."""
+        candidate = self.prompt_manager.get_candidate_prompt()
+        with self._lock:
+            if candidate is None:
+                self._comparison = None
+                return None
+            comparison = self._comparison
+            if comparison is None or comparison.candidate.get("id") != candidate.get("id") \
+                    or comparison.live_version != live_version:
+                comparison = self._comparison = _Comparison(candidate, live_version)
+            return comparison
+
+    def _shadow(self, live_version: str, client_sequence: List[str],
+                chat_history: Optional[List[Dict]], examples: Optional[List[Dict]],
+                live_reply: str, live_latency: float):
+        try:
+            comparison = self._current(live_version)
+            if comparison is None:
+                return
+            with usage_context(endpoint="shadow", prompt_version=comparison.candidate_version), \
+                    track_call_latencies() as latencies:
+                candidate_reply = self.gemini_client.generate_reply(
+                    system_prompt=comparison.candidate["content"],
+                    client_sequence=client_sequence,
+                    chat_history=chat_history,
+                    priority=BULK,
+                    hedge=False,
+                    examples=examples
+                )
+            if not latencies:
+                return
+            with self._lock:
+                self._counters["shadowed"] += 1
+                comparison.live_latency.append(live_latency)
+                comparison.candidate_latency.append(min(latencies))
+                comparison.live_length.append(len(live_reply))
+                comparison.candidate_length.append(len(candidate_reply))
+                comparison.pending[conversation_key(client_sequence)] = (live_reply, candidate_reply)
+                while len(comparison.pending) > self.max_pending:
+                    comparison.pending.popitem(last=False)
+        except Exception as e:
+            print(f"Shadow evaluation call failed: {e}")
+            with self._lock:
+                self._counters["errors"] += 1
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def observe(self, client_sequence: List[str], consultant_reply: str):
+        """Score a shadowed conversation once the consultant's real reply is known."""
+        with self._lock:
+            comparison = self._comparison
+            if comparison is None:
+                return
+            replies = comparison.pending.pop(conversation_key(client_sequence), None)
+        if replies is None:
+            return
+
+        scores = self.scorer.score_pairs(list(replies), [consultant_reply, consultant_reply])
+        with self._lock:
+            if self._comparison is not comparison:
+                return
+            self._counters["scored"] += 1
+            comparison.live_similarity.append(float(scores[0]))
+            comparison.candidate_similarity.append(float(scores[1]))
+            decision = self._decide(comparison)
+            if decision:
+                # Stop collecting for this candidate; the next one starts a fresh comparison
+                self._comparison = None
+                self._counters[decision] += 1
+        if decision:
+            self._apply(decision, comparison)
+
+    def _decide(self, comparison: _Comparison) -> Optional[str]:
+        """'promoted', 'rejected' or None (keep collecting). Caller holds the lock."""
+        scored = len(comparison.candidate_similarity)
+        if scored < self.min_samples:
+            return None
+        no_worse = (
+            statistics.fmean(comparison.candidate_similarity)
+            >= statistics.fmean(comparison.live_similarity) - self.similarity_tolerance
+            and statistics.median(comparison.candidate_latency)
+            <= statistics.median(comparison.live_latency) * (1 + self.latency_tolerance)
+            and statistics.fmean(comparison.candidate_length)
+            <= statistics.fmean(comparison.live_length) * (1 + self.length_tolerance)
+        )
+        if no_worse:
+            return "promoted"
+        if scored >= self.max_samples:
+            return "rejected"
+        return None
+
+    def _apply(self, decision: str, comparison: _Comparison):
+        metrics = comparison.summary()
+        try:
+            if decision == "promoted":
+                self.prompt_manager.promote_candidate(comparison.candidate, metrics)
+            else:
+                self.prompt_manager.reject_candidate(comparison.candidate, metrics)
+            print(f"Prompt candidate {comparison.candidate_version} {decision}: {metrics}")
+        except Exception as e:
+            print(f"Error recording shadow decision for {comparison.candidate_version}: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["in_flight"] = self._in_flight
+            stats["sample_rate"] = self.sample_rate
+            stats["comparison"] = self._comparison.summary() if self._comparison else None
+        return stats
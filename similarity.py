@@ -0,0 +1,100 @@
+"""
+Fast local text similarity, vectorized with NumPy.
+
+Texts are turned into hashed character n-gram vectors (robust to typos,
+punctuation and small rewordings) and hashed token sets (word overlap).
+Scoring a batch of pairs is a handful of matrix operations, so it can run
+over a whole training export without any LLM calls.
+"""
+import re
+import zlib
+from typing import Sequence
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _SPACE_RE.sub(" ", (text or "").lower()).strip()
+
+
+def _hash(feature: str, dim: int) -> int:
+    return zlib.crc32(feature.encode("utf-8")) % dim
+
+
+def hashed_ngram_vectors(texts: Sequence[str], n: int = 3, dim: int = 4096) -> np.ndarray:
+    """
+    L2-normalized hashed character n-gram count vectors.
+
+    Args:
+        texts: Texts to vectorize
+        n: Character n-gram size
+        dim: Number of hash buckets (vector dimension)
+
+    Returns:
+        float32 array of shape (len(texts), dim)
+    """
+    rows, cols = [], []
+    for row, text in enumerate(texts):
+        padded = f" {_normalize(text)} "
+        grams = [padded[i:i + n] for i in range(max(1, len(padded) - n + 1))]
+        rows.extend([row] * len(grams))
+        cols.extend(_hash(gram, dim) for gram in grams)
+
+    flat = np.bincount(np.asarray(rows, dtype=np.int64) * dim + np.asarray(cols, dtype=np.int64),
+                       minlength=len(texts) * dim)
+    vectors = flat.reshape(len(texts), dim).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def hashed_token_sets(texts: Sequence[str], dim: int = 4096) -> np.ndarray:
+    """Boolean (len(texts), dim) matrix marking which hashed word tokens occur in each text."""
+    matrix = np.zeros((len(texts), dim), dtype=bool)
+    for row, text in enumerate(texts):
+        tokens = _TOKEN_RE.findall(_normalize(text))
+        if tokens:
+            matrix[row, [_hash(token, dim) for token in tokens]] = True
+    return matrix
+
+
+class SimilarityScorer:
+    """Blends character n-gram cosine and token Jaccard into a 0..1 score."""
+
+    def __init__(self, ngram_weight: float = 0.6, token_weight: float = 0.4,
+                 n: int = 3, dim: int = 4096):
+        total = ngram_weight + token_weight
+        self.ngram_weight = ngram_weight / total
+        self.token_weight = token_weight / total
+        self.n = n
+        self.dim = dim
+
+    def score_pairs(self, left: Sequence[str], right: Sequence[str]) -> np.ndarray:
+        """
+        Score each pair (left[i], right[i]) in one vectorized pass.
+
+        Returns:
+            float32 array of similarity scores in [0, 1]
+        """
+        if len(left) != len(right):
+            raise ValueError("left and right must have the same length")
+        if not left:
+            return np.zeros(0, dtype=np.float32)
+
+        vectors = hashed_ngram_vectors(list(left) + list(right), self.n, self.dim)
+        cosine = np.einsum("ij,ij->i", vectors[:len(left)], vectors[len(left):])
+
+        tokens = hashed_token_sets(list(left) + list(right), self.dim)
+        a, b = tokens[:len(left)], tokens[len(left):]
+        union = (a | b).sum(axis=1)
+        jaccard = np.where(union > 0, (a & b).sum(axis=1) / np.maximum(union, 1), 1.0)
+
+        return np.clip(self.ngram_weight * cosine + self.token_weight * jaccard, 0.0, 1.0) \
+            .astype(np.float32)
+
+    def score(self, left: str, right: str) -> float:
+        """Similarity of a single pair."""
+        return float(self.score_pairs([left], [right])[0])
+
@@ -0,0 +1,233 @@
+"""
+Speculative reply generation from inbound-message webhooks.
+
+Consultants usually ask for a suggestion some time after the customer wrote,
+and then wait for the model. The CRM can instead report every message as it
+arrives. Client messages of a conversation are collected into its current
+client sequence, and `debounce` seconds after the last one a reply is
+generated in the background. When /generate-reply later asks about the same
+conversation state (client sequence and chat history) and the prompt version
+is unchanged, the stored reply is returned right away.
+
+Any new message in a conversation invalidates its stored reply, and a
+speculation still running for the old state is discarded when it finishes.
+A /generate-reply that arrives while the speculation is in flight joins the
+same Gemini call through the client's single-flight coalescing.
+"""
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+# (client_sequence, chat_history, scenario) -> (prompt version, /generate-reply payload)
+ReplyGenerator = Callable[[List[str], List[Dict], Optional[str]], Tuple[str, Dict]]
+
+
+def state_key(client_sequence: List[str], chat_history: Optional[List[Dict]]) -> str:
+    """Identity of a conversation state; only the direction and text of history messages count."""
+    history = [(m.get("direction"), m.get("text")) for m in chat_history or []]
+    return hashlib.sha256(
+        json.dumps([client_sequence, history], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+class _Conversation:
+    __slots__ = ("client_sequence", "chat_history", "scenario", "revision", "due_at",
+                 "context", "result_key", "updated_at")
+
+    def __init__(self):
+        self.client_sequence: List[str] = []
+        self.chat_history: List[Dict] = []
+        self.scenario: Optional[str] = None
+        # Bumped on every message, so a speculation can tell it has gone stale
+        self.revision = 0
+        self.due_at: Optional[float] = None
+        self.context: Optional[contextvars.Context] = None
+        self.result_key: Optional[str] = None
+        self.updated_at = time.monotonic()
+
+
+class SpeculativeReplies:
+    """Debounced background reply generation keyed by conversation state."""
+
+    def __init__(self, generate: ReplyGenerator, debounce: float = 3.0, ttl: float = 900.0,
+                 max_conversations: int = 10000, max_in_flight: int = 4):
+        """
+        Args:
+            generate: Produces the prompt version and /generate-reply payload for a state
+            debounce: Seconds without a new client message before a reply is generated
+            ttl: Seconds an idle conversation and its stored reply are kept
+            max_conversations: Conversations tracked at once (least recently active dropped)
+            max_in_flight: Concurrent speculative generations; more are skipped
+        """
+        self.generate = generate
+        self.debounce = debounce
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self.max_in_flight = max(1, max_in_flight)
+        self._conversations: "OrderedDict[str, _Conversation]" = OrderedDict()
+        # State key -> (prompt version, payload, stored at)
+        self._results: Dict[str, Tuple[str, Dict, float]] = {}
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                            thread_name_prefix="speculate")
+        self._counters = {"messages": 0, "speculations": 0, "skipped": 0, "failed": 0,
+                          "stale": 0, "invalidated": 0, "hits": 0, "misses": 0,
+                          "prompt_changed": 0}
+        threading.Thread(target=self._run, name="speculation-timer", daemon=True).start()
+
+    def _conversation(self, conversation_id: str) -> _Conversation:
+        conversation = self._conversations.pop(conversation_id, None) or _Conversation()
+        self._conversations[conversation_id] = conversation
+        while len(self._conversations) > self.max_conversations:
+            _, oldest = self._conversations.popitem(last=False)
+            self._drop_result(oldest)
+        return conversation
+
+    def _drop_result(self, conversation: _Conversation):
+        if conversation.result_key is not None:
+            self._results.pop(conversation.result_key, None)
+            conversation.result_key = None
+
+    def message(self, conversation_id: str, direction: str, text: str,
+                chat_history: Optional[List[Dict]] = None,
+                scenario: Optional[str] = None) -> Dict:
+        """
+        Record a new message of a conversation.
+
+        Client messages ("in") extend the client sequence and (re)start the debounce.
+        Consultant messages ("out") end the turn: the sequence moves into the history.
+
+        Args:
+            conversation_id: Conversation identifier from the CRM
+            direction: "in" for the client, "out" for the consultant
+            text: Message text
+            chat_history: Messages before the current client sequence, if the CRM sends them
+            scenario: Optional scenario hint, as for /generate-reply
+
+        Returns:
+            The conversation's client sequence and when a reply will be speculated
+        """
+        with self._cond:
+            self._counters["messages"] += 1
+            conversation = self._conversation(conversation_id)
+            conversation.revision += 1
+            conversation.updated_at = time.monotonic()
+            if conversation.result_key is not None:
+                self._counters["invalidated"] += 1
+                self._drop_result(conversation)
+
+            if chat_history is not None:
+                conversation.chat_history = list(chat_history)
+            if scenario is not None:
+                conversation.scenario = scenario
+
+            if direction == "in":
+                conversation.client_sequence.append(text)
+                conversation.due_at = time.monotonic() + self.debounce
+                # Labels of the webhook request (endpoint, tenant) go with the speculation
+                conversation.context = contextvars.copy_context()
+                self._cond.notify_all()
+            else:
+                if chat_history is None:
+                    conversation.chat_history += [{"direction": "in", "text": m}
+                                                  for m in conversation.client_sequence]
+                    conversation.chat_history.append({"direction": direction, "text": text})
+                conversation.client_sequence = []
+                conversation.due_at = None
+
+            return {
+                "conversationId": conversation_id,
+                "clientSequence": list(conversation.client_sequence),
+                "speculateInSeconds": self.debounce if conversation.due_at is not None else None
+            }
+
+    def _run(self):
+        """Start speculations whose debounce has expired."""
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                due = [(cid, c) for cid, c in self._conversations.items()
+                       if c.due_at is not None and c.due_at <= now]
+                if not due:
+                    next_due = min((c.due_at for c in self._conversations.values()
+                                    if c.due_at is not None), default=None)
+                    # Wake up at least once a minute to forget idle conversations
+                    self._cond.wait(60.0 if next_due is None else min(60.0, next_due - now))
+                    self._expire()
+                    continue
+                for conversation_id, conversation in due:
+                    conversation.due_at = None
+                    if self._in_flight >= self.max_in_flight:
+                        # Behind already; /generate-reply will generate it when asked
+                        self._counters["skipped"] += 1
+                        continue
+                    self._in_flight += 1
+                    self._counters["speculations"] += 1
+                    self._executor.submit(
+                        conversation.context.run, self._speculate, conversation_id,
+                        conversation.revision, list(conversation.client_sequence),
+                        list(conversation.chat_history), conversation.scenario
+                    )
+
+    def _speculate(self, conversation_id: str, revision: int, client_sequence: List[str],
+                   chat_history: List[Dict], scenario: Optional[str]):
+        try:
+            version, payload = self.generate(client_sequence, chat_history, scenario)
+        except Exception as e:
+            print(f"Speculative reply failed for {conversation_id}: {e}")
+            with self._cond:
+                self._in_flight -= 1
+                self._counters["failed"] += 1
+            return
+        with self._cond:
+            self._in_flight -= 1
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None or conversation.revision != revision or payload.get("degraded"):
+                # A newer message arrived meanwhile (or Gemini was down): don't serve this
+                self._counters["stale"] += 1
+                return
+            key = state_key(client_sequence, chat_history)
+            self._results[key] = (version, payload, time.monotonic())
+            conversation.result_key = key
+
+    def _expire(self):
+        """Forget idle conversations. Caller holds the lock."""
+        expired_before = time.monotonic() - self.ttl
+        for conversation_id in list(self._conversations):
+            conversation = self._conversations[conversation_id]
+            if conversation.updated_at >= expired_before:
+                break
+            del self._conversations[conversation_id]
+            self._drop_result(conversation)
+
+    def lookup(self, client_sequence: List[str], chat_history: Optional[List[Dict]],
+               version: str) -> Optional[Dict]:
+        """Precomputed payload for this conversation state and prompt version, if any."""
+        key = state_key(client_sequence, chat_history)
+        with self._cond:
+            result = self._results.get(key)
+            if result is None or time.monotonic() - result[2] > self.ttl:
+                self._counters["misses"] += 1
+                return None
+            if result[0] != version:
+                # The prompt changed since; the speculated reply is outdated
+                self._counters["prompt_changed"] += 1
+                self._results.pop(key, None)
+                return None
+            self._counters["hits"] += 1
+            return dict(result[1])
+
+    def stats(self) -> Dict:
+        with self._cond:
+            stats = dict(self._counters)
+            stats["conversations"] = len(self._conversations)
+            stats["stored"] = len(self._results)
+            stats["in_flight"] = self._in_flight
+        stats["debounce_seconds"] = self.debounce
+        return stats
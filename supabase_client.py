@@ -3,7 +3,7 @@ Supabase client setup and database operations.
 """
 from supabase import create_client, Client
 from config import SUPABASE_URL, SUPABASE_ANON_KEY
-from typing import Optional, Dict, List
+from typing import Callable, Optional, Dict, List, Tuple
 from datetime import datetime
 
 
@@ -23,6 +23,17 @@ class SupabaseDB:
         # This is just a reference for the schema
         pass
     
+    def subscribe_prompt_changes(self, callback: Callable[[Optional[str]], None]) -> bool:
+        """
+        Register a callback for new prompt versions written by any worker.
+        
+        PostgREST has no change notifications, so this backend can't deliver them.
+        
+        Returns:
+            Whether notifications will be delivered
+        """
+        return False
+    
     # ========== PROMPTS TABLE OPERATIONS ==========
     
     def get_latest_prompt(self) -> Optional[str]:
@@ -91,6 +102,192 @@ class SupabaseDB:
             print(f"Error fetching prompts: {e}")
             return []
     
+    def get_prompts_page(self, after: Optional[Tuple[str, str]] = None,
+                         limit: int = 1000) -> List[Dict]:
+        """
+        Get one page of prompts, oldest first, using keyset pagination.
+        
+        Args:
+            after: (created_at, id) of the last row of the previous page, or None to start
+            limit: Page size
+            
+        Returns:
+            List of prompt records; fewer than `limit` means this was the last page
+        """
+        return self._get_page("prompts", "id, content, created_at", after, limit)
+    
+    # ========== PROMPT SHARDS TABLE OPERATIONS ==========
+    
+    def get_latest_prompt_shard(self, scenario: str) -> Optional[str]:
+        """
+        Get the most recent prompt shard for a scenario.
+        
+        Args:
+            scenario: Scenario shard key
+            
+        Returns:
+            The latest shard content, or None if the scenario has no shard yet
+        """
+        try:
+            response = self.client.table("prompt_shards") \
+                .select("content") \
+                .eq("scenario", scenario) \
+                .order("created_at", desc=True) \
+                .limit(1) \
+                .execute()
+            
+            if response.data and len(response.data) > 0:
+                return response.data[0]["content"]
+            return None
+        except Exception as e:
+            print(f"Error fetching prompt shard for {scenario}: {e}")
+            return None
+    
+    def save_prompt_shard(self, scenario: str, content: str) -> Dict:
+        """
+        Save a new version of a scenario's prompt shard.
+        
+        Args:
+            scenario: Scenario shard key
+            content: The shard content
+            
+        Returns:
+            The saved shard record
+        """
+        try:
+            response = self.client.table("prompt_shards") \
+                .insert({
+                    "scenario": scenario,
+                    "content": content,
+                    "created_at": datetime.utcnow().isoformat()
+                }) \
+                .execute()
+            
+            return response.data[0] if response.data else {}
+        except Exception as e:
+            print(f"Error saving prompt shard: {e}")
+            raise
+    
+    # ========== PROMPT CANDIDATES TABLE OPERATIONS ==========
+    
+    def get_latest_prompt_candidate(self, status: str = "shadow") -> Optional[Dict]:
+        """
+        Get the system prompt candidate currently in shadow evaluation.
+        
+        Args:
+            status: "shadow" for the candidate under evaluation, "queued" for the
+                edits waiting to become the next candidate
+        
+        Returns:
+            The candidate record (id, content, created_at), or None if there is none
+        """
+        try:
+            response = self.client.table("prompt_candidates") \
+                .select("id, content, created_at") \
+                .eq("status", status) \
+                .order("created_at", desc=True) \
+                .limit(1) \
+                .execute()
+            
+            if response.data and len(response.data) > 0:
+                return response.data[0]
+            return None
+        except Exception as e:
+            print(f"Error fetching prompt candidate: {e}")
+            return None
+    
+    def save_prompt_candidate(self, content: str, status: str = "shadow") -> Dict:
+        """
+        Save a new system prompt candidate for shadow evaluation.
+        
+        Any earlier candidate with the same status is marked as superseded.
+        
+        Args:
+            content: The candidate prompt content
+            status: "shadow" to evaluate it now, "queued" to evaluate it next
+            
+        Returns:
+            The saved candidate record
+        """
+        try:
+            self.supersede_prompt_candidates(status)
+            response = self.client.table("prompt_candidates") \
+                .insert({
+                    "content": content,
+                    "status": status,
+                    "created_at": datetime.utcnow().isoformat()
+                }) \
+                .execute()
+            
+            return response.data[0] if response.data else {}
+        except Exception as e:
+            print(f"Error saving prompt candidate: {e}")
+            raise
+    
+    def supersede_prompt_candidates(self, status: str = "queued"):
+        """
+        Mark every candidate with the given status as superseded.
+        
+        Args:
+            status: Status of the candidates to supersede, e.g. "queued"
+        """
+        try:
+            self.client.table("prompt_candidates") \
+                .update({"status": "superseded", "decided_at": datetime.utcnow().isoformat()}) \
+                .eq("status", status) \
+                .execute()
+        except Exception as e:
+            print(f"Error superseding prompt candidates: {e}")
+            raise
+    
+    def start_prompt_candidate(self, candidate_id: str) -> Dict:
+        """
+        Move a queued candidate into shadow evaluation.
+        
+        Args:
+            candidate_id: Candidate record id
+            
+        Returns:
+            The updated candidate record
+        """
+        try:
+            response = self.client.table("prompt_candidates") \
+                .update({"status": "shadow"}) \
+                .eq("id", candidate_id) \
+                .execute()
+            
+            return response.data[0] if response.data else {}
+        except Exception as e:
+            print(f"Error starting prompt candidate: {e}")
+            raise
+    
+    def update_prompt_candidate(self, candidate_id: str, status: str, metrics: Dict) -> Dict:
+        """
+        Record the outcome of a candidate's shadow evaluation.
+        
+        Args:
+            candidate_id: Candidate record id
+            status: "promoted" or "rejected"
+            metrics: Comparison against the live prompt
+            
+        Returns:
+            The updated candidate record
+        """
+        try:
+            response = self.client.table("prompt_candidates") \
+                .update({
+                    "status": status,
+                    "metrics": metrics,
+                    "decided_at": datetime.utcnow().isoformat()
+                }) \
+                .eq("id", candidate_id) \
+                .execute()
+            
+            return response.data[0] if response.data else {}
+        except Exception as e:
+            print(f"Error updating prompt candidate: {e}")
+            raise
+    
     # ========== EDITOR PROMPT TABLE OPERATIONS ==========
     
     def get_latest_editor_prompt(self) -> Optional[str]:
@@ -168,4 +365,77 @@ class SupabaseDB:
         except Exception as e:
             print(f"Error saving training example: {e}")
             raise
-
+    
+    def get_recent_training_examples(self, limit: int = 1000) -> List[Dict]:
+        """
+        Get the most recent training examples.
+        
+        Args:
+            limit: Maximum number of examples to return
+            
+        Returns:
+            List of training example records, newest first
+        """
+        try:
+            response = self.client.table("training_examples") \
+                .select("client_sequence, chat_history, consultant_reply, created_at") \
+                .order("created_at", desc=True) \
+                .limit(limit) \
+                .execute()
+            
+            return response.data if response.data else []
+        except Exception as e:
+            print(f"Error fetching training examples: {e}")
+            return []
+    
+    def get_training_examples_page(self, after: Optional[Tuple[str, str]] = None,
+                                   limit: int = 1000, newest_first: bool = False) -> List[Dict]:
+        """
+        Get one page of training examples, oldest first, using keyset pagination.
+        
+        Args:
+            after: (created_at, id) of the last row of the previous page, or None to start
+            limit: Page size
+            newest_first: Page from the newest row backwards instead
+            
+        Returns:
+            List of training example records; fewer than `limit` means this was the last page
+        """
+        return self._get_page(
+            "training_examples",
+            "id, client_sequence, chat_history, consultant_reply, ai_reply, created_at",
+            after, limit, newest_first
+        )
+    
+    # ========== KEYSET PAGINATION ==========
+    
+    def _get_page(self, table: str, columns: str, after: Optional[Tuple[str, str]],
+                  limit: int, newest_first: bool = False) -> List[Dict]:
+        """
+        Rows of `table` ordered by (created_at, id) that come after the `after` cursor.
+        
+        Unlike OFFSET paging, each page is an index range scan, so late pages cost
+        the same as the first one. With newest_first the order (and the cursor
+        comparison) is reversed. Errors are raised so an export never looks
+        complete when it isn't.
+        """
+        try:
+            query = self.client.table(table) \
+                .select(columns) \
+                .order("created_at", desc=newest_first) \
+                .order("id", desc=newest_first) \
+                .limit(limit)
+            if after is not None:
+                created_at, row_id = after
+                op = "lt" if newest_first else "gt"
+                # Quoted: timestamps contain characters that are reserved in filter syntax
+                query = query.or_(
+                    f'created_at.{op}."{created_at}",'
+                    f'and(created_at.eq."{created_at}",id.{op}.{row_id})'
+                )
+            response = query.execute()
+            
+            return response.data if response.data else []
+        except Exception as e:
+            print(f"Error fetching {table} page: {e}")
+            raise
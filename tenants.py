@@ -0,0 +1,189 @@
+"""
+Per-tenant admission control for the HTTP API.
+
+Internal teams and CRM integrations share the Flask workers and the Gemini
+quota. Each tenant (API key, or client address when no keys are configured)
+gets its own token bucket and concurrency cap. Requests that pass those wait
+for one of the shared worker slots, which are handed out with start-time fair
+queueing across tenants. A tenant that floods the service therefore queues
+behind its own requests, not in front of everyone else's.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional
+
+from rate_limiter import RateLimitExceeded, TokenBucket
+
+
+class TenantLimits:
+    """Limits of one tenant."""
+
+    def __init__(self, rpm: float, max_concurrency: int, weight: float = 1.0,
+                 max_queued: Optional[int] = None):
+        """
+        Args:
+            rpm: Requests per minute (bursts up to the same amount)
+            max_concurrency: Requests of this tenant being served at once
+            weight: Share of the shared slots when several tenants are waiting
+            max_queued: Requests allowed to wait for a slot (default: max_concurrency);
+                more are rejected right away instead of tying up a worker thread
+        """
+        self.rpm = rpm
+        self.max_concurrency = max(1, max_concurrency)
+        self.weight = max(weight, 0.001)
+        self.max_queued = self.max_concurrency if max_queued is None else max_queued
+
+
+class _Ticket:
+    __slots__ = ("tenant", "tag", "enqueued_at", "granted")
+
+    def __init__(self, tenant: "_Tenant", tag: float):
+        self.tenant = tenant
+        self.tag = tag
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class _Tenant:
+    def __init__(self, name: str, limits: TenantLimits):
+        self.name = name
+        self.limits = limits
+        self.bucket = TokenBucket(limits.rpm)
+        self.queue: Deque[_Ticket] = deque()
+        self.in_flight = 0
+        self.last_tag = 0.0
+        self.stats = {"admitted": 0, "rate_limited": 0, "queue_full": 0, "timed_out": 0,
+                      "wait_total": 0.0, "wait_max": 0.0}
+
+
+class TenantAdmission:
+    """Token buckets, concurrency caps and fair queueing across tenants."""
+
+    def __init__(self, capacity: int, default_limits: TenantLimits,
+                 tenant_limits: Optional[Dict[str, TenantLimits]] = None,
+                 queue_timeout: float = 10.0, max_tenants: int = 1000):
+        """
+        Args:
+            capacity: Requests served at once across all tenants (the worker pool size)
+            default_limits: Limits of tenants without an entry in tenant_limits
+            tenant_limits: Limits by tenant name
+            queue_timeout: Max seconds a request may wait for a slot
+            max_tenants: Idle tenants beyond this many are forgotten (oldest first)
+        """
+        self.capacity = max(1, capacity)
+        self.default_limits = default_limits
+        self.tenant_limits = tenant_limits or {}
+        self.queue_timeout = queue_timeout
+        self.max_tenants = max_tenants
+        self._tenants: "OrderedDict[str, _Tenant]" = OrderedDict()
+        self._virtual_time = 0.0
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+    def _tenant(self, name: str) -> _Tenant:
+        tenant = self._tenants.get(name)
+        if tenant is None:
+            tenant = self._tenants[name] = _Tenant(name, self.tenant_limits.get(name, self.default_limits))
+            self._evict_idle()
+        else:
+            self._tenants.move_to_end(name)
+        return tenant
+
+    def _evict_idle(self):
+        # Per-address tenants come and go; drop idle ones so memory stays bounded
+        for name in list(self._tenants):
+            if len(self._tenants) <= self.max_tenants:
+                return
+            tenant = self._tenants[name]
+            if tenant.in_flight == 0 and not tenant.queue:
+                del self._tenants[name]
+
+    def _dispatch(self):
+        """Grant free slots to the queued tickets with the smallest virtual tags."""
+        while self._in_use < self.capacity:
+            best = None
+            for tenant in self._tenants.values():
+                if tenant.queue and tenant.in_flight < tenant.limits.max_concurrency \
+                        and (best is None or tenant.queue[0].tag < best.tag):
+                    best = tenant.queue[0]
+            if best is None:
+                return
+            tenant = best.tenant
+            tenant.queue.popleft()
+            tenant.in_flight += 1
+            self._in_use += 1
+            best.granted = True
+            self._virtual_time = max(self._virtual_time, best.tag)
+            waited = time.monotonic() - best.enqueued_at
+            tenant.stats["admitted"] += 1
+            tenant.stats["wait_total"] += waited
+            tenant.stats["wait_max"] = max(tenant.stats["wait_max"], waited)
+            self._cond.notify_all()
+
+    def acquire(self, name: str):
+        """
+        Admit one request of tenant `name`; pair with release(name).
+
+        Raises:
+            RateLimitExceeded: Over the tenant's rate, queue or wait limits (retry_after set)
+        """
+        with self._cond:
+            tenant = self._tenant(name)
+            # Checked first, so requests turned away here don't use up the tenant's rate
+            if len(tenant.queue) >= tenant.limits.max_queued:
+                tenant.stats["queue_full"] += 1
+                raise RateLimitExceeded(f"Too many concurrent requests for tenant {name}",
+                                        retry_after=1.0)
+            wait = tenant.bucket.try_acquire()
+            if wait > 0:
+                tenant.stats["rate_limited"] += 1
+                raise RateLimitExceeded(f"Rate limit exceeded for tenant {name}", retry_after=wait)
+
+            tag = max(self._virtual_time, tenant.last_tag) + 1.0 / tenant.limits.weight
+            tenant.last_tag = tag
+            ticket = _Ticket(tenant, tag)
+            tenant.queue.append(ticket)
+            self._dispatch()
+
+            if not self._cond.wait_for(lambda: ticket.granted, self.queue_timeout):
+                tenant.queue.remove(ticket)
+                tenant.stats["timed_out"] += 1
+                raise RateLimitExceeded(f"Timed out waiting for a request slot (tenant {name})",
+                                        retry_after=1.0)
+
+    def release(self, name: str):
+        with self._cond:
+            tenant = self._tenants.get(name)
+            if tenant is not None:
+                tenant.in_flight -= 1
+            self._in_use -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, name: str):
+        """Context-manager form of acquire/release."""
+        self.acquire(name)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            result = {"in_use": self._in_use, "capacity": self.capacity, "tenants": {}}
+            for name, tenant in self._tenants.items():
+                stats = tenant.stats
+                admitted = stats["admitted"]
+                result["tenants"][name] = {
+                    "in_flight": tenant.in_flight,
+                    "queued": len(tenant.queue),
+                    "admitted": admitted,
+                    "rate_limited": stats["rate_limited"],
+                    "queue_full": stats["queue_full"],
+                    "timed_out": stats["timed_out"],
+                    "avg_wait_ms": round(1000 * stats["wait_total"] / admitted, 1) if admitted else 0.0,
+                    "max_wait_ms": round(1000 * stats["wait_max"], 1)
+                }
+            return result
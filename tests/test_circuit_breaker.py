@@ -0,0 +1,74 @@
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", lambda: now[0])
+    return now
+
+
+def call(breaker, ok=True, slow=False):
+    assert breaker.acquire()
+    breaker.record(ok=ok, slow=slow)
+
+
+def opened_breaker():
+    breaker = CircuitBreaker("flash", failure_ratio=0.5, min_calls=4, open_duration=30.0)
+    for ok in (True, False, True, False):
+        call(breaker, ok=ok)
+    return breaker
+
+
+def test_opens_on_failure_ratio_and_fails_fast(clock):
+    breaker = opened_breaker()
+
+    assert breaker.state == OPEN
+    assert not breaker.acquire()
+    assert breaker.retry_after() == pytest.approx(30.0)
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_slow_calls_count_as_bad(clock):
+    breaker = CircuitBreaker("flash", failure_ratio=0.5, min_calls=4)
+    for slow in (True, True, False, False):
+        call(breaker, slow=slow)
+
+    assert breaker.state == OPEN
+
+
+def test_half_open_probe_closes_or_reopens(clock):
+    breaker = opened_breaker()
+    clock[0] += 30
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.acquire()
+    # Only one probe at a time
+    assert not breaker.acquire()
+    breaker.record(ok=False)
+    assert breaker.state == OPEN
+
+    clock[0] += 30
+    call(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_released_probe_lets_the_next_call_probe(clock):
+    breaker = opened_breaker()
+    clock[0] += 30
+
+    assert breaker.acquire()
+    # e.g. a 429: no verdict on the model's health
+    breaker.release()
+    assert breaker.acquire()
+
+
+def test_registry_keeps_one_breaker_per_model():
+    registry = CircuitBreakerRegistry(min_calls=2)
+
+    assert registry.get("flash") is registry.get("flash")
+    assert registry.get("pro") is not registry.get("flash")
+    assert set(registry.stats()) == {"flash", "pro"}
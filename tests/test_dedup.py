@@ -0,0 +1,81 @@
+import multiprocessing
+
+from dedup import NearDuplicateIndex
+
+WRITERS = 3
+BATCHES = 10
+
+
+def example(text, reply="Sure, we can help with that."):
+    return {"client_sequence": [text], "consultant_reply": reply}
+
+
+def unique_text(writer, batch, i):
+    return f"case {writer:02d}-{batch:02d}-{i:02d}: " + " ".join(
+        f"w{writer}b{batch}i{i}t{t}" for t in range(12))
+
+
+def train_examples(directory, writer):
+    index = NearDuplicateIndex(directory)
+    for batch in range(BATCHES):
+        examples = [example(unique_text(writer, batch, i)) for i in range(3)]
+        unique, _ = index.filter(examples)
+        index.commit(unique)
+
+
+def test_near_duplicates_within_and_across_batches_are_dropped(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path))
+    question = "Hi, how long does a tourist visa for Canada take to process these days?"
+
+    unique, duplicates = index.filter([example(question), example(question + "  "),
+                                       example("Do I need a bank statement for a student visa?")])
+    assert (len(unique), duplicates) == (2, 1)
+    index.commit(unique)
+
+    unique, duplicates = index.filter([example(question.upper())])
+    assert (unique, duplicates) == ([], 1)
+
+
+def test_released_examples_can_be_retried_and_committed_ones_persist(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path))
+    trained, failed = example("first question about visas"), example("second question about fees")
+
+    unique, _ = index.filter([trained, failed])
+    index.settle(unique, [{"status": "updated"}, {"status": "error"}])
+
+    reopened = NearDuplicateIndex(str(tmp_path))
+    assert reopened.filter([trained, failed]) == ([failed], 1)
+
+
+def test_processes_sharing_the_index_see_each_others_signatures(tmp_path):
+    directory = str(tmp_path)
+    server = NearDuplicateIndex(directory)
+
+    context = multiprocessing.get_context("fork")
+    writers = [context.Process(target=train_examples, args=(directory, w)) for w in range(WRITERS)]
+    for process in writers:
+        process.start()
+    for process in writers:
+        process.join(60)
+        assert process.exitcode == 0
+
+    # The long-lived instance skips what the other processes trained
+    trained = [example(unique_text(w, b, i)) for w in range(WRITERS) for b in range(BATCHES) for i in range(3)]
+    assert server.filter(trained) == ([], len(trained))
+    # Interleaved appends left whole, aligned rows
+    assert len(NearDuplicateIndex(directory)) == len(trained)
+
+
+def test_partial_row_from_a_crash_is_dropped_on_commit(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path))
+    first = example("first question about visas")
+    index.commit(index.filter([first])[0])
+    with open(tmp_path / "signatures.u32", "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    second = example("second question about fees")
+    index.commit(index.filter([second])[0])
+
+    reopened = NearDuplicateIndex(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.filter([first, second]) == ([], 2)
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from export import iter_pages, ndjson_export, parse_cursor, row_cursor
+
+ROWS = [{"id": f"00000000-0000-4000-8000-{i:012d}", "created_at": f"2024-05-01T10:00:{i // 2:02d}+00:00"}
+        for i in range(25)]
+
+
+def table_fetcher(rows, fail_after=None):
+    calls = []
+
+    def fetch_page(after, size):
+        calls.append((after, size))
+        if fail_after is not None and len(calls) > fail_after:
+            raise RuntimeError("database went away")
+        remaining = [r for r in rows if after is None or row_cursor(r) > after]
+        return remaining[:size]
+
+    return fetch_page, calls
+
+
+def test_pages_follow_the_keyset_cursor():
+    fetch_page, calls = table_fetcher(ROWS)
+
+    pages = list(iter_pages(fetch_page, page_size=10))
+
+    assert [len(p) for p in pages] == [10, 10, 5]
+    assert [r for page in pages for r in page] == ROWS
+    assert calls[1][0] == row_cursor(ROWS[9])
+
+
+def test_resume_after_cursor_with_limit():
+    fetch_page, calls = table_fetcher(ROWS)
+
+    lines = "".join(ndjson_export(fetch_page, row_cursor(ROWS[4]), page_size=4, limit=6)).splitlines()
+
+    assert [json.loads(line) for line in lines] == ROWS[5:11]
+    # The last query asks only for the rows still missing
+    assert calls[-1][1] == 2
+
+
+def test_failure_mid_export_ends_with_an_error_line():
+    fetch_page, _ = table_fetcher(ROWS, fail_after=1)
+
+    lines = "".join(ndjson_export(fetch_page, page_size=10)).splitlines()
+
+    assert len(lines) == 11
+    assert json.loads(lines[-1]) == {"error": "database went away"}
+
+
+def test_cursor_is_normalized():
+    assert parse_cursor("2024-05-01T10:00:00.5+00:00", "6F1C2B3A-1111-4222-8333-444455556666") == \
+        ("2024-05-01T10:00:00.500000+00:00", "6f1c2b3a-1111-4222-8333-444455556666")
+
+
+@pytest.mark.parametrize("created_at, row_id", [
+    ('2024-05-01T10:00:00",id.gt.0),(id.gt."', "6f1c2b3a-1111-4222-8333-444455556666"),
+    ("2024-05-01T10:00:00+00:00", "1),or(id.gt.0"),
+])
+def test_cursor_with_filter_syntax_is_rejected(created_at, row_id):
+    with pytest.raises(ValueError):
+        parse_cursor(created_at, row_id)
@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import ALL_COMPLETED
+from concurrent.futures import wait as real_wait
+
+import pytest
+
+import hedging
+from hedging import Hedger
+
+
+def hedger_that_always_hedges():
+    hedger = Hedger()
+    hedger.threshold = lambda: 0.01
+    hedger._take_budget = lambda: True
+    return hedger
+
+
+def test_success_wins_when_both_attempts_finish_in_the_same_round(monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(None)
+        attempt = len(calls)
+        release.wait(5)
+        if attempt == 1:
+            raise RuntimeError("primary failed")
+        return "hedge reply"
+
+    def wait(futures, timeout=None, return_when=None):
+        if return_when is None:
+            return real_wait(futures, timeout=timeout)
+        # Let both attempts finish, then report them together, the failure first
+        release.set()
+        futures = sorted(futures, key=lambda f: f is not primary_future[0])
+        real_wait(futures, return_when=ALL_COMPLETED)
+        return futures, set()
+
+    hedger = hedger_that_always_hedges()
+    primary_future = []
+    submit = hedger._executor.submit
+
+    def record_submit(*args, **kwargs):
+        future = submit(*args, **kwargs)
+        primary_future.append(future)
+        return future
+
+    monkeypatch.setattr(hedger._executor, "submit", record_submit)
+    monkeypatch.setattr(hedging, "wait", wait)
+
+    assert hedger.run(call) == "hedge reply"
+    assert hedger.stats()["hedge_wins"] == 1
+
+
+def test_raises_when_both_attempts_fail():
+    def call():
+        threading.Event().wait(0.05)
+        raise RuntimeError("failed")
+
+    with pytest.raises(RuntimeError):
+        hedger_that_always_hedges().run(call)
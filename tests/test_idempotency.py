@@ -0,0 +1,79 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import idempotency
+from idempotency import IdempotencyConflict, IdempotencyStore
+
+
+def test_retry_after_completion_replays_the_stored_result():
+    store = IdempotencyStore()
+    calls = []
+
+    def handler():
+        calls.append(None)
+        return {"reply": "hello"}
+
+    assert store.run("k", "body", handler) == ({"reply": "hello"}, False)
+    assert store.run("k", "body", handler) == ({"reply": "hello"}, True)
+    assert len(calls) == 1
+
+
+def test_concurrent_retry_joins_the_running_request():
+    store = IdempotencyStore()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def handler():
+        calls.append(None)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(store.run, "k", "body", handler)
+        started.wait(5)
+        second = pool.submit(store.run, "k", "body", handler)
+        release.set()
+        assert first.result(5) == ("result", False)
+        assert second.result(5) == ("result", True)
+    assert len(calls) == 1
+    assert store.stats()["joined"] == 1
+
+
+def test_same_key_with_another_body_is_a_conflict():
+    store = IdempotencyStore()
+    store.run("k", "body", lambda: "result")
+
+    with pytest.raises(IdempotencyConflict):
+        store.run("k", "other body", lambda: "result")
+
+
+def test_failures_and_unkept_results_are_not_stored():
+    store = IdempotencyStore()
+
+    def fail():
+        raise RuntimeError("gemini down")
+
+    with pytest.raises(RuntimeError):
+        store.run("k", "body", fail)
+    assert store.run("k", "body", lambda: "second try") == ("second try", False)
+
+    store.run("degraded", "body", lambda: {"degraded": True}, keep=lambda r: not r["degraded"])
+    assert store.run("degraded", "body", lambda: {"degraded": False},
+                     keep=lambda r: not r["degraded"]) == ({"degraded": False}, False)
+
+
+def test_results_expire_and_overflow_is_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(idempotency.time, "time", lambda: now[0])
+    store = IdempotencyStore(max_entries=2, ttl=60.0)
+
+    for key in ("a", "b", "c"):
+        store.run(key, "body", lambda: key)
+    assert store.stats()["stored"] == 2
+    assert store.run("a", "body", lambda: "rerun") == ("rerun", False)
+
+    now[0] += 61
+    assert store.run("b", "body", lambda: "expired") == ("expired", False)
@@ -0,0 +1,61 @@
+import pytest
+
+import model_router
+from model_router import ModelRoute, ModelRouter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(model_router.time, "monotonic", lambda: now[0])
+    return now
+
+
+def router(**route):
+    return ModelRouter({"generate_reply": ModelRoute("pro", "flash", **route)},
+                       min_samples=4, cooldown=60.0)
+
+
+def test_primary_first_while_healthy(clock):
+    r = router(latency_slo=2.0)
+    for _ in range(10):
+        r.record("generate_reply", "pro", 0.5, ok=True)
+
+    assert r.candidates("generate_reply") == ["pro", "flash"]
+
+
+def test_latency_slo_breach_moves_traffic_to_fallback_until_cooldown(clock):
+    r = router(latency_slo=2.0)
+    for _ in range(4):
+        r.record("generate_reply", "pro", 3.0, ok=True)
+
+    assert r.candidates("generate_reply") == ["flash", "pro"]
+    assert r.stats()["routes"]["generate_reply"]["degraded"]
+
+    clock[0] += 61
+    assert r.candidates("generate_reply") == ["pro", "flash"]
+
+
+def test_errors_degrade_the_primary(clock):
+    r = router()
+    for ok in (True, False, False, True):
+        r.record("generate_reply", "pro", 0.5, ok=ok)
+
+    assert r.candidates("generate_reply") == ["flash", "pro"]
+    assert r.stats()["degradations"] == 1
+
+
+def test_fallback_outcomes_do_not_degrade_the_route(clock):
+    r = router(latency_slo=2.0)
+    for _ in range(10):
+        r.record("generate_reply", "flash", 5.0, ok=False)
+
+    assert r.candidates("generate_reply") == ["pro", "flash"]
+
+
+def test_route_without_fallback_and_unknown_task():
+    r = ModelRouter({"improve_prompt": ModelRoute("pro", "pro")})
+
+    assert r.candidates("improve_prompt") == ["pro"]
+    with pytest.raises(ValueError):
+        r.candidates("missing")
@@ -0,0 +1,60 @@
+from prompt_compactor import PromptCompactor
+
+
+class FakeClient:
+    def __init__(self, rewrite):
+        self.rewrite = rewrite
+        self.calls = 0
+
+    def compact_prompt(self, editor_prompt, existing_prompt, token_budget, priority):
+        self.calls += 1
+        return self.rewrite(existing_prompt)
+
+
+class FakeReplayer:
+    def __init__(self, scores):
+        self.scores = scores
+
+    def score_many(self, prompts, priority):
+        return self.scores
+
+
+def prompt_of(tokens):
+    return "x" * (tokens * 4)
+
+
+def test_rejected_compaction_is_not_retried_until_the_prompt_grows():
+    client = FakeClient(lambda prompt: prompt[: len(prompt) // 2])
+    compactor = PromptCompactor(client, FakeReplayer([0.8, 0.5]), token_budget=100, retry_growth=0.1)
+
+    prompt = prompt_of(200)
+    assert compactor.compact(prompt, "editor") == prompt
+    assert client.calls == 1
+
+    # Small edits on top of the rejected prompt don't trigger another editor + replay round
+    assert not compactor.needs_compaction(prompt_of(210))
+    assert compactor.stats()["deferred"] == 1
+
+    assert compactor.needs_compaction(prompt_of(230))
+    compactor.compact(prompt_of(230), "editor")
+    assert client.calls == 2
+
+
+def test_failed_compaction_is_deferred_and_success_resets_it():
+    def rewrite(prompt):
+        raise RuntimeError("editor unavailable")
+
+    client = FakeClient(rewrite)
+    replayer = FakeReplayer([0.8, 0.8])
+    compactor = PromptCompactor(client, replayer, token_budget=100, retry_growth=0.1)
+
+    assert compactor.compact(prompt_of(200), "editor") == prompt_of(200)
+    assert not compactor.needs_compaction(prompt_of(200))
+    assert compactor.stats()["failed"] == 1
+
+    client.rewrite = lambda prompt: prompt[: len(prompt) // 2]
+    compacted = compactor.compact(prompt_of(300), "editor")
+    assert len(compacted) < len(prompt_of(300))
+    # Accepted: any over-budget prompt is eligible again
+    assert compactor.needs_compaction(prompt_of(101))
+    assert compactor.stats()["retry_after_tokens"] is None
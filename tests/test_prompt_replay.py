@@ -0,0 +1,59 @@
+from prompt_replay import PromptReplayer
+from similarity import SimilarityScorer
+from training import TrainingPipeline
+from vector_index import ExampleIndex
+
+VALIDATION = [
+    {"client_sequence": ["how long does the tourist visa take?"], "chat_history": [],
+     "consultant_reply": "Usually about 5 working days."},
+    {"client_sequence": ["can I extend my retirement visa?"], "chat_history": [],
+     "consultant_reply": "Yes, at immigration before it expires."},
+]
+
+
+class FakeDB:
+    def get_recent_training_examples(self, limit):
+        return VALIDATION[:limit]
+
+
+class RecordingGemini:
+    def __init__(self):
+        self.calls = []
+
+    def generate_reply(self, system_prompt, client_sequence, chat_history=None, priority=None,
+                       examples=None):
+        self.calls.append((system_prompt, client_sequence[0], examples))
+        return "Usually about 5 working days."
+
+
+def test_replay_passes_the_few_shot_examples_of_each_conversation():
+    gemini = RecordingGemini()
+    looked_up = []
+
+    def few_shot(client_sequence, exclude):
+        looked_up.append((client_sequence[0], exclude["consultant_reply"]))
+        return [{"client_sequence": ["similar"], "consultant_reply": f"shot for {client_sequence[0]}"}]
+
+    replayer = PromptReplayer(FakeDB(), gemini, SimilarityScorer(), sample_size=2, few_shot=few_shot)
+    replayer.score_many(["prompt a", "prompt b"])
+
+    # One lookup per conversation, shared by every prompt
+    assert sorted(looked_up) == sorted((e["client_sequence"][0], e["consultant_reply"]) for e in VALIDATION)
+    assert len(gemini.calls) == 4
+    for _, question, examples in gemini.calls:
+        assert examples[0]["consultant_reply"] == f"shot for {question}"
+
+
+def test_similar_examples_leave_out_the_replayed_example(tmp_path):
+    index = ExampleIndex(str(tmp_path), dim=256)
+    for example in VALIDATION:
+        index.add(example["client_sequence"], example["consultant_reply"])
+    index.add(["how long does a tourist visa take to process?"], "About a week.")
+    pipeline = TrainingPipeline(None, None, None, SimilarityScorer(), example_index=index,
+                                few_shot_k=1, few_shot_min_similarity=0.0)
+
+    live = pipeline.similar_examples(VALIDATION[0]["client_sequence"])
+    replayed = pipeline.similar_examples(VALIDATION[0]["client_sequence"], exclude=VALIDATION[0])
+
+    assert live[0]["consultant_reply"] == VALIDATION[0]["consultant_reply"]
+    assert [e["consultant_reply"] for e in replayed] == ["About a week."]
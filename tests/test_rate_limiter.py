@@ -0,0 +1,76 @@
+import pytest
+
+from rate_limiter import (AdaptiveConcurrencyLimiter, RateLimiter, RateLimitExceeded, RetryPolicy,
+                          TokenBucket)
+
+
+def test_bucket_refuses_when_empty_and_reports_the_wait():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == 0.0
+    wait = bucket.try_acquire()
+    assert 0.9 < wait <= 1.0
+
+    bucket.release()
+    assert bucket.try_acquire() == 0.0
+
+
+def test_bucket_honors_retry_after_block():
+    bucket = TokenBucket(rate_per_minute=600)
+    bucket.block_for(5)
+
+    assert bucket.try_acquire() > 4.9
+    assert not bucket.acquire(timeout=0.05)
+
+
+def test_tpm_timeout_gives_the_request_token_back():
+    limiter = RateLimiter(rpm=10, tpm=1000, max_concurrency=4, queue_timeout=0.05)
+    with limiter.slot(900):
+        pass
+
+    for _ in range(3):
+        with pytest.raises(RateLimitExceeded):
+            with limiter.slot(900):
+                pass
+
+    # Only the admitted call used request quota
+    assert limiter.requests.available() == pytest.approx(9, abs=0.1)
+    assert limiter.stats()["rejected"] == 3
+
+
+def test_concurrency_cap_rejects_when_full():
+    limiter = RateLimiter(rpm=100, tpm=100000, max_concurrency=1, queue_timeout=0.05)
+    with limiter.slot(10):
+        with pytest.raises(RateLimitExceeded):
+            with limiter.slot(10):
+                pass
+    # The slot was freed again
+    with limiter.slot(10):
+        pass
+
+
+def test_aimd_halves_on_throttle_and_grows_back_on_success():
+    limiter = AdaptiveConcurrencyLimiter(initial=8, max_limit=8, decrease_cooldown=0.0)
+
+    limiter.on_throttle()
+    assert limiter.limit == 4
+    # About +1 per window of successes
+    for _ in range(30):
+        limiter.on_success()
+    assert limiter.limit == 8
+
+
+def test_aimd_cuts_once_per_cooldown():
+    limiter = AdaptiveConcurrencyLimiter(initial=8, max_limit=8, decrease_cooldown=60.0)
+
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.limit == 4
+
+
+def test_retry_delay_never_undercuts_retry_after():
+    policy = RetryPolicy(base_delay=1.0, max_delay=30.0)
+
+    assert all(5.0 <= policy.delay(0, retry_after=5.0) <= 6.0 for _ in range(50))
+    assert all(0.0 <= policy.delay(3) <= 8.0 for _ in range(50))
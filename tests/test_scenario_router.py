@@ -0,0 +1,25 @@
+import pytest
+
+from scenario_router import ScenarioRouter
+
+
+def test_explicit_key_and_free_text_label():
+    router = ScenarioRouter()
+
+    assert router.classify(["hello"], scenario=" DTV ") == "dtv"
+    assert router.classify(["hello"], scenario="First-time applicant – Digital Nomad") == "dtv"
+
+
+def test_detects_from_messages_then_history():
+    router = ScenarioRouter()
+
+    assert router.classify(["I am retired and want to stay longer"]) == "retirement"
+    assert router.classify(["how much?"], [{"direction": "in", "text": "my wife is Thai"}]) == "family"
+    assert router.classify(["hello there"]) is None
+
+
+@pytest.mark.parametrize("scenario", [42, {"name": "dtv"}, ["dtv"], True])
+def test_non_string_scenario_is_treated_as_no_hint(scenario):
+    router = ScenarioRouter()
+
+    assert router.classify(["Can a student work part time?"], scenario=scenario) == "education"
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import RateLimitExceeded
+from scheduler import BULK, INTERACTIVE, MANUAL, PriorityScheduler
+
+
+def scheduler(capacity, reserved=1, timeout=5.0):
+    return PriorityScheduler(lambda: capacity, {INTERACTIVE: 8, MANUAL: 3, BULK: 1},
+                             {p: timeout for p in (INTERACTIVE, MANUAL, BULK)},
+                             reserved_interactive_slots=reserved)
+
+
+def wait_queued(s, priority, count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while s.stats()[priority]["queued"] < count:
+        if time.monotonic() > deadline:
+            raise AssertionError(f"{priority} never queued {count} calls")
+        time.sleep(0.005)
+
+
+def test_reserved_slot_is_kept_for_interactive_calls():
+    s = scheduler(capacity=2, timeout=0.05)
+    with s.slot(BULK):
+        with pytest.raises(RateLimitExceeded):
+            with s.slot(BULK):
+                pass
+        with s.slot(INTERACTIVE):
+            assert s.stats()["in_use"] == 2
+    assert s.stats()[BULK]["timed_out"] == 1
+
+
+def test_interactive_calls_overtake_queued_bulk_work():
+    s = scheduler(capacity=1, reserved=0)
+    order, lock = [], threading.Lock()
+
+    def call(priority):
+        with s.slot(priority):
+            with lock:
+                order.append(priority)
+
+    threads = []
+    with s.slot(BULK):
+        for priority, count in ((BULK, 4), (INTERACTIVE, 4)):
+            for _ in range(count):
+                threads.append(threading.Thread(target=call, args=(priority,)))
+                threads[-1].start()
+            wait_queued(s, priority, count)
+    for thread in threads:
+        thread.join(5)
+
+    # Queued later, but weighted 8:1 the interactive calls go (almost) first
+    assert order.index(BULK) >= 3
+    assert order[-1] == BULK
+    assert s.stats()["in_use"] == 0
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        with scheduler(capacity=1).slot("urgent"):
+            pass
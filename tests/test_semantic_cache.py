@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pytest
+
+import components
+from config import SEMANTIC_CACHE_THRESHOLD
+from semantic_cache import SemanticReplyCache
+from similarity import hashed_ngram_vectors
+
+QUESTION = "how long for tourist visa"
+PARAPHRASES = ["tourist visa processing time?", "How long for a tourist visa?"]
+OTHER_QUESTIONS = ["how long for student visa", "how long for a retirement visa?"]
+
+
+def cosine(embed, left, right):
+    vectors = np.asarray(embed([left, right]), dtype=np.float32)
+    return float(vectors[0] @ vectors[1])
+
+
+def test_local_ngrams_rank_another_visa_above_a_paraphrase():
+    # Why the cache needs a real embedding model: with local hashing, a different
+    # visa type looks closer than a true paraphrase
+    paraphrase = cosine(hashed_ngram_vectors, QUESTION, PARAPHRASES[0])
+    other_visa = cosine(hashed_ngram_vectors, QUESTION, OTHER_QUESTIONS[0])
+    assert paraphrase < other_visa
+
+
+def test_cache_is_off_without_an_embedding_model(monkeypatch):
+    monkeypatch.setattr(components, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(components, "SEMANTIC_CACHE_EMBEDDING_MODEL", "")
+    assert components.create_semantic_cache(gemini_client=None) is None
+
+
+def test_cache_is_off_by_default():
+    if "SEMANTIC_CACHE_ENABLED" not in os.environ:
+        assert components.SEMANTIC_CACHE_ENABLED is False
+
+
+def test_hits_only_at_or_above_threshold():
+    vectors = {
+        QUESTION: [1.0, 0.0],
+        PARAPHRASES[0]: [0.95, np.sqrt(1 - 0.95 ** 2)],
+        OTHER_QUESTIONS[0]: [0.6, 0.8],
+    }
+    cache = SemanticReplyCache(threshold=0.9, embed=lambda texts: np.array([vectors[t] for t in texts]))
+    cache.store("v1", [QUESTION], "About 2 weeks.")
+
+    assert cache.lookup("v1", [PARAPHRASES[0]])["reply"] == "About 2 weeks."
+    assert cache.lookup("v1", [OTHER_QUESTIONS[0]]) is None
+    assert cache.lookup("v2", [PARAPHRASES[0]]) is None
+
+
+@pytest.mark.skipif(not os.getenv("SEMANTIC_CACHE_TEST_EMBEDDING_MODEL"),
+                    reason="set SEMANTIC_CACHE_TEST_EMBEDDING_MODEL and a real GEMINI_API_KEY")
+def test_threshold_separates_paraphrases_with_gemini_embeddings():
+    from gemini_client import GeminiClient
+
+    model = os.environ["SEMANTIC_CACHE_TEST_EMBEDDING_MODEL"]
+    client = GeminiClient()
+    embed = lambda texts: client.embed_texts(texts, model)
+    for paraphrase in PARAPHRASES:
+        assert cosine(embed, QUESTION, paraphrase) >= SEMANTIC_CACHE_THRESHOLD, paraphrase
+    for other in OTHER_QUESTIONS:
+        assert cosine(embed, QUESTION, other) < SEMANTIC_CACHE_THRESHOLD, other
+
+
+def test_scenarios_keep_separate_partitions():
+    cache = SemanticReplyCache(threshold=0.9, embed=hashed_ngram_vectors)
+    cache.store("dtv-v1", ["dtv question"], "dtv answer", scope="dtv")
+    cache.store("tourist-v1", ["tourist question"], "tourist answer", scope="tourist")
+
+    # Mixed traffic doesn't wipe the other scenario's entries
+    assert cache.lookup("dtv-v1", ["dtv question"])["reply"] == "dtv answer"
+    assert cache.lookup("tourist-v1", ["tourist question"])["reply"] == "tourist answer"
+
+    # A new dtv prompt version drops only dtv's old partition
+    cache.store("dtv-v2", ["dtv question"], "new dtv answer", scope="dtv")
+    assert cache.lookup("dtv-v1", ["dtv question"]) is None
+    assert cache.lookup("tourist-v1", ["tourist question"])["reply"] == "tourist answer"
+    assert cache.stats()["prompt_versions"] == 2
@@ -0,0 +1,155 @@
+import time
+import uuid
+
+from prompt_manager import PromptManager, prompt_version
+from shadow import ShadowEvaluator
+from similarity import SimilarityScorer
+from training import TrainingPipeline
+from usage import UsageTracker
+
+
+class FakeDB:
+    """In-memory stand-in for the prompt and candidate tables."""
+
+    def __init__(self):
+        self.prompts = []
+        self.editor_prompts = []
+        self.candidates = []
+        self.examples = []
+
+    def subscribe_prompt_changes(self, callback):
+        return False
+
+    def get_latest_prompt(self):
+        return self.prompts[-1] if self.prompts else None
+
+    def save_prompt(self, content):
+        self.prompts.append(content)
+        return {"content": content}
+
+    def get_latest_editor_prompt(self):
+        return self.editor_prompts[-1] if self.editor_prompts else None
+
+    def save_editor_prompt(self, content):
+        self.editor_prompts.append(content)
+        return {"content": content}
+
+    def get_latest_prompt_candidate(self, status="shadow"):
+        matching = [c for c in self.candidates if c["status"] == status]
+        return dict(matching[-1]) if matching else None
+
+    def save_prompt_candidate(self, content, status="shadow"):
+        self.supersede_prompt_candidates(status)
+        record = {"id": str(uuid.uuid4()), "content": content, "status": status}
+        self.candidates.append(record)
+        return dict(record)
+
+    def supersede_prompt_candidates(self, status="queued"):
+        for candidate in self.candidates:
+            if candidate["status"] == status:
+                candidate["status"] = "superseded"
+
+    def start_prompt_candidate(self, candidate_id):
+        return self._set_status(candidate_id, "shadow")
+
+    def update_prompt_candidate(self, candidate_id, status, metrics):
+        return self._set_status(candidate_id, status)
+
+    def _set_status(self, candidate_id, status):
+        for candidate in self.candidates:
+            if candidate["id"] == candidate_id:
+                candidate["status"] = status
+                return dict(candidate)
+        return {}
+
+    def save_training_example(self, **kwargs):
+        self.examples.append(kwargs)
+        return kwargs
+
+
+class FakeGemini:
+    """Replies that don't depend on the prompt, and edits that append a rule."""
+
+    def __init__(self):
+        self.usage = UsageTracker()
+        self.edits = 0
+
+    def generate_reply(self, system_prompt, client_sequence, chat_history=None,
+                       priority=None, hedge=None, examples=None):
+        self.usage.record("fake-model", "generate_reply", latency=0.1)
+        return f"Happy to help with {client_sequence[-1]}"
+
+    def improve_prompt(self, existing_prompt, **kwargs):
+        self.edits += 1
+        return f"{existing_prompt}\n- rule {self.edits}"
+
+
+def wait_idle(evaluator, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while evaluator.stats()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_candidates_get_promoted_under_continuous_training():
+    db = FakeDB()
+    gemini = FakeGemini()
+    scorer = SimilarityScorer()
+    manager = PromptManager(db, shadow_enabled=True)
+    evaluator = ShadowEvaluator(manager, gemini, scorer, sample_rate=1.0, rpm=10000,
+                                max_in_flight=1, min_samples=5, max_samples=50)
+    pipeline = TrainingPipeline(db, manager, gemini, scorer, gate_enabled=False,
+                                shadow_evaluator=evaluator)
+    initial = manager.get_base_prompt()
+
+    for i in range(12):
+        client_sequence = [f"question {i} about the tourist visa"]
+        live_prompt = manager.get_base_prompt()
+        # /generate-reply served this conversation with the live prompt
+        live_reply = gemini.generate_reply(live_prompt, client_sequence)
+        evaluator.submit(prompt_version(live_prompt), client_sequence, [], None, live_reply, 0.1)
+        wait_idle(evaluator)
+        # ...and the consultant's reply arrives for training, which also edits the prompt
+        pipeline.train_example(client_sequence, [], f"Happy to help with {client_sequence[0]}")
+
+    stats = evaluator.stats()
+    assert stats["promoted"] >= 2
+    assert stats["rejected"] == 0
+    assert manager.get_base_prompt() != initial
+    # Edits made during an evaluation were queued, not thrown away
+    assert [c["status"] for c in db.candidates].count("superseded") > 0
+    assert manager.get_candidate_prompt() is not None
+
+
+def test_edits_during_evaluation_do_not_replace_the_candidate():
+    db = FakeDB()
+    manager = PromptManager(db, shadow_enabled=True)
+    first = manager.update_system_prompt("v1")
+    manager.update_system_prompt("v2")
+    manager.update_system_prompt("v3")
+
+    assert manager.get_candidate_prompt()["id"] == first["id"]
+    assert manager.get_working_prompt() == "v3"
+
+    manager.promote_candidate(manager.get_candidate_prompt(), {})
+    assert manager.get_base_prompt() == "v1"
+    assert manager.get_candidate_prompt()["content"] == "v3"
+    assert manager.get_queued_prompt() is None
+
+
+def test_rejecting_the_candidate_discards_edits_queued_on_it():
+    db = FakeDB()
+    manager = PromptManager(db, shadow_enabled=True)
+    live = manager.get_base_prompt()
+    manager.update_system_prompt(live + "\n- bad rule")
+    manager.update_system_prompt(manager.get_working_prompt() + "\n- good rule")
+    assert "bad rule" in manager.get_queued_prompt()["content"]
+
+    manager.reject_candidate(manager.get_candidate_prompt(), {})
+
+    assert manager.get_candidate_prompt() is None
+    assert manager.get_queued_prompt() is None
+    assert [c["status"] for c in db.candidates] == ["rejected", "superseded"]
+    # The next edit starts from the live prompt, without the rejected rule
+    assert manager.get_working_prompt() == live
+    manager.update_system_prompt(manager.get_working_prompt() + "\n- good rule")
+    assert "bad rule" not in manager.get_candidate_prompt()["content"]
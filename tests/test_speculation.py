@@ -0,0 +1,79 @@
+import threading
+import time
+
+from speculation import SpeculativeReplies
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+class Generator:
+    def __init__(self, version="v1", block=None):
+        self.version = version
+        self.block = block
+        self.calls = []
+
+    def __call__(self, client_sequence, chat_history, scenario):
+        self.calls.append(list(client_sequence))
+        if self.block is not None:
+            self.block.wait(5)
+        return self.version, {"aiReply": " / ".join(client_sequence), "degraded": False}
+
+
+def test_reply_is_generated_after_the_debounce_and_served_once_asked():
+    generate = Generator()
+    speculation = SpeculativeReplies(generate, debounce=0.05)
+
+    speculation.message("c1", "in", "hi")
+    speculation.message("c1", "in", "how long is a tourist visa?")
+    wait_for(lambda: speculation.stats()["stored"] == 1)
+
+    # Both messages went into one speculation
+    assert generate.calls == [["hi", "how long is a tourist visa?"]]
+    payload = speculation.lookup(["hi", "how long is a tourist visa?"], [], "v1")
+    assert payload["aiReply"] == "hi / how long is a tourist visa?"
+    assert speculation.lookup(["hi"], [], "v1") is None
+
+
+def test_prompt_change_invalidates_the_stored_reply():
+    speculation = SpeculativeReplies(Generator(), debounce=0.01)
+    speculation.message("c1", "in", "hello")
+    wait_for(lambda: speculation.stats()["stored"] == 1)
+
+    assert speculation.lookup(["hello"], [], "v2") is None
+    assert speculation.stats()["prompt_changed"] == 1
+
+
+def test_message_during_speculation_discards_its_result():
+    release = threading.Event()
+    generate = Generator(block=release)
+    speculation = SpeculativeReplies(generate, debounce=0.01)
+
+    speculation.message("c1", "in", "first")
+    wait_for(lambda: speculation.stats()["in_flight"] == 1)
+    speculation.message("c1", "in", "second")
+    release.set()
+
+    wait_for(lambda: speculation.stats()["stored"] == 1)
+    assert speculation.stats()["stale"] == 1
+    assert speculation.lookup(["first"], [], "v1") is None
+    assert speculation.lookup(["first", "second"], [], "v1") is not None
+
+
+def test_consultant_reply_moves_the_sequence_into_history():
+    speculation = SpeculativeReplies(Generator(), debounce=60.0)
+
+    speculation.message("c1", "in", "hello")
+    result = speculation.message("c1", "out", "Hi! How can I help?")
+
+    assert result["clientSequence"] == []
+    assert result["speculateInSeconds"] is None
+    speculation.message("c1", "in", "tourist visa please")
+    conversation = speculation._conversations["c1"]
+    assert conversation.chat_history == [{"direction": "in", "text": "hello"},
+                                         {"direction": "out", "text": "Hi! How can I help?"}]
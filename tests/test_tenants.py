@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from rate_limiter import RateLimitExceeded
+from tenants import TenantAdmission, TenantLimits
+
+
+def wait_queued(admission, name, count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        tenant = admission.stats()["tenants"].get(name)
+        if tenant and tenant["queued"] >= count:
+            return
+        time.sleep(0.005)
+    raise AssertionError(f"{name} never queued {count} requests")
+
+
+def test_rate_limit_rejects_with_retry_after():
+    admission = TenantAdmission(capacity=4, default_limits=TenantLimits(rpm=2, max_concurrency=4))
+
+    for _ in range(2):
+        with admission.slot("crm"):
+            pass
+    with pytest.raises(RateLimitExceeded) as error:
+        admission.acquire("crm")
+    assert error.value.retry_after > 0
+    # Other tenants have their own bucket
+    with admission.slot("dashboard"):
+        pass
+
+
+def test_full_queue_rejects_without_using_rate():
+    admission = TenantAdmission(capacity=1, default_limits=TenantLimits(rpm=4, max_concurrency=1,
+                                                                        max_queued=1))
+    admission.acquire("crm")
+
+    def queued_request():
+        with admission.slot("crm"):
+            pass
+
+    waiting = threading.Thread(target=queued_request)
+    waiting.start()
+    wait_queued(admission, "crm", 1)
+
+    with pytest.raises(RateLimitExceeded):
+        admission.acquire("crm")
+    admission.release("crm")
+    waiting.join(5)
+
+    # The rejected request didn't spend one of the four requests per minute
+    for _ in range(2):
+        with admission.slot("crm"):
+            pass
+    assert admission.stats()["tenants"]["crm"]["queue_full"] == 1
+
+
+def test_waiting_request_times_out():
+    admission = TenantAdmission(capacity=1, default_limits=TenantLimits(rpm=100, max_concurrency=2),
+                                queue_timeout=0.05)
+    admission.acquire("crm")
+
+    with pytest.raises(RateLimitExceeded):
+        admission.acquire("other")
+    assert admission.stats()["tenants"]["other"]["timed_out"] == 1
+    admission.release("crm")
+
+
+def test_flooding_tenant_queues_behind_its_own_requests():
+    admission = TenantAdmission(capacity=1, default_limits=TenantLimits(rpm=100, max_concurrency=4))
+    order = []
+    lock = threading.Lock()
+
+    def request(name):
+        with admission.slot(name):
+            with lock:
+                order.append(name)
+
+    admission.acquire("bulk")
+    threads = []
+    for _ in range(3):
+        threads.append(threading.Thread(target=request, args=("bulk",)))
+        threads[-1].start()
+    wait_queued(admission, "bulk", 3)
+    threads.append(threading.Thread(target=request, args=("crm",)))
+    threads[-1].start()
+    wait_queued(admission, "crm", 1)
+
+    admission.release("bulk")
+    for thread in threads:
+        thread.join(5)
+
+    # The CRM request arrived last but only waits behind one bulk request
+    assert order.index("crm") <= 1
+    assert admission.stats()["in_use"] == 0
@@ -0,0 +1,94 @@
+import multiprocessing
+
+from vector_index import ExampleIndex
+
+WRITERS = 3
+BATCHES = 20
+
+
+def append_examples(directory, writer):
+    index = ExampleIndex(directory, dim=256, initial_capacity=4)
+    for batch in range(BATCHES):
+        index.add_many([
+            {"client_sequence": [f"writer {writer} batch {batch} message {i}"],
+             "consultant_reply": f"reply {writer}-{batch}-{i}"}
+            for i in range(3)
+        ])
+
+
+def test_processes_appending_to_one_directory_stay_aligned(tmp_path):
+    directory = str(tmp_path)
+    index = ExampleIndex(directory, dim=256, initial_capacity=4)
+
+    context = multiprocessing.get_context("fork")
+    writers = [context.Process(target=append_examples, args=(directory, w)) for w in range(WRITERS)]
+    for process in writers:
+        process.start()
+    for process in writers:
+        process.join(60)
+        assert process.exitcode == 0
+
+    # The long-lived instance sees rows appended by the other processes
+    assert len(index) == WRITERS * BATCHES * 3
+    for writer in range(WRITERS):
+        for batch in (0, BATCHES - 1):
+            message = f"writer {writer} batch {batch} message 1"
+            best = index.search([message], k=1)[0]
+            assert best["client_sequence"] == [message]
+            assert best["consultant_reply"] == f"reply {writer}-{batch}-1"
+            assert best["similarity"] > 0.99
+
+    # A fresh instance loads the same, consistent files
+    assert len(ExampleIndex(directory, dim=256)) == WRITERS * BATCHES * 3
+
+
+def test_partial_sidecar_line_from_a_crash_is_dropped_on_append(tmp_path):
+    directory = str(tmp_path)
+    index = ExampleIndex(directory, dim=256)
+    index.add(["first question"], "first reply")
+    with open(tmp_path / "examples.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"query": "half written')
+
+    index.add(["second question"], "second reply")
+
+    reopened = ExampleIndex(directory, dim=256)
+    assert len(reopened) == 2
+    assert reopened.search(["second question"], k=1)[0]["consultant_reply"] == "second reply"
+
+
+def seed_index(directory, results):
+    index = ExampleIndex(directory, dim=256)
+
+    def pages():
+        for page in range(3):
+            yield [{"client_sequence": [f"seeded {page}-{i}"], "consultant_reply": "reply"}
+                   for i in range(10)]
+
+    results.put(index.seed(pages()))
+
+
+def test_processes_starting_together_seed_the_index_once(tmp_path):
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    seeders = [context.Process(target=seed_index, args=(str(tmp_path), results))
+               for _ in range(3)]
+    for process in seeders:
+        process.start()
+    for process in seeders:
+        process.join(60)
+        assert process.exitcode == 0
+
+    assert sorted(results.get() for _ in seeders) == [0, 0, 30]
+    assert len(ExampleIndex(str(tmp_path), dim=256)) == 30
+
+
+def test_seed_leaves_a_non_empty_index_alone(tmp_path):
+    index = ExampleIndex(str(tmp_path), dim=256)
+    index.add(["already here"], "reply")
+
+    def pages():
+        raise AssertionError("should not fetch")
+        yield
+
+    assert index.seed(pages()) == 0
+    assert len(index) == 1
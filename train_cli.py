@@ -0,0 +1,175 @@
+"""
+Offline bulk training from conversation exports on disk.
+
+Streams conversations from JSON / NDJSON files (optionally .gz), parses them
+incrementally and runs the same training pipeline as /load-training-data,
+without going through the web server.
+
+Usage:
+    python train_cli.py conversations.json [more.ndjson ...] [--concurrency 4]
+        [--batch-size 50] [--checkpoint train.checkpoint] [--limit N] [--no-dedup] [--dry-run]
+
+Completed examples are appended to the checkpoint file, so an interrupted run
+can be restarted with the same command and picks up where it stopped.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Set
+
+from conversation_parser import ConversationParser
+from config import TRAINING_SHARD_CONCURRENCY
+from scheduler import BULK
+from usage import usage_context
+
+
+def example_key(example: Dict) -> str:
+    """Stable identity of a training example, used for checkpointing."""
+    payload = json.dumps(
+        [example.get("contact_id"), example["client_sequence"], example["consultant_reply"]],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """Keys of examples finished by earlier runs."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def iter_examples(paths: List[str]) -> Iterator[Dict]:
+    """Training examples from every file, streamed in order."""
+    for path in paths:
+        conversations = ConversationParser.iter_conversations_file(path)
+        yield from ConversationParser.iter_training_examples(conversations)
+
+
+def batches(examples: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for example in examples:
+        batch.append(example)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Train the system prompt from conversation exports.")
+    parser.add_argument("paths", nargs="+", help="Conversation exports (.json, .ndjson, .jsonl, .gz)")
+    parser.add_argument("--concurrency", type=int, default=TRAINING_SHARD_CONCURRENCY,
+                        help="Prompt shards trained in parallel (default: TRAINING_SHARD_CONCURRENCY)")
+    parser.add_argument("--batch-size", type=int, default=50,
+                        help="Examples handed to the pipeline at a time (default: 50)")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Checkpoint file (default: <first path>.checkpoint)")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="Stop after this many examples have been trained")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Train near-duplicate examples too (default: skip them, see DEDUP_*)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only parse and count examples; no Gemini or Supabase calls")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    args = parse_args(argv)
+    checkpoint_path = args.checkpoint or f"{args.paths[0]}.checkpoint"
+    done = load_checkpoint(checkpoint_path)
+
+    pipeline = None
+    dedup_index = None
+    if not args.dry_run:
+        # Imported lazily so --dry-run doesn't connect to Gemini or Supabase
+        from components import (
+            create_prompt_manager, create_example_index, create_training_pipeline,
+            create_dedup_index, create_db
+        )
+        from gemini_client import GeminiClient
+        from similarity import SimilarityScorer
+
+        db = create_db()
+        gemini_client = GeminiClient()
+        scorer = SimilarityScorer()
+        pipeline = create_training_pipeline(
+            db, create_prompt_manager(db, gemini_client, scorer), gemini_client, scorer,
+            create_example_index(db)
+        )
+        if not args.no_dedup:
+            dedup_index = create_dedup_index()
+
+    counts = {"parsed": 0, "skipped": 0, "duplicates": 0, "success": 0, "already_good": 0,
+              "error": 0}
+    started = time.monotonic()
+
+    def pending() -> Iterator[Dict]:
+        trained = 0
+        for example in iter_examples(args.paths):
+            counts["parsed"] += 1
+            if example_key(example) in done:
+                counts["skipped"] += 1
+                continue
+            if args.limit is not None and trained >= args.limit:
+                return
+            trained += 1
+            yield example
+
+    if pipeline is None:
+        pending_count = sum(1 for _ in pending())
+        print(f"{counts['parsed']} examples parsed, {counts['skipped']} already trained, "
+              f"{pending_count} to train")
+        return 0
+
+    job_id = f"cli-{os.path.basename(args.paths[0])}-{time.strftime('%Y%m%dT%H%M%S')}"
+    print(f"Training job {job_id}")
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+            usage_context(endpoint="train_cli", job=job_id):
+        for batch in batches(pending(), max(1, args.batch_size)):
+            if dedup_index is not None:
+                batch, duplicates = dedup_index.filter(batch)
+                counts["duplicates"] += duplicates
+            results = pipeline.train_batch(batch, priority=BULK, max_workers=args.concurrency)
+            if dedup_index is not None:
+                dedup_index.settle(batch, results)
+            for example, result in zip(batch, results):
+                counts[result["status"]] += 1
+                if result["status"] == "error":
+                    print(f"  ✗ {example.get('contact_id')}: {result.get('error')}", file=sys.stderr)
+                else:
+                    # Errors are left out so the next run retries them
+                    checkpoint.write(example_key(example) + "\n")
+            checkpoint.flush()
+
+            elapsed = time.monotonic() - started
+            trained = counts["success"] + counts["already_good"] + counts["error"]
+            print(f"{trained} trained ({counts['already_good']} already good, "
+                  f"{counts['error']} errors), {counts['skipped']} skipped, "
+                  f"{counts['duplicates']} near-duplicates, "
+                  f"{trained / elapsed:.2f} examples/s")
+
+    elapsed = time.monotonic() - started
+    trained = counts["success"] + counts["already_good"] + counts["error"]
+    print("\nSummary")
+    print(f"  examples parsed:    {counts['parsed']}")
+    print(f"  skipped (resumed):  {counts['skipped']}")
+    print(f"  near-duplicates:    {counts['duplicates']}")
+    print(f"  trained:            {trained}")
+    print(f"    prompt updated:   {counts['success']}")
+    print(f"    already good:     {counts['already_good']}")
+    print(f"    errors:           {counts['error']}")
+    print(f"  elapsed:            {elapsed:.1f}s")
+    print(f"  throughput:         {trained / elapsed if elapsed else 0.0:.2f} examples/s")
+    print(f"  gemini usage:       {json.dumps(pipeline.gemini_client.usage.totals())}")
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,341 @@
+"""
+Self-learning training pipeline: predict, compare, improve, save.
+
+Shared by /improve-ai and /load-training-data so both apply the same gating.
+With several edit candidates configured, the editor proposes that many edits
+in parallel and replay on recent examples picks the one to keep.
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from gemini_client import GeminiClient
+from prompt_manager import PromptManager, compose_prompt, prompt_version
+from prompt_replay import PromptReplayer
+from scenario_router import ScenarioRouter
+from scheduler import BULK, MANUAL
+from semantic_cache import SemanticReplyCache
+from shadow import ShadowEvaluator
+from similarity import SimilarityScorer
+from supabase_client import SupabaseDB
+from usage import usage_context
+from vector_index import ExampleIndex
+
+
+class TrainingPipeline:
+    """Runs one training example through the predict → improve → save loop."""
+
+    def __init__(self, db: SupabaseDB, prompt_manager: PromptManager,
+                 gemini_client: GeminiClient, scorer: SimilarityScorer,
+                 skip_threshold: float = 0.9, gate_enabled: bool = True,
+                 example_index: Optional[ExampleIndex] = None, few_shot_k: int = 0,
+                 few_shot_min_similarity: float = 0.0,
+                 semantic_cache: Optional[SemanticReplyCache] = None,
+                 scenario_router: Optional[ScenarioRouter] = None,
+                 shadow_evaluator: Optional[ShadowEvaluator] = None,
+                 replayer: Optional[PromptReplayer] = None, edit_candidates: int = 1):
+        """
+        Args:
+            db: Database used to store training examples
+            prompt_manager: Source and sink of system/editor prompts
+            gemini_client: Client used for prediction and prompt editing
+            scorer: Local similarity scorer for the "already good" gate
+            skip_threshold: Similarity at or above which the editor call is skipped
+            gate_enabled: Turn the similarity gate on/off
+            example_index: Index of past examples, kept up to date as examples are saved
+            few_shot_k: Similar examples to include when predicting (0 disables)
+            few_shot_min_similarity: Minimum similarity for a retrieved example
+            semantic_cache: Reply cache audited against real consultant replies
+            scenario_router: Picks the prompt shard when sharding is enabled
+            shadow_evaluator: Scores shadowed replies against incoming consultant replies
+            replayer: Scores candidate edits on recent training examples
+            edit_candidates: Editor proposals per prompt update; above 1 (with a replayer)
+                the best one by replay is kept, and none if all score below the current prompt
+        """
+        self.db = db
+        self.prompt_manager = prompt_manager
+        self.gemini_client = gemini_client
+        self.scorer = scorer
+        self.skip_threshold = skip_threshold
+        self.gate_enabled = gate_enabled
+        self.example_index = example_index
+        self.few_shot_k = few_shot_k
+        self.few_shot_min_similarity = few_shot_min_similarity
+        self.semantic_cache = semantic_cache
+        self.scenario_router = scenario_router
+        self.shadow_evaluator = shadow_evaluator
+        self.replayer = replayer
+        self.edit_candidates = max(1, edit_candidates) if replayer is not None else 1
+        self._edit_executor = ThreadPoolExecutor(
+            max_workers=self.edit_candidates, thread_name_prefix="edit"
+        ) if self.edit_candidates > 1 else None
+        self._lock = threading.Lock()
+        self._counters = {"examples": 0, "already_good": 0, "prompt_updates": 0,
+                          "shard_updates": 0, "edit_candidates": 0, "edits_rejected": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def route(self, client_sequence: List[str], chat_history: Optional[List[Dict]] = None,
+              scenario: Optional[str] = None) -> Optional[str]:
+        """Prompt shard for a conversation, or None when sharding is off or nothing matches."""
+        if self.scenario_router is None or not self.prompt_manager.sharding_enabled:
+            return None
+        return self.scenario_router.classify(client_sequence, chat_history, scenario)
+
+    def similar_examples(self, client_sequence: List[str],
+                         exclude: Optional[Dict] = None) -> List[Dict]:
+        """
+        Past examples to use as few-shot context for `client_sequence`.
+
+        Args:
+            client_sequence: Client messages to find similar examples for
+            exclude: An indexed example to leave out (a replayed training example would
+                otherwise be handed its own consultant reply)
+        """
+        if self.example_index is None or self.few_shot_k <= 0:
+            return []
+        found = self.example_index.search(
+            client_sequence, k=self.few_shot_k + (1 if exclude else 0),
+            min_similarity=self.few_shot_min_similarity
+        )
+        if exclude:
+            found = [e for e in found
+                     if (e["client_sequence"], e["consultant_reply"])
+                     != (exclude["client_sequence"], exclude["consultant_reply"])]
+        return found[:self.few_shot_k]
+
+    def _best_edit(self, improve: Callable[[], str], full_prompt: Callable[[str], str],
+                   current: str, example: Dict, priority: str) -> Optional[str]:
+        """
+        Ask the editor for one or more edits and pick the one to keep.
+
+        Args:
+            improve: Makes one editor call and returns the edited prompt
+            full_prompt: Maps an edited prompt to the system prompt it would produce
+            current: The prompt being edited
+            example: The training example that triggered the edit (added to the replay set)
+            priority: Scheduling class of the editor and replay calls
+
+        Returns:
+            The best edit, or None when no candidate replays better than `current`
+        """
+        if self._edit_executor is None:
+            return improve()
+
+        # The editor samples at its default temperature, so parallel calls propose different edits
+        futures = [self._edit_executor.submit(contextvars.copy_context().run, improve)
+                   for _ in range(self.edit_candidates)]
+        candidates, error = [], None
+        for future in futures:
+            try:
+                edit = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            if edit and edit != current and edit not in candidates:
+                candidates.append(edit)
+        if not candidates:
+            if error is not None:
+                raise error
+            return None
+        with self._lock:
+            self._counters["edit_candidates"] += len(candidates)
+
+        # The current prompt is scored alongside, so an edit has to beat it to be kept
+        scores = self.replayer.score_many(
+            [full_prompt(current)] + [full_prompt(edit) for edit in candidates],
+            priority, extra_examples=[example]
+        )
+        best = max(range(len(candidates)), key=lambda i: scores[i + 1])
+        print(f"Edit candidates scored {[round(s, 4) for s in scores[1:]]} "
+              f"(current prompt {scores[0]:.4f})")
+        if scores[best + 1] < scores[0]:
+            self._count("edits_rejected")
+            return None
+        return candidates[best]
+
+    def train_example(self, client_sequence: List[str], chat_history: List[Dict],
+                      consultant_reply: str, priority: str = MANUAL,
+                      scenario: Optional[str] = None) -> Dict:
+        """
+        Predict a reply, compare it to the consultant's, and improve the prompt if needed.
+
+        With sharding enabled, conversations routed to a scenario only update that
+        scenario's shard; the shared base prompt is given to the editor as context.
+        With shadow mode on, base prompt edits are queued behind the candidate under evaluation.
+
+        Args:
+            client_sequence: Client messages to respond to
+            chat_history: Messages before the client sequence
+            consultant_reply: The human consultant's actual reply
+            priority: Scheduling class for the Gemini calls
+            scenario: Explicit scenario (shard key or free-text label), if known
+
+        Returns:
+            Dict with predicted_reply, updated_prompt, similarity, already_good and scenario
+        """
+        self._count("examples")
+        if self.shadow_evaluator is not None:
+            self.shadow_evaluator.observe(client_sequence, consultant_reply)
+
+        shard = self.route(client_sequence, chat_history, scenario)
+        live_prompt = self.prompt_manager.get_system_prompt(shard)
+        # Base prompt edits build on the queued edits or the candidate under evaluation
+        system_prompt = live_prompt if shard else self.prompt_manager.get_working_prompt()
+        version = prompt_version(system_prompt)
+
+        # Gemini calls below are accounted to the prompt version being trained
+        with usage_context(prompt_version=version):
+            # Would the semantic cache have answered this with something the consultant wouldn't say?
+            if self.semantic_cache is not None and self.semantic_cache.eligible(chat_history):
+                # Cached replies were generated with the live prompt, not the candidate
+                self.semantic_cache.audit(prompt_version(live_prompt), client_sequence,
+                                          consultant_reply, self.scorer)
+
+            predicted_reply = self.gemini_client.generate_reply(
+                system_prompt=system_prompt,
+                client_sequence=client_sequence,
+                chat_history=chat_history if chat_history else None,
+                priority=priority,
+                examples=self.similar_examples(client_sequence)
+            )
+
+            similarity = self.scorer.score(predicted_reply, consultant_reply)
+            example = {"client_sequence": client_sequence, "chat_history": chat_history,
+                       "consultant_reply": consultant_reply}
+            already_good = self.gate_enabled and similarity >= self.skip_threshold
+
+            if already_good:
+                # The prompt already produces the consultant's answer; nothing to learn here
+                self._count("already_good")
+                updated_prompt = system_prompt
+            elif shard:
+                # Only this scenario's rules are learned; the base stays shared
+                base_prompt = self.prompt_manager.get_base_prompt()
+                existing_shard = self.prompt_manager.get_scenario_prompt(shard) \
+                    or f"No {shard}-specific guidance yet."
+                edit = self._best_edit(
+                    lambda: self.gemini_client.improve_prompt(
+                        editor_prompt=self.prompt_manager.get_editor_prompt(),
+                        existing_prompt=existing_shard,
+                        client_sequence=client_sequence,
+                        chat_history=chat_history,
+                        real_consultant_reply=consultant_reply,
+                        predicted_ai_reply=predicted_reply,
+                        priority=priority,
+                        base_prompt=base_prompt
+                    ),
+                    lambda content: compose_prompt(base_prompt, shard, content),
+                    existing_shard, example, priority
+                )
+                if edit is None:
+                    updated_prompt = existing_shard
+                else:
+                    self.prompt_manager.update_scenario_prompt(shard, edit)
+                    updated_prompt = edit
+                    self._count("shard_updates")
+            else:
+                edit = self._best_edit(
+                    lambda: self.gemini_client.improve_prompt(
+                        editor_prompt=self.prompt_manager.get_editor_prompt(),
+                        existing_prompt=system_prompt,
+                        client_sequence=client_sequence,
+                        chat_history=chat_history,
+                        real_consultant_reply=consultant_reply,
+                        predicted_ai_reply=predicted_reply,
+                        priority=priority
+                    ),
+                    lambda content: content,
+                    system_prompt, example, priority
+                )
+                if edit is None:
+                    updated_prompt = system_prompt
+                else:
+                    saved = self.prompt_manager.update_system_prompt(edit, priority)
+                    updated_prompt = saved.get("content", edit)
+                    self._count("prompt_updates")
+
+            self.db.save_training_example(
+                client_sequence=client_sequence,
+                chat_history=chat_history,
+                consultant_reply=consultant_reply,
+                ai_reply=predicted_reply
+            )
+            if self.example_index is not None:
+                self.example_index.add(client_sequence, consultant_reply)
+
+        return {
+            "predicted_reply": predicted_reply,
+            "updated_prompt": updated_prompt,
+            "similarity": round(similarity, 4),
+            "already_good": already_good,
+            "scenario": shard
+        }
+
+    def _train_for_batch(self, example: Dict, priority: str) -> Dict:
+        try:
+            result = self.train_example(
+                client_sequence=example["client_sequence"],
+                chat_history=example["chat_history"],
+                consultant_reply=example["consultant_reply"],
+                priority=priority,
+                scenario=example.get("scenario")
+            )
+            return {
+                "contact_id": example.get("contact_id"),
+                "status": "already_good" if result["already_good"] else "success",
+                "similarity": result["similarity"],
+                "scenario": result["scenario"]
+            }
+        except Exception as e:
+            return {
+                "contact_id": example.get("contact_id"),
+                "status": "error",
+                "error": str(e)
+            }
+
+    def train_batch(self, examples: List[Dict], priority: str = BULK,
+                    max_workers: int = 4) -> List[Dict]:
+        """
+        Train on parsed examples (as produced by ConversationParser).
+
+        Examples routed to the same prompt shard run in order, since each one builds
+        on the prompt the previous one produced. Independent shards run in parallel.
+
+        Returns:
+            One result per example, in input order
+        """
+        groups: Dict[Optional[str], List[int]] = {}
+        for index, example in enumerate(examples):
+            shard = self.route(example["client_sequence"], example["chat_history"],
+                               example.get("scenario"))
+            groups.setdefault(shard, []).append(index)
+
+        results: List[Optional[Dict]] = [None] * len(examples)
+
+        def run_group(indices: List[int]):
+            for index in indices:
+                results[index] = self._train_for_batch(examples[index], priority)
+
+        if len(groups) <= 1 or max_workers <= 1:
+            for indices in groups.values():
+                run_group(indices)
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(groups)),
+                                    thread_name_prefix="train") as executor:
+                # Each group keeps the caller's usage labels (endpoint, job)
+                futures = [executor.submit(contextvars.copy_context().run, run_group, indices)
+                           for indices in groups.values()]
+                for future in futures:
+                    future.result()
+        return results
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counters)
+        stats["skip_threshold"] = self.skip_threshold if self.gate_enabled else None
+        stats["edit_candidates_per_update"] = self.edit_candidates
+        return stats
@@ -0,0 +1,166 @@
+"""
+Token, cost and latency accounting for Gemini calls.
+
+Every call is recorded against the labels active in the current context:
+endpoint, tenant, prompt version and training job. Labels are set with
+`usage_context(...)` and live in context variables, so work handed to
+thread pools keeps them when run through `contextvars.copy_context()`.
+"""
+import contextvars
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from latency import LatencyWindow
+
+_labels: contextvars.ContextVar = contextvars.ContextVar("usage_labels", default={})
+_call_latencies: contextvars.ContextVar = contextvars.ContextVar("usage_call_latencies", default=None)
+
+# USD per 1M tokens (input, output); override with GEMINI_PRICING
+DEFAULT_PRICING: Dict[str, Tuple[float, float]] = {
+    "gemini-2.5-pro": (1.25, 10.0),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.0),
+}
+
+
+@contextmanager
+def usage_context(**labels: Optional[str]):
+    """Attribute Gemini calls made inside the block to `labels` (merged with outer labels)."""
+    token = push_labels(**labels)
+    try:
+        yield
+    finally:
+        pop_labels(token)
+
+
+def push_labels(**labels: Optional[str]) -> contextvars.Token:
+    """Non-block form of usage_context for request hooks; undo with pop_labels(token)."""
+    return _labels.set(dict(_labels.get(), **{k: v for k, v in labels.items() if v is not None}))
+
+
+def pop_labels(token: contextvars.Token):
+    _labels.reset(token)
+
+
+def current_labels() -> Dict[str, str]:
+    return dict(_labels.get())
+
+
+@contextmanager
+def track_call_latencies():
+    """
+    Collect the model latency (seconds) of each successful Gemini call made inside the block.
+
+    Yields the list being filled; calls made from copied contexts (hedges) append to it too.
+    """
+    latencies: List[float] = []
+    token = _call_latencies.set(latencies)
+    try:
+        yield latencies
+    finally:
+        _call_latencies.reset(token)
+
+
+class _Aggregate:
+    __slots__ = ("calls", "errors", "input_tokens", "output_tokens", "cost_usd", "latency_total")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.latency_total = 0.0
+
+    def add(self, input_tokens: int, output_tokens: int, cost: float, latency: float, ok: bool):
+        self.calls += 1
+        self.errors += 0 if ok else 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cost_usd += cost
+        self.latency_total += latency
+
+    def summary(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "avg_latency_ms": round(self.latency_total / self.calls * 1000, 1) if self.calls else None
+        }
+
+
+class UsageTracker:
+    """In-memory usage aggregates by model, task, endpoint, tenant, prompt version and job."""
+
+    DIMENSIONS = ("model", "task", "endpoint", "tenant", "prompt_version", "job")
+
+    def __init__(self, pricing: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_keys: int = 200):
+        """
+        Args:
+            pricing: Model -> (input, output) USD per 1M tokens; unknown models cost 0
+            max_keys: Distinct values kept per dimension (least recently used dropped)
+        """
+        self.pricing = dict(DEFAULT_PRICING, **(pricing or {}))
+        self.max_keys = max_keys
+        self._total = _Aggregate()
+        self._by: Dict[str, "OrderedDict[str, _Aggregate]"] = {d: OrderedDict() for d in self.DIMENSIONS}
+        self._latency: Dict[str, LatencyWindow] = {}
+        self._lock = threading.Lock()
+
+    def cost(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        # Longest matching prefix, so "gemini-2.5-flash-lite-preview" prices as flash-lite
+        model = model.split("/")[-1]
+        matches = [name for name in self.pricing if model.startswith(name)]
+        if not matches:
+            return 0.0
+        input_price, output_price = self.pricing[max(matches, key=len)]
+        return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def record(self, model: str, task: str, latency: float, input_tokens: int = 0,
+               output_tokens: int = 0, ok: bool = True):
+        """Record one Gemini call under the current context's labels."""
+        labels = dict(current_labels(), model=model, task=task)
+        cost = self.cost(model, input_tokens, output_tokens)
+        with self._lock:
+            self._total.add(input_tokens, output_tokens, cost, latency, ok)
+            for dimension in self.DIMENSIONS:
+                value = labels.get(dimension)
+                if value is None:
+                    continue
+                buckets = self._by[dimension]
+                aggregate = buckets.get(value)
+                if aggregate is None:
+                    aggregate = buckets[value] = _Aggregate()
+                    if len(buckets) > self.max_keys:
+                        buckets.popitem(last=False)
+                else:
+                    buckets.move_to_end(value)
+                aggregate.add(input_tokens, output_tokens, cost, latency, ok)
+            if ok:
+                self._latency.setdefault(model, LatencyWindow()).record(latency)
+        latencies = _call_latencies.get()
+        if ok and latencies is not None:
+            latencies.append(latency)
+
+    def totals(self) -> Dict:
+        with self._lock:
+            return self._total.summary()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            result = {"total": self._total.summary()}
+            for dimension, buckets in self._by.items():
+                result[f"by_{dimension}"] = {value: a.summary() for value, a in buckets.items()}
+            latency = dict(self._latency)
+        for model, window in latency.items():
+            result["by_model"].setdefault(model, {})["latency"] = window.summary()
+        return result
@@ -0,0 +1,217 @@
+"""
+Local embedding index over training examples.
+
+Vectors live in a memory-mapped float32 file next to a JSONL sidecar with the
+example text, so the index survives restarts without re-reading Supabase.
+Top-k cosine search is one matrix-vector product over the mapped array.
+
+Several processes (the web app and train_cli.py) may share one directory.
+Appends are serialized by an exclusive lock on a lock file (POSIX only; on
+other platforms keep to a single writer per directory), and each process picks
+up rows appended by the others from the sidecar before appending or searching.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+
+from similarity import hashed_ngram_vectors
+
+
+def example_query_text(client_sequence: List[str]) -> str:
+    """Text used to embed a conversation turn (the client's messages)."""
+    return "\n".join(client_sequence)
+
+
+class ExampleIndex:
+    """Memory-mapped cosine index of past client sequences and consultant replies."""
+
+    def __init__(self, directory: str, dim: int = 2048, initial_capacity: int = 1024):
+        """
+        Args:
+            directory: Where the vector file and metadata sidecar are stored
+            dim: Embedding dimension (hash buckets)
+            initial_capacity: Rows allocated up front; the file doubles when full
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.dim = dim
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._meta_path = os.path.join(directory, "examples.jsonl")
+        self._lock_path = os.path.join(directory, "index.lock")
+        self._lock = threading.Lock()
+
+        self._meta: List[Dict] = []
+        # Bytes of the sidecar already loaded into _meta
+        self._meta_offset = 0
+
+        with self._lock, self._file_lock():
+            self._read_new_meta()
+            row_bytes = dim * np.dtype(np.float32).itemsize
+            existing_rows = os.path.getsize(self._vectors_path) // row_bytes \
+                if os.path.exists(self._vectors_path) else 0
+            self._capacity = max(initial_capacity, existing_rows, len(self._meta))
+            self._vectors = self._map(self._capacity)
+
+            if existing_rows < len(self._meta):
+                # Vector file is missing or behind its sidecar; embeddings are derived, so rebuild
+                self._write_rows(0, [m["query"] for m in self._meta])
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._meta)
+
+    def _map(self, rows: int) -> np.memmap:
+        size = rows * self.dim * np.dtype(np.float32).itemsize
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock on the index directory, shared with other processes."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_new_meta(self) -> bool:
+        """
+        Load sidecar records appended (by any process) since the last read. Caller holds the lock.
+
+        Returns:
+            Whether the sidecar ends in an incomplete line (still being written, or left by a crash)
+        """
+        try:
+            size = os.path.getsize(self._meta_path)
+        except FileNotFoundError:
+            return False
+        if size <= self._meta_offset:
+            return False
+        with open(self._meta_path, "rb") as f:
+            f.seek(self._meta_offset)
+            data = f.read(size - self._meta_offset)
+        end = data.rfind(b"\n") + 1
+        self._meta.extend(json.loads(line) for line in data[:end].splitlines() if line.strip())
+        self._meta_offset += end
+        return end < len(data)
+
+    def _ensure_capacity(self, rows: int):
+        """Grow (or remap after another process grew) the vector file to hold `rows`. Caller holds the lock."""
+        if rows <= self._capacity:
+            return
+        self._vectors.flush()
+        while rows > self._capacity:
+            self._capacity *= 2
+        self._vectors = self._map(self._capacity)
+
+    def _refresh(self):
+        """Pick up rows other processes appended; their vectors are written before their sidecar lines."""
+        self._read_new_meta()
+        self._ensure_capacity(len(self._meta))
+
+    def _write_rows(self, start: int, texts: List[str]):
+        if texts:
+            self._vectors[start:start + len(texts)] = hashed_ngram_vectors(texts, dim=self.dim)
+            self._vectors.flush()
+
+    def add(self, client_sequence: List[str], consultant_reply: str):
+        """Append one example to the index."""
+        self.add_many([{"client_sequence": client_sequence, "consultant_reply": consultant_reply}])
+
+    def add_many(self, examples: List[Dict]):
+        """Append examples (dicts with client_sequence and consultant_reply) in one write."""
+        if not examples:
+            return
+        with self._lock, self._file_lock():
+            self._append(examples)
+
+    def seed(self, pages: Iterable[List[Dict]]) -> int:
+        """
+        Fill an empty index from `pages` of examples; does nothing if any process already added rows.
+
+        The emptiness check and the writes happen under the directory lock, so processes
+        starting together seed the index only once. `pages` is only consumed when seeding.
+
+        Returns:
+            Number of examples added
+        """
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self._meta:
+                return 0
+            added = 0
+            for page in pages:
+                self._append(page)
+                added += len(page)
+            return added
+
+    def _append(self, examples: List[Dict]):
+        """Write examples after everything any process has appended. Caller holds both locks."""
+        records = [
+            {
+                "query": example_query_text(e["client_sequence"]),
+                "client_sequence": e["client_sequence"],
+                "consultant_reply": e["consultant_reply"]
+            }
+            for e in examples
+        ]
+        if not records:
+            return
+        if self._read_new_meta():
+            # Nobody else is writing under the lock: the partial line is left by a crash
+            os.truncate(self._meta_path, self._meta_offset)
+        start = len(self._meta)
+        self._ensure_capacity(start + len(records))
+        # Vectors first, then sidecar: a crash in between just leaves unused rows
+        self._write_rows(start, [r["query"] for r in records])
+        with open(self._meta_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._read_new_meta()
+
+    def search(self, client_sequence: List[str], k: int = 3,
+               min_similarity: float = 0.0) -> List[Dict]:
+        """
+        Find the k most similar past examples.
+
+        Returns:
+            List of dicts with client_sequence, consultant_reply and similarity, best first
+        """
+        if k <= 0:
+            return []
+        query = hashed_ngram_vectors([example_query_text(client_sequence)], dim=self.dim)[0]
+
+        with self._lock:
+            self._refresh()
+            count = len(self._meta)
+            if count == 0:
+                return []
+            scores = self._vectors[:count] @ query
+            top = np.argpartition(-scores, min(k, count) - 1)[:k] if count > k else np.arange(count)
+            top = top[np.argsort(-scores[top])]
+            return [
+                {
+                    "client_sequence": self._meta[i]["client_sequence"],
+                    "consultant_reply": self._meta[i]["consultant_reply"],
+                    "similarity": round(float(scores[i]), 4)
+                }
+                for i in top if scores[i] >= min_similarity
+            ]
+
+    def stats(self) -> Dict:
+        return {"examples": len(self._meta), "capacity": self._capacity, "dim": self.dim}